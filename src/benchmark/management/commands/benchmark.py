@@ -0,0 +1,75 @@
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+from benchmark import runner
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, universal_newlines=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the timeline, mentions, hashtag, user timeline, replies, and follow stats "
+        "endpoints against generated datasets, in a throwaway test database. "
+        "Fails if any result exceeds its budget."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            dest='scales',
+            action='append',
+            choices=list(runner.SCALES),
+            help="Dataset scale to benchmark at; may be repeated. Default: small",
+        )
+        parser.add_argument('--iterations', type=int, default=20,
+                            help="Requests per endpoint, after one warm-up request")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--budgets', default=runner.DEFAULT_BUDGETS,
+                            help="JSON file of budgets; pass an empty string to skip checking")
+        parser.add_argument('--output', help="Write the results to this JSON file")
+
+    def handle(self, *args, scales, iterations, seed, budgets, output, **options):
+        scales = scales or ['small']
+        budgets = runner.load_budgets(budgets) if budgets else {}
+
+        results = {
+            'started': datetime.now(timezone.utc).isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'iterations': iterations,
+            'seed': seed,
+            'scales': {},
+        }
+        failures = []
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            for scale in scales:
+                scale_results = runner.run(scale, iterations, seed, log=self.stdout.write)
+                results['scales'][scale] = scale_results
+                failures += runner.check_budgets(scale, scale_results, budgets)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        results['failures'] = failures
+        if output:
+            with open(output, 'w') as output_file:
+                json.dump(results, output_file, indent=2, sort_keys=True)
+            self.stdout.write(f"wrote results to {output}")
+        if failures:
+            raise CommandError("over budget:\n  " + "\n  ".join(failures))
+        self.stdout.write("all endpoints are within budget")
@@ -0,0 +1,174 @@
+"""
+Endpoint benchmarks.
+
+`run` fills the current database with `user.mock.bulk_populate` at one of
+the `SCALES`, then requests each of the `endpoints` through the DRF test
+client, as the user for whom that endpoint has the most to show, and
+records latency percentiles and SQL query counts. `check_budgets` compares
+the results against a budgets file; see `budgets.json` next to this module.
+
+The `benchmark` management command wraps this in a throwaway test database.
+"""
+import json
+import math
+import os
+from statistics import mean, median
+from time import perf_counter
+from user import blocks, follows
+from user.mock import bulk_populate
+from user.models import Follow, User
+
+from common import authentication
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from ping.models import Ping, PingHashtag, PingMention
+from search.models import PingTerm
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+DEFAULT_BUDGETS = os.path.join(os.path.dirname(__file__), 'budgets.json')
+
+# arguments to `bulk_populate`
+SCALES = {
+    'tiny': {'users': 50, 'pings': 500},
+    'small': {'users': 1000, 'pings': 20000},
+    'medium': {'users': 10000, 'pings': 200000},
+    'large': {'users': 50000, 'pings': 1000000},
+}
+
+
+def pick_subjects():
+    "Choose the users, hashtag, and ping which make each endpoint do the most work"
+    def top(queryset, field):
+        return (
+            queryset.values(field)
+            .annotate(count=Count('pk'))
+            .order_by('-count', field)
+            .values_list(field, flat=True)
+            .first()
+        )
+
+    follower = User.objects.order_by('-following_count', 'pk').first()
+    author = User.objects.get(pk=top(Ping.objects.all(), 'user'))
+    mentioned = User.objects.get(pk=top(PingMention.objects.all(), 'user'))
+    return {
+        'follower': follower,
+        'author': author,
+        'mentioned': mentioned,
+        'followed': User.objects.order_by('-followed_count', 'pk').first(),
+        'hashtag': top(PingHashtag.objects.all(), 'hashtag'),
+        'term': top(PingTerm.objects.all(), 'term'),
+        'replied_to': top(Ping.objects.filter(replying_to__isnull=False), 'replying_to'),
+    }
+
+
+def endpoints(subjects):
+    "The `(name, path, user to request it as)` triples to benchmark"
+    return [
+        ('timeline', '/timeline/', subjects['follower']),
+        ('mentions', '/mentions/', subjects['mentioned']),
+        ('hashtag', f"/hashtags/{subjects['hashtag']}/", subjects['follower']),
+        ('user_timeline', f"/users/{subjects['author'].username}/timeline/", subjects['follower']),
+        ('replies', f"/pings/{subjects['replied_to']}/replies/", subjects['follower']),
+        ('search', f"/search/?q={subjects['term']}", subjects['follower']),
+        (
+            'follow_stats',
+            f"/users/{subjects['followed'].username}/follow-stats/",
+            subjects['follower'],
+        ),
+    ]
+
+
+def percentile(values, fraction):
+    "The nearest-rank percentile of `values`"
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def measure(client, path, iterations):
+    "Request `path` `iterations` times after one warm-up request, and summarize"
+    client.get(path)
+    timings = []
+    queries = []
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            started = perf_counter()
+            response = client.get(path)
+            timings.append((perf_counter() - started) * 1000)
+        queries.append(len(captured))
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+    return {
+        'path': path,
+        'p50_ms': round(median(timings), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'mean_ms': round(mean(timings), 3),
+        'queries': max(queries),
+    }
+
+
+def run(scale, iterations=20, seed=0, log=print):
+    """
+    Replace the contents of the current database with a dataset at `scale`,
+    and benchmark every endpoint.
+
+    Returns a JSON-serializable dict of the dataset's size and each endpoint's results.
+    """
+    log(f"seeding the {scale} dataset...")
+    bulk_populate(seed=seed, clear_first=True, log=lambda message: None, **SCALES[scale])
+    # the flush reused ids, so anything cached about the old rows is wrong
+    cache.clear()
+    blocks.clear()
+    follows.clear()
+    authentication.clear()
+    subjects = pick_subjects()
+
+    results = {}
+    clients = {}
+    for name, path, user in endpoints(subjects):
+        if user.pk not in clients:
+            clients[user.pk] = APIClient()
+            token, _ = Token.objects.get_or_create(user=user)
+            clients[user.pk].credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        results[name] = measure(clients[user.pk], path, iterations)
+        log(
+            f"{scale:>8} {name:<14} p50 {results[name]['p50_ms']:8.2f}ms  "
+            f"p95 {results[name]['p95_ms']:8.2f}ms  {results[name]['queries']:3} queries"
+        )
+    return {
+        'dataset': {
+            'users': User.objects.count(),
+            'pings': Ping.objects.count(),
+            'follows': Follow.objects.count(),
+        },
+        'endpoints': results,
+    }
+
+
+def load_budgets(path=DEFAULT_BUDGETS):
+    with open(path) as budgets_file:
+        return json.load(budgets_file)
+
+
+def check_budgets(scale, results, budgets):
+    """
+    List the ways in which `results` for `scale` exceed `budgets`.
+
+    `budgets` maps scale names, or `"*"` for every scale, to endpoint names,
+    or `"*"` for every endpoint, to limits on `queries`, `p50_ms`, and
+    `p95_ms`. The most specific limit applies.
+    """
+    failures = []
+    for endpoint, result in results['endpoints'].items():
+        limits = {}
+        for scale_key in ('*', scale):
+            for endpoint_key in ('*', endpoint):
+                limits.update(budgets.get(scale_key, {}).get(endpoint_key, {}))
+        for metric, limit in sorted(limits.items()):
+            if result[metric] > limit:
+                failures.append(
+                    f"{scale} {endpoint}: {metric} is {result[metric]}, over the budget of {limit}"
+                )
+    return failures
@@ -0,0 +1,38 @@
+from benchmark import runner
+from django.test import TestCase
+
+
+class BenchmarkTests(TestCase):
+    def test_tiny_run_is_within_query_budgets(self):
+        results = runner.run('tiny', iterations=2, log=lambda message: None)
+        self.assertEqual(
+            set(results['endpoints']),
+            {
+                'timeline', 'mentions', 'hashtag', 'user_timeline', 'replies', 'search',
+                'follow_stats',
+            },
+        )
+        self.assertEqual(results['dataset']['pings'], runner.SCALES['tiny']['pings'])
+        query_budgets = {
+            scale: {
+                endpoint: {'queries': limits['queries']}
+                for endpoint, limits in endpoints.items() if 'queries' in limits
+            }
+            for scale, endpoints in runner.load_budgets().items()
+        }
+        self.assertEqual(runner.check_budgets('tiny', results, query_budgets), [])
+
+    def test_most_specific_budget_applies(self):
+        results = {'endpoints': {
+            'timeline': {'queries': 3, 'p95_ms': 50},
+            'mentions': {'queries': 3, 'p95_ms': 50},
+        }}
+        budgets = {
+            '*': {'*': {'queries': 2, 'p95_ms': 100}},
+            'small': {'timeline': {'queries': 5}},
+        }
+        self.assertEqual(
+            runner.check_budgets('small', results, budgets),
+            ["small mentions: queries is 3, over the budget of 2"],
+        )
+        self.assertEqual(len(runner.check_budgets('large', results, budgets)), 2)
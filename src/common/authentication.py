@@ -0,0 +1,105 @@
+"""
+Authentication classes for the API.
+"""
+from copy import copy
+from threading import Lock
+
+from common.cache import VersionedCache
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+# entries are versioned by the id of the token's user
+_tokens = VersionedCache('auth:user', settings.TOKEN_CACHE_SIZE, ttl=settings.TOKEN_CACHE_TTL)
+_shared_stats = {'hits': 0, 'misses': 0}
+_shared_stats_lock = Lock()
+
+
+def _shared_cache():
+    "The shared cache backend for tokens, if one is configured"
+    if settings.TOKEN_CACHE_ALIAS is None:
+        return None
+    return caches[settings.TOKEN_CACHE_ALIAS]
+
+
+def _shared_key(key):
+    return f'auth:token:{key}'
+
+
+def invalidate(*keys):
+    "Forget the cached credentials for each token key in `keys`, in every process"
+    shared = _shared_cache()
+    for key in keys:
+        _tokens.delete(key)
+        if shared is not None:
+            shared.delete(_shared_key(key))
+
+
+def invalidate_user(*user_ids):
+    "Discard the cached credentials of every token of each of `user_ids`, in every process"
+    _tokens.invalidate(*user_ids)
+
+
+def stats():
+    "Hit and miss counters of the token caches in this process"
+    return {
+        'local_hits': _tokens.hits,
+        'local_misses': _tokens.misses,
+        'local_size': len(_tokens),
+        'shared_hits': _shared_stats['hits'],
+        'shared_misses': _shared_stats['misses'],
+    }
+
+
+def clear():
+    "Forget everything in this process's token cache"
+    _tokens.clear()
+    with _shared_stats_lock:
+        _shared_stats.update(hits=0, misses=0)
+
+
+class CachingTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication which caches the token to user lookup.
+
+    `TokenAuthentication` joins `Token` to `User` on every authenticated
+    request. This keeps the result in a process-local LRU cache for up to
+    `settings.TOKEN_CACHE_TTL` seconds and, if `settings.TOKEN_CACHE_ALIAS`
+    names one of the `CACHES`, in that shared cache as well. Failed lookups
+    are never cached.
+
+    Cached credentials are invalidated when their token is deleted or
+    replaced, or when their user is saved or deleted; see `user.signals`.
+    The in-process entries are versioned like those of `user.blocks`, with a
+    version per user kept in the default cache, so that i.e. deactivating a
+    user through one process takes effect in every other on their next
+    request, as long as the default cache is shared.
+    """
+
+    def authenticate_credentials(self, key):
+        credentials = _tokens.get(key)
+        if credentials is None:
+            credentials = self._get_shared(key)
+            if credentials is None:
+                credentials = super().authenticate_credentials(key)
+                self._set_shared(key, credentials)
+            _tokens.set(key, credentials, credentials[0].pk)
+        user, token = credentials
+        # each request gets its own copy, so nothing done to it leaks into the cache
+        return (copy(user), token)
+
+    @staticmethod
+    def _get_shared(key):
+        shared = _shared_cache()
+        if shared is None:
+            return None
+        credentials = shared.get(_shared_key(key))
+        with _shared_stats_lock:
+            _shared_stats['misses' if credentials is None else 'hits'] += 1
+        return credentials
+
+    @staticmethod
+    def _set_shared(key, credentials):
+        shared = _shared_cache()
+        if shared is not None:
+            shared.set(_shared_key(key), credentials, settings.TOKEN_CACHE_TTL)
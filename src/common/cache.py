@@ -0,0 +1,134 @@
+"""
+Small in-process caches.
+"""
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from uuid import uuid4
+
+from django.core.cache import cache
+
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded, least-recently-used mapping.
+
+    If `ttl` is set, entries older than that many seconds are treated as missing.
+    Hits and misses are counted in `hits` and `misses`.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        # key -> (stored_at, value)
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            stored_at, value = self._data.get(key, (None, MISSING))
+            if value is not MISSING and self.ttl is not None and monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                value = MISSING
+            if value is MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class VersionedCache:
+    """
+    LRUCache whose entries can be invalidated in every process.
+
+    Each entry is tagged with the version of some id, i.e. of the user it
+    was loaded for, at the time it was loaded. The versions are kept in
+    Django's default cache under `{name}:version:{id}`, and `invalidate`
+    replaces them, so that entries tagged with the old version are treated
+    as missing by every process sharing that cache. The in-process entries
+    also expire after `ttl` seconds, which bounds how long a process can
+    keep using one when the default cache isn't shared.
+    """
+
+    def __init__(self, name, maxsize, ttl=None):
+        self.name = name
+        self._local = LRUCache(maxsize, ttl=ttl)
+
+    def _version_key(self, version_id):
+        return f'{self.name}:version:{version_id}'
+
+    def version(self, version_id):
+        "The current version of `version_id`"
+        key = self._version_key(version_id)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, uuid4().hex, None)
+            version = cache.get(key)
+        return version
+
+    def invalidate(self, *version_ids):
+        "Discard the entries tagged with each of `version_ids`, in every process"
+        for version_id in version_ids:
+            cache.set(self._version_key(version_id), uuid4().hex, None)
+
+    def get(self, key, default=None):
+        "The value cached for `key`, if it's still at the version it was loaded at"
+        cached = self._local.get(key)
+        if cached is not None:
+            version_id, version, value = cached
+            if version == self.version(version_id):
+                return value
+        return default
+
+    def set(self, key, value, version_id, version=None):
+        """
+        Cache `value` for `key`, tagged with `version_id`
+
+        Pass the `version` of `version_id` as read before `value` was loaded,
+        so that an invalidation while it was being loaded isn't missed.
+        """
+        if version is None:
+            version = self.version(version_id)
+        self._local.set(key, (version_id, version, value))
+
+    def delete(self, key):
+        self._local.delete(key)
+
+    def clear(self):
+        self._local.clear()
+
+    @property
+    def hits(self):
+        return self._local.hits
+
+    @property
+    def misses(self):
+        return self._local.misses
+
+    def __len__(self):
+        return len(self._local)
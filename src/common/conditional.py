@@ -0,0 +1,44 @@
+"""
+Conditional GET support for views whose representations have cheap versions.
+
+A view computes an ETag from whatever identifies the version of its
+representation, typically a few columns it can read without running its
+full query, and passes it to `conditional_response` along with a function
+which builds the full response. Clients which send a matching
+`If-None-Match` get a `304 Not Modified` without that function being called.
+
+Only ETags are used, not `Last-Modified`: the timestamps available, such as
+`Ping.edited`, don't change when counts included in the representation do.
+Representations can depend on who's asking, i.e. whether they like a ping,
+so responses vary by `Authorization`.
+"""
+from hashlib import md5
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+
+def make_etag(request, *version):
+    """
+    A strong ETag for the representation identified by `version`
+
+    The negotiated media type is included, because the same URL can render
+    JSON, the browsable API, and so on.
+    """
+    digest = md5(repr((request.accepted_media_type,) + version).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def conditional_response(request, etag, get_response):
+    """
+    `304 Not Modified` if the client's copy matches `etag`, otherwise `get_response()`
+
+    Successful responses are tagged with `etag`, and so are 304s, as RFC 7232
+    requires.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = get_response()
+    if 200 <= response.status_code < 300 or response.status_code == 304:
+        response['ETag'] = etag
+    patch_vary_headers(response, ('Authorization',))
+    return response
@@ -0,0 +1,211 @@
+"""
+Lightweight per-request metrics.
+
+`RequestMetricsMiddleware` starts a `RequestMetrics` for each request. While
+it's active, every query run through one of the request thread's database
+connections is timed, counted, and fingerprinted, so that queries which run
+repeatedly with different parameters, the signature of an N+1 query, stand
+out. Finished requests are aggregated per view into a `Registry`, which
+keeps counts, sums, and a fixed-bucket latency histogram, and can be read
+at `/metrics/` or logged periodically.
+
+Django 1.11 has no `connection.execute_wrapper`, so the connections are
+instrumented by wrapping the cursors they create.
+"""
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter
+from time import perf_counter
+
+from django.db import connections
+
+# upper bounds of the latency histogram buckets, in milliseconds; slower
+# requests are counted in an overflow bucket
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# `IN (%s, %s, ...)` lists of different lengths are the same query
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+_local = threading.local()
+
+
+def fingerprint(sql):
+    "Normalize parametrized `sql` so that queries which differ only in their parameters match"
+    if 'IN (' in sql:
+        sql = IN_LIST.sub('IN (...)', sql)
+    return sql
+
+
+class RequestMetrics:
+    "What a single request spent its time on"
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.duration = None
+        self.db_time = 0.0
+        self.queries = 0
+        self.fingerprints = Counter()
+
+    def record_query(self, sql, duration):
+        self.db_time += duration
+        self.queries += 1
+        self.fingerprints[fingerprint(sql)] += 1
+
+    def finish(self):
+        self.duration = perf_counter() - self.started
+
+    def duplicates(self, threshold=2):
+        "The `(sql, count)` pairs of the queries which ran at least `threshold` times"
+        return [(sql, count) for sql, count in self.fingerprints.most_common()
+                if count >= threshold]
+
+    def server_timing(self):
+        "The value of a `Server-Timing` header describing this request"
+        return (
+            f'total;dur={self.duration * 1000:.1f}, '
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"'
+        )
+
+
+def current():
+    "The metrics of the request being handled by this thread, if any"
+    return getattr(_local, 'metrics', None)
+
+
+def start():
+    for connection in connections.all():
+        instrument(connection)
+    _local.metrics = RequestMetrics()
+    return _local.metrics
+
+
+def stop():
+    metrics = _local.metrics
+    _local.metrics = None
+    metrics.finish()
+    return metrics
+
+
+class TimedCursor:
+    "Cursor wrapper which records its queries in the current RequestMetrics"
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.cursor.__exit__(*exc_info)
+
+    def _timed(self, method, sql, params):
+        metrics = current()
+        if metrics is None:
+            return method(sql, params)
+        started = perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            metrics.record_query(sql, perf_counter() - started)
+
+    def execute(self, sql, params=None):
+        return self._timed(self.cursor.execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._timed(self.cursor.executemany, sql, param_list)
+
+
+def instrument(connection):
+    "Make `connection` wrap each cursor it creates in a TimedCursor"
+    if getattr(connection, '_metrics_instrumented', False):
+        return
+    make_cursor = connection.make_cursor
+    make_debug_cursor = connection.make_debug_cursor
+    connection.make_cursor = lambda cursor: TimedCursor(make_cursor(cursor))
+    connection.make_debug_cursor = lambda cursor: TimedCursor(make_debug_cursor(cursor))
+    connection._metrics_instrumented = True
+
+
+class ViewStats:
+    "Aggregated metrics of all the requests to one view"
+
+    def __init__(self):
+        self.requests = 0
+        self.total_time = 0.0
+        self.db_time = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.requests_with_duplicates = 0
+        self.histogram = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, metrics, has_duplicates):
+        self.requests += 1
+        self.total_time += metrics.duration
+        self.db_time += metrics.db_time
+        self.queries += metrics.queries
+        self.max_queries = max(self.max_queries, metrics.queries)
+        self.requests_with_duplicates += has_duplicates
+        self.histogram[bisect_left(BUCKETS_MS, metrics.duration * 1000)] += 1
+
+    def percentile_ms(self, fraction):
+        """
+        The upper bound of the histogram bucket containing the `fraction` percentile
+
+        None if there were no requests, or if it's in the overflow bucket.
+        """
+        rank = fraction * self.requests
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.histogram):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return None
+
+    def as_dict(self):
+        requests = self.requests or 1
+        return {
+            'requests': self.requests,
+            'mean_ms': round(self.total_time * 1000 / requests, 3),
+            'mean_db_ms': round(self.db_time * 1000 / requests, 3),
+            'mean_queries': round(self.queries / requests, 2),
+            'max_queries': self.max_queries,
+            'requests_with_duplicate_queries': self.requests_with_duplicates,
+            'p50_ms_at_most': self.percentile_ms(0.5),
+            'p95_ms_at_most': self.percentile_ms(0.95),
+            'histogram_ms': dict(zip(
+                [str(bound) for bound in BUCKETS_MS] + ['+Inf'],
+                self.histogram,
+            )),
+        }
+
+
+class Registry:
+    "Process-wide, thread-safe aggregate of request metrics by view name"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def add(self, view_name, metrics, has_duplicates=False):
+        with self._lock:
+            if view_name not in self._views:
+                self._views[view_name] = ViewStats()
+            self._views[view_name].add(metrics, has_duplicates)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in sorted(self._views.items())}
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = Registry()
@@ -0,0 +1,71 @@
+import logging
+import threading
+from time import monotonic
+
+from common import metrics
+from django.conf import settings
+
+logger = logging.getLogger('sonar.metrics')
+
+_last_log = monotonic()
+_log_lock = threading.Lock()
+
+
+class RequestMetricsMiddleware:
+    """
+    Record the time, database time, and queries of each request.
+
+    Each response gets a `Server-Timing` header, so the numbers show up in
+    browser dev tools, and each request is aggregated into
+    `common.metrics.registry` under its view name. Requests which run the
+    same query `settings.METRICS_DUPLICATE_QUERY_THRESHOLD` or more times
+    are logged as likely N+1 queries. A summary of the registry is logged
+    at most every `settings.METRICS_LOG_INTERVAL` seconds.
+
+    This should be the first middleware, so that it includes all the others.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_metrics = metrics.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.stop()
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match is not None else '<unresolved>'
+        duplicates = request_metrics.duplicates(settings.METRICS_DUPLICATE_QUERY_THRESHOLD)
+        if duplicates:
+            sql, count = duplicates[0]
+            logger.warning(
+                "%s ran %d queries, including %d times: %s",
+                view_name, request_metrics.queries, count, sql,
+            )
+        metrics.registry.add(view_name, request_metrics, bool(duplicates))
+
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = request_metrics.server_timing()
+        self.maybe_log_summary()
+        return response
+
+    @staticmethod
+    def maybe_log_summary():
+        global _last_log
+        interval = settings.METRICS_LOG_INTERVAL
+        if interval is None or monotonic() - _last_log < interval:
+            return
+        with _log_lock:
+            if monotonic() - _last_log < interval:
+                return
+            _last_log = monotonic()
+        for view_name, stats in metrics.registry.snapshot().items():
+            logger.info(
+                "%s: %d requests, mean %.1fms (db %.1fms), p95 <= %sms, "
+                "mean %.1f queries, %d with duplicate queries",
+                view_name, stats['requests'], stats['mean_ms'], stats['mean_db_ms'],
+                stats['p95_ms_at_most'], stats['mean_queries'],
+                stats['requests_with_duplicate_queries'],
+            )
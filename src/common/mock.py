@@ -1,8 +1,12 @@
+from contextlib import contextmanager
 from datetime import timedelta
+from itertools import accumulate
 from random import choices, randint
 from user.models import User
 
 from django.conf import settings
+from django.core.management.color import no_style
+from django.db import connection
 from django.utils.timezone import now
 
 # these are the unique words from jabberwocky
@@ -46,7 +50,11 @@ def gen_text(length=settings.PING_LENGTH, hashtags=False, users=False):
             '#' + w if (not w.startswith('@') and randint(0, 9) == 0) else w
             for w in text_words
         ]
-    text = ' '.join(text_words)
+    return truncate(' '.join(text_words), length)
+
+
+def truncate(text, length=settings.PING_LENGTH):
+    "Cut `text` down to at most `length` characters, at a word boundary if possible"
     if len(text) > length:
         last_space = text.rfind(' ', 0, length)
         if last_space == -1:
@@ -85,3 +93,57 @@ def gen_times(base=None,
         if not forwards:
             td = -td
         base += td
+
+
+def zipf_cum_weights(qty, exponent=1.0):
+    """
+    Cumulative weights for `random.choices` which follow Zipf's law.
+
+    The item at index `i` is chosen with a probability proportional to
+    `1 / (i + 1) ** exponent`, so a few items are chosen very often and
+    most items rarely, like the followers of users on a real network.
+    """
+    return list(accumulate(1 / rank ** exponent for rank in range(1, qty + 1)))
+
+
+def next_pk(model):
+    "The smallest primary key greater than any which `model` has used so far"
+    last = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+    return (last or 0) + 1
+
+
+def reset_sequences(*models):
+    """
+    Make the database's primary key sequences continue after the largest existing keys.
+
+    Rows inserted with explicit primary keys don't advance the sequences on
+    every backend, so call this after bulk-creating them.
+    """
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """
+    Let the `auto_now` and `auto_now_add` fields of `models` be set explicitly.
+
+    Within this context, saving or bulk-creating one of `models` keeps
+    whatever timestamps were assigned to it instead of the current time.
+    """
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now = auto_now
+            field.auto_now_add = auto_now_add
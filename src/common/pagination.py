@@ -1,5 +1,102 @@
-from rest_framework.pagination import CursorPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class Pagination128(CursorPagination):
     page_size = 128
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination of `.values()` rows over several descending fields.
+
+    DRF's `CursorPagination` only seeks on the first field of its ordering,
+    and pages through ties on it by offset, which is hopeless for orderings
+    like search rankings, where most rows tie on the first field. This seeks
+    on every field of the `ordering`, which should end with a unique one,
+    and whose values the rows, or objects, must include. Only `next` links
+    are provided.
+    """
+    page_size = 128
+    ordering = ('id',)
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor is not None:
+            queryset = queryset.filter(self.after(self.decode_cursor(cursor, queryset)))
+        rows = list(queryset.order_by(*(f'-{field}' for field in self.ordering))
+                    [:self.page_size + 1])
+        self.page = rows[:self.page_size]
+        self.has_next = len(rows) > self.page_size
+        return self.page
+
+    def after(self, position):
+        "The condition for rows which come after `position` in the ordering"
+        *leading, last = zip(self.ordering, position)
+        condition = Q(**{f'{last[0]}__lt': last[1]})
+        for field, value in reversed(leading):
+            condition = Q(**{f'{field}__lt': value}) | Q(**{field: value}) & condition
+        return condition
+
+    def encode_cursor(self, row):
+        # datetimes in full, unlike DjangoJSONEncoder, which drops their microseconds
+        position = json.dumps(
+            [row[field] if isinstance(row, dict) else getattr(row, field)
+             for field in self.ordering],
+            default=lambda value: value.isoformat(),
+        )
+        return urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, cursor, queryset):
+        "The position in `cursor`, with each value converted for its field of `queryset`"
+        try:
+            position = json.loads(urlsafe_b64decode(cursor.encode()).decode())
+        except (Base64Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            position = [
+                self.ordering_field(queryset, field).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    @staticmethod
+    def ordering_field(queryset, name):
+        "The model field, or the output field of the annotation, `name` of `queryset`"
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.page[-1]),
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
@@ -0,0 +1,80 @@
+import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from ping.models import Ping
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def encode_since(created):
+    "The `since` cursor of the ping created at `created`"
+    return urlsafe_b64encode(created.isoformat().encode()).decode()
+
+
+def decode_since(since):
+    """
+    What a `since` parameter's pings must have been created after
+
+    `since` is either a ping id or a cursor from `encode_since`. Returns None
+    if it's neither, or if it's the id of a ping which doesn't exist (anymore).
+    """
+    if re.fullmatch('[0-9]+', since):
+        return Ping.objects.filter(pk=since).values_list('created', flat=True).first()
+    try:
+        return parse_datetime(urlsafe_b64decode(since.encode()).decode())
+    except (Base64Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+class SincePollingMixin:
+    """
+    Incremental polling for list views of pings ordered by `created`.
+
+    With `?since=<ping id or cursor>`, the view lists only the pings created
+    after the client's newest one, newest first, using the `created` index.
+    When there are none, it responds `204 No Content` without serializing
+    anything. Otherwise the response holds at most one page of `results`,
+    the `since` cursor to poll with next, and whether there is a `gap` of
+    even more new pings which the client should page through instead.
+
+    Every polling response sets `X-Poll-Interval` to the number of seconds
+    the client should wait before polling again.
+    """
+    since_query_param = 'since'
+    invalid_since_message = "since must be the id of an existing ping, or a cursor"
+
+    def list(self, request, *args, **kwargs):
+        since = request.query_params.get(self.since_query_param)
+        if since is None:
+            return super().list(request, *args, **kwargs)
+
+        after = decode_since(since)
+        if after is None:
+            return Response(
+                {'error': self.invalid_since_message},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        headers = {'X-Poll-Interval': str(settings.TIMELINE_POLL_INTERVAL)}
+        page_size = self.paginator.page_size
+        rows = list(
+            self.filter_queryset(self.get_queryset())
+            .filter(created__gt=after)
+            .order_by('-created')
+            [:page_size + 1]
+        )
+        if not rows:
+            return Response(status=status.HTTP_204_NO_CONTENT, headers=headers)
+
+        serializer = self.get_serializer(self.filter_page(rows[:page_size]), many=True)
+        return Response({
+            'results': serializer.data,
+            'since': encode_since(rows[0]['created']),
+            'gap': len(rows) > page_size,
+        }, headers=headers)
+
+    def filter_page(self, rows):
+        "Hook to drop rows from a page of results after it's been cut"
+        return rows
@@ -0,0 +1,119 @@
+"""
+Publish/subscribe backends for pushing notifications to waiting requests.
+
+A backend delivers each message published to a channel to every
+subscription which is currently listening to that channel. Messages are
+not stored: a subscriber only receives what is published while it's
+subscribed, so subscribers should subscribe before checking for anything
+they may have missed. Messages should be small dicts of JSON-serializable
+values, so that a backend can send them between processes.
+
+The backend in use is selected by `settings.PUBSUB_BACKEND`. `LocalPubSub`
+only delivers messages within a single process; deployments running more
+than one process need a backend which shares messages between them, i.e.
+one built on Redis' PUBLISH and SUBSCRIBE.
+"""
+from collections import defaultdict, deque
+from threading import Condition, Lock
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class BaseSubscription:
+    def get(self, timeout):
+        """
+        Wait up to `timeout` seconds for messages
+
+        Returns a list of `(channel, message)` pairs: every message received
+        since the last call, or an empty list if none arrived in time.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        "Stop listening"
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BasePubSub:
+    def publish(self, channel, message):
+        "Deliver `message` to everyone subscribed to `channel`"
+        raise NotImplementedError
+
+    def subscribe(self, channels):
+        "Return a subscription to the `channels`"
+        raise NotImplementedError
+
+
+class LocalSubscription(BaseSubscription):
+    def __init__(self, pubsub, channels):
+        self.pubsub = pubsub
+        self.channels = channels
+        self._messages = deque()
+        self._condition = Condition()
+
+    def deliver(self, channel, message):
+        with self._condition:
+            self._messages.append((channel, message))
+            self._condition.notify()
+
+    def get(self, timeout):
+        with self._condition:
+            self._condition.wait_for(lambda: self._messages, timeout)
+            messages = list(self._messages)
+            self._messages.clear()
+        return messages
+
+    def close(self):
+        self.pubsub.unsubscribe(self)
+
+
+class LocalPubSub(BasePubSub):
+    """
+    Process-local, in-memory pub/sub.
+
+    Publishing to a channel nobody is subscribed to costs a dict lookup.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._subscriptions = defaultdict(set)
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(channel, message)
+
+    def subscribe(self, channels):
+        subscription = LocalSubscription(self, frozenset(channels))
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+
+_backends = {}
+
+
+def get_pubsub():
+    "Return the process-wide instance of the configured pub/sub backend"
+    path = settings.PUBSUB_BACKEND
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
@@ -1,8 +1,12 @@
 from contextlib import contextmanager
 from random import choices
 from string import ascii_letters, digits
+from user import blocks, follows
 
+from common import authentication
+from django.core.cache import cache
 from django.urls import reverse
+from hashtags import completion
 
 ALPHABET = ascii_letters + digits
 
@@ -15,6 +19,15 @@ def auth_key(client, key):
 
 
 class TestToolsMixin:
+    def setUp(self):
+        super().setUp()
+        # ids are reused between tests, so cached data would leak between them
+        cache.clear()
+        blocks.clear()
+        follows.clear()
+        authentication.clear()
+        completion.clear()
+
     def create_user(self, username='test_user', data_only=True):
         "Create a test user and return their data"
         url = reverse('user-list')
@@ -69,3 +82,17 @@ class TestToolsMixin:
                 unfollowee['url'] + 'unfollow/',
                 format='json',
             )
+
+    def block(self, blocker, blockee):
+        with self.client_as(blocker['token']) as auth_client:
+            return auth_client.post(
+                blockee['url'] + 'block/',
+                format='json',
+            )
+
+    def unblock(self, unblocker, unblockee):
+        with self.client_as(unblocker['token']) as auth_client:
+            return auth_client.post(
+                unblockee['url'] + 'unblock/',
+                format='json',
+            )
@@ -0,0 +1,64 @@
+import re
+from user.models import User
+
+from common import metrics
+from common.testing import TestToolsMixin
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+SERVER_TIMING = re.compile(r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="(\d+) queries"$')
+
+
+class RequestMetricsTests(TestToolsMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+        self.user = self.create_user()
+
+    def test_server_timing_counts_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.user['url'])
+        match = SERVER_TIMING.match(response['Server-Timing'])
+        self.assertIsNotNone(match)
+        self.assertEqual(int(match.group(1)), len(queries))
+
+    @override_settings(METRICS_SERVER_TIMING=False)
+    def test_server_timing_can_be_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get(self.user['url']))
+
+    def test_requests_are_aggregated_by_view(self):
+        for _ in range(3):
+            self.client.get(self.user['url'])
+        stats = metrics.registry.snapshot()['user-detail']
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(sum(stats['histogram_ms'].values()), 3)
+        self.assertEqual(stats['requests_with_duplicate_queries'], 0)
+
+    def test_repeated_queries_are_detected(self):
+        request_metrics = metrics.start()
+        try:
+            for username in ('a', 'b', 'c'):
+                list(User.objects.filter(username=username))
+            list(User.objects.filter(username__in=['a', 'b']))
+            list(User.objects.filter(username__in=['a', 'b', 'c']))
+        finally:
+            metrics.stop()
+        self.assertEqual(request_metrics.queries, 5)
+        self.assertEqual(
+            [count for _, count in request_metrics.duplicates()],
+            [3, 2],
+        )
+
+    def test_metrics_view_is_admin_only(self):
+        with self.client_as(self.user['token']) as auth_client:
+            response = auth_client.get('/metrics/')
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+            user = User.objects.get(username=self.user['username'])
+            user.is_staff = True
+            user.save()
+            response = auth_client.get('/metrics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('user-list', response.data)
@@ -0,0 +1,36 @@
+"""
+Small helpers shared by the apps.
+"""
+from itertools import islice
+
+
+def chunks(iterable, size):
+    "Split `iterable` into lists of at most `size` items"
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def sync_rows(rows, column, desired, make, known_empty=False):
+    """
+    Make the values of `column` among `rows` be exactly the `desired` set
+
+    Rows with other values are deleted, and a row is built by `make(value)`
+    for each missing value and bulk created. If `known_empty` is set, `rows`
+    is known to be empty, so it isn't read first.
+
+    Returns the sets of values which were added and removed.
+    """
+    current = set()
+    if not known_empty:
+        current = set(rows.values_list(column, flat=True))
+    removed = current - desired
+    if removed:
+        rows.filter(**{f'{column}__in': removed}).delete()
+    added = desired - current
+    if added:
+        rows.model.objects.bulk_create(make(value) for value in added)
+    return added, removed
@@ -0,0 +1,17 @@
+from common import metrics
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+class MetricsView(APIView):
+    """
+    View providing the request metrics aggregated by this process, by view name.
+
+    Each process of a deployment keeps its own metrics, so this only shows
+    the requests handled by whichever process served it.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(metrics.registry.snapshot())
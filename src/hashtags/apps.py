@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class HashtagsConfig(AppConfig):
+    name = 'hashtags'
+
+    def ready(self):
+        # connect the completion signal handler
+        from hashtags import signals  # noqa: F401
@@ -0,0 +1,163 @@
+"""
+In-memory prefix completion of hashtag names.
+
+Every process keeps the lower-cased names of all the hashtags in a sorted
+list, along with their `Hashtag.use_count`s. The prefixes of up to
+`HashtagCompleter.TOP_DEPTH` characters, which each match a lot of names,
+have a list of their `settings.HASHTAG_COMPLETION_SIZE` most used hashtags
+ready; longer ones are completed by binary searching the sorted names for
+the few they match, and ranking those. Neither touches the database.
+
+The completer is loaded on first use. Once it's older than
+`settings.HASHTAG_COMPLETION_REFRESH` seconds, a new one is loaded from
+the database by a background thread, which picks up the hashtags used by
+other processes, and swapped in when it's ready; the old one keeps serving
+requests until then. In between, `hashtags.signals` records the hashtags
+used by this process as it goes. Uses only move a hashtag up in the lists
+it's already in, or into new ones; a hashtag whose count drops keeps its
+place until the next reload. Uses recorded while a reload is running may
+be missing from the new completer until the one after it.
+"""
+from bisect import bisect_left, insort
+from heapq import nsmallest
+from threading import Lock, Thread
+from time import monotonic
+
+from django.conf import settings
+from django.db import connection
+from ping.models import Hashtag
+
+
+class HashtagCompleter:
+    # prefixes up to this long have their most used hashtags listed in advance
+    TOP_DEPTH = 3
+
+    def __init__(self, size):
+        self.size = size
+        self.counts = {}
+        # (lower-cased name, name) of every hashtag, sorted
+        self.names = []
+        # names of the most used hashtags starting with each short prefix, most used first
+        self.top = {}
+        self._lock = Lock()
+
+    @classmethod
+    def build(cls, size, hashtags):
+        "Build a completer of the `(name, use count)` pairs in `hashtags`, most used first"
+        completer = cls(size)
+        counts, names, top = completer.counts, completer.names, completer.top
+        for name, count in hashtags:
+            counts[name] = count
+            key = name.lower()
+            names.append((key, name))
+            # most used first, so each list fills up in order
+            for prefix in completer._prefixes(key):
+                listed = top.setdefault(prefix, [])
+                if len(listed) < size:
+                    listed.append(name)
+        names.sort()
+        return completer
+
+    @classmethod
+    def load(cls, size):
+        "Build a completer of every hashtag in the database"
+        hashtags = Hashtag.objects.order_by('-use_count', 'name').values_list('name', 'use_count')
+        return cls.build(size, hashtags.iterator())
+
+    def _prefixes(self, key):
+        "The prefixes of `key` which have their most used hashtags listed"
+        return (key[:length] for length in range(min(len(key), self.TOP_DEPTH) + 1))
+
+    def _rank(self, name):
+        return (-self.counts[name], name)
+
+    def record(self, added, removed):
+        "Count a use of each hashtag in `added`, and remove one of each in `removed`"
+        with self._lock:
+            for name in removed:
+                if name in self.counts:
+                    self.counts[name] = max(0, self.counts[name] - 1)
+            for name in added:
+                new = name not in self.counts
+                # counted before it's listed, for the sake of readers
+                self.counts[name] = self.counts.get(name, 0) + 1
+                if new:
+                    insort(self.names, (name.lower(), name))
+            for name in added | removed:
+                if name in self.counts:
+                    self._promote(name)
+
+    def _promote(self, name):
+        "Move `name` to its place in the list of each prefix of it"
+        rank = self._rank(name)
+        for prefix in self._prefixes(name.lower()):
+            listed = self.top.get(prefix, [])
+            top = [other for other in listed if other != name]
+            if name in listed or len(top) < self.size or rank < self._rank(top[-1]):
+                top.append(name)
+                top.sort(key=self._rank)
+            # lists are replaced rather than changed, for the sake of readers
+            self.top[prefix] = top[:self.size]
+
+    def complete(self, prefix, limit):
+        "`(name, use count)` pairs of the `limit` most used hashtags starting with `prefix`"
+        key = prefix.lower()
+        counts = self.counts
+        if len(key) <= self.TOP_DEPTH:
+            return [(name, counts[name]) for name in self.top.get(key, ())[:limit]]
+        names = self.names
+        matches = []
+        for idx in range(bisect_left(names, (key,)), len(names)):
+            name_key, name = names[idx]
+            if not name_key.startswith(key):
+                break
+            matches.append(name)
+        return [(name, counts[name]) for name in nsmallest(limit, matches, key=self._rank)]
+
+
+_completer = None
+_loaded_at = None
+# held while a completer is being loaded, so that only one load runs at a time
+_loading = Lock()
+
+
+def reload():
+    "Load a new completer from the database, and start using it"
+    global _completer, _loaded_at
+    completer = HashtagCompleter.load(settings.HASHTAG_COMPLETION_SIZE)
+    _completer, _loaded_at = completer, monotonic()
+
+
+def _reload_in_background():
+    try:
+        reload()
+    finally:
+        # the connection this thread opened
+        connection.close()
+        _loading.release()
+
+
+def get_completer(load=True):
+    """
+    Return this process' completer
+
+    The first call loads it. Once it's too old, a reload is started in the
+    background, and the old one is returned until the new one is ready.
+    With `load=False`, return None instead of loading it for the first time.
+    """
+    if _completer is None:
+        if not load:
+            return None
+        with _loading:
+            if _completer is None:
+                reload()
+    elif (monotonic() - _loaded_at > settings.HASHTAG_COMPLETION_REFRESH and
+          _loading.acquire(blocking=False)):
+        Thread(target=_reload_in_background, daemon=True).start()
+    return _completer
+
+
+def clear():
+    "Forget the completer, so that the next use reloads it"
+    global _completer
+    _completer = None
@@ -0,0 +1,11 @@
+from django.dispatch import receiver
+from hashtags import completion
+from ping.models import hashtags_used
+
+
+@receiver(hashtags_used)
+def hashtags_counted(sender, added, removed, **kwargs):
+    # a completer which hasn't been loaded yet will read the new counts anyway
+    completer = completion.get_completer(load=False)
+    if completer is not None:
+        completer.record(added, removed)
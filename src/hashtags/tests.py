@@ -0,0 +1,240 @@
+from datetime import timedelta
+from io import StringIO
+from time import sleep
+from unittest import mock
+
+from common.testing import TestToolsMixin
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils.timezone import now
+from hashtags import completion
+from ping.models import Hashtag, HashtagCount
+from rest_framework import status
+from rest_framework.test import APITestCase
+from timeline.views import TimelineViewSet
+
+PAGE_SIZE = TimelineViewSet.pagination_class.page_size
+
+
+class HashtagTests(TestToolsMixin, APITestCase):
+    def hashtag_urls(self, hashtag, as_user=None):
+        if as_user is None:
+            return [ping['url'] for ping in
+                    self.client.get(f'/hashtags/{hashtag}/').data['results']]
+        with self.client_as(as_user['token']) as auth_client:
+            return [ping['url'] for ping in
+                    auth_client.get(f'/hashtags/{hashtag}/').data['results']]
+
+    def test_hashtag_view_lists_tagged_pings_desc(self):
+        user = self.create_user()
+        ping1 = self.create_ping(user['token'], 'first #foo')
+        self.create_ping(user['token'], 'untagged')
+        sleep(0.01)
+        ping2 = self.create_ping(user['token'], 'second #foo #bar')
+
+        self.assertEqual(self.hashtag_urls('foo'), [ping2['url'], ping1['url']])
+        self.assertEqual(self.hashtag_urls('bar'), [ping2['url']])
+
+    def test_unknown_hashtag_is_not_found(self):
+        response = self.client.get('/hashtags/nope/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_edited_hashtags_are_updated(self):
+        user = self.create_user()
+        ping = self.create_ping(user['token'], '#foo')
+        self.create_ping(user['token'], '#bar')
+        with self.client_as(user['token']) as auth_client:
+            auth_client.patch(ping['url'], {'text': '#bar'}, format='json')
+
+        self.assertEqual(self.hashtag_urls('foo'), [])
+        self.assertEqual(len(self.hashtag_urls('bar')), 2)
+
+    def test_hashtag_view_is_paginated(self):
+        user = self.create_user()
+        for _ in range(PAGE_SIZE + 1):
+            self.create_ping(user['token'], '#foo')
+
+        data = self.client.get('/hashtags/foo/').data
+        self.assertEqual(len(data['results']), PAGE_SIZE)
+        self.assertIsNot(data['next'], None)
+        self.assertEqual(len(self.client.get(data['next']).data['results']), 1)
+
+    def test_hashtag_view_respects_blocks(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        self.create_ping(user1['token'], '#foo')
+        self.create_ping(user2['token'], '#foo')
+
+        self.block(user1, user2)
+        self.assertEqual(len(self.hashtag_urls('foo', user1)), 1)
+        self.assertEqual(len(self.hashtag_urls('foo', user2)), 1)
+        self.assertEqual(len(self.hashtag_urls('foo')), 2)
+
+
+class TrendingHashtagTests(TestToolsMixin, APITestCase):
+    def setUp(self):
+        self.user = self.create_user()
+
+    def ping_at(self, when, text):
+        with mock.patch('django.utils.timezone.now') as mock_now:
+            mock_now.return_value = when
+            return self.create_ping(self.user['token'], text)
+
+    def trending(self, window=None):
+        url = '/hashtags/'
+        if window is not None:
+            url += f'?window={window}'
+        return [(tag['name'], tag['count']) for tag in self.client.get(url).data['results']]
+
+    def test_trending_orders_by_count(self):
+        for text in ('#foo #bar', '#foo', '#baz #foo', '#bar'):
+            self.create_ping(self.user['token'], text)
+
+        self.assertEqual(self.trending(), [('foo', 3), ('bar', 2), ('baz', 1)])
+
+    def test_trending_respects_windows(self):
+        current_time = now()
+        self.ping_at(current_time - timedelta(days=3), '#old')
+        self.ping_at(current_time - timedelta(hours=5), '#recent')
+        self.ping_at(current_time, '#now')
+
+        self.assertEqual(self.trending('1h'), [('now', 1)])
+        self.assertEqual(self.trending('24h'), [('now', 1), ('recent', 1)])
+        self.assertEqual(self.trending('7d'), [('now', 1), ('old', 1), ('recent', 1)])
+
+    def test_trending_rejects_unknown_window(self):
+        response = self.client.get('/hashtags/?window=1y')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_editing_out_a_hashtag_decrements_it(self):
+        ping = self.create_ping(self.user['token'], '#foo #bar')
+        self.create_ping(self.user['token'], '#foo')
+        with self.client_as(self.user['token']) as auth_client:
+            auth_client.patch(ping['url'], {'text': '#bar'}, format='json')
+
+        self.assertEqual(self.trending(), [('bar', 1), ('foo', 1)])
+
+    def test_editing_out_a_hashtag_leaves_the_rest_of_its_day(self):
+        midnight = now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+        self.ping_at(midnight + timedelta(minutes=15), '#foo')
+        ping = self.ping_at(midnight + timedelta(hours=14, minutes=30), '#foo')
+        with self.client_as(self.user['token']) as auth_client:
+            auth_client.patch(ping['url'], {'text': 'no tags'}, format='json')
+        self.assertEqual(self.trending('7d'), [('foo', 1)])
+
+        # once rolled up, the edit comes off the day's bucket instead
+        ping = self.ping_at(midnight - timedelta(days=2, hours=-14), '#foo #bar')
+        call_command('rollup_hashtag_counts', stdout=StringIO())
+        with self.client_as(self.user['token']) as auth_client:
+            auth_client.patch(ping['url'], {'text': '#bar'}, format='json')
+        self.assertEqual(self.trending('7d'), [('bar', 1), ('foo', 1)])
+
+    def test_trending_links_to_hashtag(self):
+        self.create_ping(self.user['token'], 'ends a sentence #foo.')
+        tag = self.client.get('/hashtags/').data['results'][0]
+        self.assertEqual(tag['name'], 'foo.')
+        self.assertEqual(len(self.client.get(tag['url']).data['results']), 1)
+
+    def test_hashtags_end_at_a_slash(self):
+        self.create_ping(self.user['token'], '#foo/bar #/baz')
+        # one from before hashtags stopped at a slash
+        Hashtag.objects.create(name='old/tag')
+        HashtagCount.objects.record({'old/tag'}, set(), now())
+        tags = {tag['name']: tag['url'] for tag in self.client.get('/hashtags/').data['results']}
+        self.assertEqual(set(tags), {'foo', 'old/tag'})
+        self.assertEqual(len(self.client.get(tags['foo']).data['results']), 1)
+        self.assertIsNone(tags['old/tag'])
+
+    def test_rollup_preserves_counts(self):
+        current_time = now()
+        for hours in (50, 51, 52, 24 * 10):
+            self.ping_at(current_time - timedelta(hours=hours), '#foo')
+        before = self.trending('7d')
+
+        call_command('rollup_hashtag_counts', stdout=StringIO())
+        self.assertEqual(self.trending('7d'), before)
+        # the ten day old bucket was expired, and the others were merged by day
+        self.assertLessEqual(HashtagCount.objects.count(), 2)
+
+
+class HashtagCompletionTests(TestToolsMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+
+    def complete(self, prefix, **params):
+        response = self.client.get('/hashtags/complete/', {'prefix': prefix, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(tag['name'], tag['count']) for tag in response.data['results']]
+
+    def test_completion_orders_by_use(self):
+        for text in ('#django #DjangoCon', '#django #dogs', '#djangocon', '#python'):
+            self.create_ping(self.user['token'], text)
+
+        self.assertEqual(
+            self.complete('dj'),
+            [('django', 2), ('DjangoCon', 1), ('djangocon', 1)],
+        )
+        self.assertEqual(self.complete('#D', limit=2), [('django', 2), ('DjangoCon', 1)])
+        self.assertEqual(self.complete('djangoc'), [('DjangoCon', 1), ('djangocon', 1)])
+        self.assertEqual(self.complete('rust'), [])
+
+    def test_new_uses_are_completed_without_reloading(self):
+        self.create_ping(self.user['token'], '#swift')
+        self.assertEqual(self.complete('s'), [('swift', 1)])
+
+        for text in ('#scala', '#scala #sql'):
+            self.create_ping(self.user['token'], text)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.complete('s'), [('scala', 2), ('sql', 1), ('swift', 1)])
+            self.assertEqual(self.complete('scal'), [('scala', 2)])
+
+    def test_completion_links_to_hashtags(self):
+        self.create_ping(self.user['token'], '#cpp/c')
+        # one from before hashtags stopped at a slash
+        Hashtag.objects.create(name='c/old', use_count=3)
+        response = self.client.get('/hashtags/complete/', {'prefix': 'c'})
+        tags = {tag['name']: tag['url'] for tag in response.data['results']}
+        self.assertEqual(set(tags), {'cpp', 'c/old'})
+        self.assertEqual(len(self.client.get(tags['cpp']).data['results']), 1)
+        self.assertIsNone(tags['c/old'])
+
+    def test_completer_keeps_the_most_used_per_prefix(self):
+        completer = completion.HashtagCompleter(size=2)
+        completer.record({'ab', 'ac'}, set())
+        completer.record({'ad'}, set())
+        completer.record({'ad'}, set())
+        self.assertEqual(completer.complete('a', 5), [('ad', 2), ('ab', 1)])
+        self.assertEqual(completer.complete('ac', 5), [('ac', 1)])
+        completer.record({'ac'}, {'ab'})
+        # ties are broken by name
+        self.assertEqual(completer.complete('A', 5), [('ac', 2), ('ad', 2)])
+
+    @override_settings(HASHTAG_COMPLETION_REFRESH=0)
+    def test_completer_is_reloaded_in_the_background_when_old(self):
+        self.create_ping(self.user['token'], '#go')
+        self.assertEqual(self.complete('g'), [('go', 1)])
+        Hashtag.objects.update(use_count=5)
+        with mock.patch.object(completion, 'Thread') as thread:
+            # the old completer is used until the new one is loaded, once
+            self.assertEqual(self.complete('g'), [('go', 1)])
+            self.assertEqual(self.complete('g'), [('go', 1)])
+            thread.assert_called_once()
+            with mock.patch.object(completion, 'connection'):
+                thread.call_args[1]['target']()
+        with override_settings(HASHTAG_COMPLETION_REFRESH=300):
+            self.assertEqual(self.complete('g'), [('go', 5)])
+
+    def test_reconcile_hashtag_counts(self):
+        ping = self.create_ping(self.user['token'], '#foo #bar')
+        self.create_ping(self.user['token'], '#foo')
+        with self.client_as(self.user['token']) as auth_client:
+            auth_client.patch(ping['url'], {'text': '#bar'}, format='json')
+            auth_client.delete(ping['url'])
+        out = StringIO()
+        call_command('reconcile_hashtag_counts', stdout=out)
+        self.assertEqual(out.getvalue().strip(), "fixed the use counts of 1 hashtags")
+        self.assertEqual(
+            dict(Hashtag.objects.values_list('name', 'use_count')),
+            {'foo': 1, 'bar': 0},
+        )
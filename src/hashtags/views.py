@@ -1,22 +1,127 @@
+from datetime import timedelta
+
 from common.pagination import Pagination128
-from ping.models import Hashtag, Ping
-from ping.views import PingSerializer
-from rest_framework import viewsets
+from django.conf import settings
+from hashtags import completion
+from ping.models import Hashtag, HashtagCount, Ping, PingHashtag
+from ping.views import FlatPingSerializer
+from rest_framework import status, viewsets
+from rest_framework.decorators import list_route
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+
+TRENDING_WINDOWS = {
+    '1h': timedelta(hours=1),
+    '24h': timedelta(days=1),
+    '7d': timedelta(days=7),
+}
+DEFAULT_TRENDING_WINDOW = '24h'
+DEFAULT_TRENDING_LIMIT = 20
+MAX_TRENDING_LIMIT = 100
+
+
+def hashtag_url(name, request):
+    """
+    The URL of the named hashtag, or None if its name can't be in a URL
+
+    Hashtags stop at a `/` since `ping.models.parse_content` started
+    ending them there, but ones used before then may still contain it.
+    """
+    if '/' in name:
+        return None
+    return reverse('hashtag-detail', kwargs={'pk': name}, request=request)
 
 
 class HashtagViewSet(viewsets.GenericViewSet):
-    serializer_class = PingSerializer
+    serializer_class = FlatPingSerializer
     pagination_class = Pagination128
     queryset = Hashtag.objects.all()
+    # hashtags are whatever follows a `#`, so they may contain dots
+    lookup_value_regex = '[^/]+'
+
+    def list(self, request, *args, **kwargs):
+        """
+        View listing the currently trending hashtags.
+
+        Query parameters:
+        - `window`: one of `1h`, `24h` (default), or `7d`
+        - `limit`: how many hashtags to list; default 20, at most 100
+        """
+        window = request.query_params.get('window', DEFAULT_TRENDING_WINDOW)
+        if window not in TRENDING_WINDOWS:
+            return Response(
+                {'error': f"window must be one of: {', '.join(TRENDING_WINDOWS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            limit = int(request.query_params.get('limit', DEFAULT_TRENDING_LIMIT))
+        except ValueError:
+            limit = DEFAULT_TRENDING_LIMIT
+        limit = max(1, min(limit, MAX_TRENDING_LIMIT))
+
+        trending = HashtagCount.objects.trending(TRENDING_WINDOWS[window], limit)
+        return Response({
+            'window': window,
+            'results': [
+                {
+                    'url': hashtag_url(row['hashtag'], request),
+                    'name': row['hashtag'],
+                    'count': row['total'],
+                }
+                for row in trending
+            ],
+        })
+
+    @list_route()
+    def complete(self, request):
+        """
+        View suggesting the most used hashtags starting with `?prefix=`.
+
+        The prefix is matched ignoring case, and may start with the `#`.
+        Suggestions come from an in-memory index in `hashtags.completion`,
+        so this doesn't query the database.
+
+        Query parameters:
+        - `prefix`: the start of the hashtag's name
+        - `limit`: how many hashtags to suggest; by default, and at most, 10
+        """
+        prefix = request.query_params.get('prefix', '')
+        if prefix.startswith('#'):
+            prefix = prefix[1:]
+        try:
+            limit = int(request.query_params.get('limit', settings.HASHTAG_COMPLETION_SIZE))
+        except ValueError:
+            limit = settings.HASHTAG_COMPLETION_SIZE
+        limit = max(1, min(limit, settings.HASHTAG_COMPLETION_SIZE))
+
+        return Response({
+            'prefix': prefix,
+            'results': [
+                {
+                    'url': hashtag_url(name, request),
+                    'name': name,
+                    'count': count,
+                }
+                for name, count in completion.get_completer().complete(prefix, limit)
+            ],
+        })
 
     def retrieve(self, request, *args, **kwargs):
+        """
+        View providing a paginated list of the most recent pings with this hashtag.
+
+        This pages through the hashtag's links to pings rather than the pings
+        themselves: each link carries its ping's creation time, so every page
+        is a range scan over the `(hashtag, created)` index.
+        """
         hashtag = self.get_object()
-        return Response(self.get_serializer(
-            Ping.filter_unblocked(
-                hashtag.in_pings.select_related('user'),
-                self.request
-            ),
-            many=True,
-            context={'request': request},
-        ).data)
+        links = Ping.filter_unblocked(
+            PingHashtag.objects.filter(hashtag=hashtag),
+            self.request,
+            user_field='ping__user',
+        )
+        page = self.paginate_queryset(
+            FlatPingSerializer.values(links, prefix='ping__', viewer=request.user)
+        )
+        serializer = self.get_serializer(page, many=True, prefix='ping__')
+        return self.get_paginated_response(serializer.data)
@@ -0,0 +1,94 @@
+from time import sleep
+
+from common.testing import TestToolsMixin
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+from timeline.views import TimelineViewSet
+
+PAGE_SIZE = TimelineViewSet.pagination_class.page_size
+
+
+class MentionsTests(TestToolsMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user('author')
+        self.mentioned = self.create_user('mentioned')
+
+    def mentions(self, as_user=None):
+        with self.client_as((as_user or self.mentioned)['token']) as auth_client:
+            return auth_client.get('/mentions/').data
+
+    def mention_urls(self, as_user=None):
+        return [ping['url'] for ping in self.mentions(as_user)['results']]
+
+    def test_mentions_view_lists_mentioning_pings_desc(self):
+        ping1 = self.create_ping(self.author['token'], 'hi @mentioned')
+        self.create_ping(self.author['token'], 'no mention here')
+        sleep(0.01)
+        ping2 = self.create_ping(self.author['token'], 'hi again @Mentioned')
+
+        self.assertEqual(self.mention_urls(), [ping2['url'], ping1['url']])
+        self.assertEqual(self.mention_urls(self.author), [])
+
+    def test_edited_mentions_are_updated(self):
+        ping = self.create_ping(self.author['token'], 'hi @mentioned')
+        with self.client_as(self.author['token']) as auth_client:
+            auth_client.patch(ping['url'], {'text': 'hi @author'}, format='json')
+
+        self.assertEqual(self.mention_urls(), [])
+        self.assertEqual(self.mention_urls(self.author), [ping['url']])
+
+    def test_mentions_view_is_paginated(self):
+        for _ in range(PAGE_SIZE + 1):
+            self.create_ping(self.author['token'], '@mentioned')
+
+        data = self.mentions()
+        self.assertEqual(len(data['results']), PAGE_SIZE)
+        self.assertIsNot(data['next'], None)
+        with self.client_as(self.mentioned['token']) as auth_client:
+            self.assertEqual(len(auth_client.get(data['next']).data['results']), 1)
+
+    def test_mentions_view_respects_blocks(self):
+        ping = self.create_ping(self.author['token'], 'hi @mentioned')
+        self.block(self.mentioned, self.author)
+        self.assertEqual(self.mention_urls(), [])
+        self.unblock(self.mentioned, self.author)
+        self.assertEqual(self.mention_urls(), [ping['url']])
+
+    def test_replies_are_linked(self):
+        ping = self.create_ping(self.mentioned['token'], 'hello')
+        reply = self.create_reply(self.author['token'], ping, 'hi @mentioned')
+
+        results = self.mentions()['results']
+        self.assertEqual(results[0]['url'], reply['url'])
+        self.assertEqual(results[0]['replying_to'], ping['url'])
+
+    def test_mentions_page_is_a_single_query(self):
+        for _ in range(10):
+            self.create_ping(self.author['token'], 'hi @mentioned')
+        self.mentions()
+        with CaptureQueriesContext(connection) as queries:
+            self.mentions()
+        # authentication and the block lookups are cached
+        self.assertEqual(len(queries), 1)
+        self.assertIn('ping_ping_mentions', queries[0]['sql'])
+
+    def test_polling_since_a_mention(self):
+        ping = self.create_ping(self.author['token'], 'hi @mentioned')
+        since = ping['url'].rstrip('/').rsplit('/', 1)[-1]
+        self.mentions()
+        with self.client_as(self.mentioned['token']) as auth_client:
+            with CaptureQueriesContext(connection) as queries:
+                response = auth_client.get('/mentions/', {'since': since})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        # the ping's creation time, and then the mentions since
+        self.assertEqual(len(queries), 2)
+
+        sleep(0.01)
+        self.create_ping(self.author['token'], 'no mention here')
+        new = self.create_ping(self.author['token'], 'hi again @mentioned')
+        with self.client_as(self.mentioned['token']) as auth_client:
+            response = auth_client.get('/mentions/', {'since': since})
+        self.assertEqual([ping['url'] for ping in response.data['results']], [new['url']])
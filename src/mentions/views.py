@@ -1,17 +1,32 @@
 from common.pagination import Pagination128
-from ping.models import Ping
-from ping.views import PingSerializer
+from common.polling import SincePollingMixin
+from ping.models import Ping, PingMention
+from ping.views import FlatPingSerializer
 from rest_framework import mixins, viewsets
 from rest_framework.permissions import IsAuthenticated
 
 
-class MentionsViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
-    serializer_class = PingSerializer
+class MentionsViewSet(SincePollingMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    View providing a paginated list of the pings which mention the logged-in user.
+
+    This pages through the user's mention links rather than the pings
+    themselves: each link carries its ping's creation time, so every page
+    is a range scan over the `(user, created)` index.
+
+    Clients can poll for new mentions with `?since=`; see SincePollingMixin.
+    """
+    serializer_class = FlatPingSerializer
     pagination_class = Pagination128
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
-        return Ping.filter_unblocked(
-            self.request.user.mentioned_by.select_related('user'),
-            self.request
+        links = Ping.filter_unblocked(
+            PingMention.objects.filter(user=self.request.user),
+            self.request,
+            user_field='ping__user',
         )
+        return FlatPingSerializer.values(links, prefix='ping__', viewer=self.request.user)
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, prefix='ping__', **kwargs)
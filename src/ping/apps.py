@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class PingConfig(AppConfig):
     name = 'ping'
+
+    def ready(self):
+        # connect the reply count and thread signal handlers
+        from ping import signals  # noqa: F401
@@ -0,0 +1,53 @@
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from ping.models import Ping
+from ping.views import FlatPingSerializer, PingSerializer
+from rest_framework import serializers
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+
+class ReversingPingSerializer(PingSerializer):
+    "PingSerializer with DRF's stock hyperlink fields, which reverse every URL"
+    serializer_url_field = serializers.HyperlinkedIdentityField
+    serializer_related_field = serializers.HyperlinkedRelatedField
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the time it takes to serialize a page of pings with DRF's stock "
+        "hyperlink fields, with the precompiled ones PingSerializer uses, and with "
+        "the flat serializer the list views use."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=128)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, page_size, repeat, **options):
+        queryset = Ping.objects.order_by('-created')[:page_size]
+        pings = list(queryset.select_related('user', 'replying_to'))
+        rows = list(FlatPingSerializer.values(queryset))
+        if not pings:
+            raise CommandError("there are no pings to serialize; create some first")
+
+        request = Request(APIRequestFactory().get('/timeline/', HTTP_HOST='localhost'))
+        context = {'request': request}
+
+        def serialize(serializer_class):
+            instances = rows if serializer_class is FlatPingSerializer else pings
+            return serializer_class(instances, many=True, context=context).data
+
+        expected = serialize(ReversingPingSerializer)
+        if not expected == serialize(PingSerializer) == serialize(FlatPingSerializer):
+            raise CommandError("the serializers disagree")
+
+        self.stdout.write(f"serializing {len(pings)} pings, best of {repeat}:")
+        for name, serializer_class in (
+            ('reverse()', ReversingPingSerializer),
+            ('precompiled', PingSerializer),
+            ('flat', FlatPingSerializer),
+        ):
+            best = min(timeit.repeat(lambda: serialize(serializer_class), number=1, repeat=repeat))
+            self.stdout.write(f"  {name:>12}: {best * 1000:.2f} ms per page")
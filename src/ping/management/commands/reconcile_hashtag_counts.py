@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from ping.models import Hashtag
+
+
+class Command(BaseCommand):
+    help = "Recount every hashtag's denormalized use count from the PingHashtag table."
+
+    def handle(self, *args, **options):
+        fixed = Hashtag.objects.reconcile_counts()
+        self.stdout.write(f"fixed the use counts of {fixed} hashtags")
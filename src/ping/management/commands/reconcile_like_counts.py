@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from ping.models import Like
+
+
+class Command(BaseCommand):
+    help = "Recount every ping's denormalized like count from the Like table."
+
+    def handle(self, *args, **options):
+        fixed = Like.objects.reconcile_counts()
+        self.stdout.write(f"fixed the like counts of {fixed} pings")
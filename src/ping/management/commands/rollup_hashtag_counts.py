@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from ping.models import HashtagCount
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll up hourly hashtag counts into daily counts and delete expired counts. "
+        "Run this at least daily, i.e. from cron."
+    )
+
+    def handle(self, *args, **options):
+        rolled_up, deleted = HashtagCount.objects.roll_up()
+        self.stdout.write(f"rolled up {rolled_up} buckets, deleted {deleted} expired buckets")
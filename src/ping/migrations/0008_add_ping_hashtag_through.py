@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-17 01:48
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def copy_ping_created(apps, schema_editor):
+    Ping = apps.get_model('ping', 'Ping')
+    PingHashtag = apps.get_model('ping', 'PingHashtag')
+    PingHashtag.objects.update(
+        created=Subquery(Ping.objects.filter(pk=OuterRef('ping')).values('created')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ping', '0007_add_hashtags'),
+    ]
+
+    operations = [
+        # `ping_ping_hashtags` already exists as the auto-created through table
+        # of `Ping.hashtags`; adopt it as an explicit model without touching it.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='PingHashtag',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('hashtag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ping_links', to='ping.Hashtag')),
+                        ('ping', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hashtag_links', to='ping.Ping')),
+                    ],
+                    options={
+                        'db_table': 'ping_ping_hashtags',
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='ping',
+                    name='hashtags',
+                    field=models.ManyToManyField(blank=True, related_name='in_pings', through='ping.PingHashtag', to='ping.Hashtag'),
+                ),
+                migrations.AlterUniqueTogether(
+                    name='pinghashtag',
+                    unique_together=set([('ping', 'hashtag')]),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='pinghashtag',
+            name='created',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(copy_ping_created, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='pinghashtag',
+            name='created',
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterIndexTogether(
+            name='pinghashtag',
+            index_together=set([('hashtag', 'created')]),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-17 01:49
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ping', '0008_add_ping_hashtag_through'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HashtagCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(db_index=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('hashtag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counts', to='ping.Hashtag')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='hashtagcount',
+            unique_together=set([('hashtag', 'bucket')]),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-17 01:59
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def copy_ping_created(apps, schema_editor):
+    Ping = apps.get_model('ping', 'Ping')
+    PingMention = apps.get_model('ping', 'PingMention')
+    PingMention.objects.update(
+        created=Subquery(Ping.objects.filter(pk=OuterRef('ping')).values('created')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ping', '0009_add_hashtag_counts'),
+    ]
+
+    operations = [
+        # `ping_ping_mentions` already exists as the auto-created through table
+        # of `Ping.mentions`; adopt it as an explicit model without touching it.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='PingMention',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('ping', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mention_links', to='ping.Ping')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mention_links', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'ping_ping_mentions',
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='ping',
+                    name='mentions',
+                    field=models.ManyToManyField(blank=True, related_name='mentioned_by', through='ping.PingMention', to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterUniqueTogether(
+                    name='pingmention',
+                    unique_together=set([('ping', 'user')]),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='pingmention',
+            name='created',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(copy_ping_created, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='pingmention',
+            name='created',
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterIndexTogether(
+            name='pingmention',
+            index_together=set([('user', 'created')]),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-17 02:13
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+import django.db.models.deletion
+
+
+def count_replies(apps, schema_editor):
+    Ping = apps.get_model('ping', 'Ping')
+    replies = (
+        Ping.objects.filter(replying_to=OuterRef('pk'))
+        .order_by()
+        .values('replying_to')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    Ping.objects.filter(pk__in=Ping.objects.values('replying_to')).update(
+        reply_count=Subquery(replies[:1])
+    )
+
+
+def find_thread_roots(apps, schema_editor):
+    # walk down every thread from its root in a single recursive update
+    qn = schema_editor.connection.ops.quote_name
+    table = qn(apps.get_model('ping', 'Ping')._meta.db_table)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"""
+            WITH RECURSIVE threads (id, root_id) AS (
+                SELECT id, id FROM {table} WHERE replying_to_id IS NULL
+                UNION ALL
+                SELECT p.id, t.root_id FROM {table} p JOIN threads t ON p.replying_to_id = t.id
+            )
+            UPDATE {table} SET thread_root_id = (
+                SELECT root_id FROM threads WHERE threads.id = {table}.id
+            )
+            WHERE replying_to_id IS NOT NULL
+        """)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ping', '0010_add_ping_mention_through'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ping',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ping',
+            name='thread_root',
+            field=models.ForeignKey(default=None, editable=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='ping.Ping'),
+        ),
+        migrations.RunPython(count_replies, migrations.RunPython.noop),
+        migrations.RunPython(find_thread_roots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-17 02:25
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ping', '0012_add_likes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ping',
+            name='echo_of',
+            field=models.ForeignKey(default=None, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='echoes', to='ping.Ping'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ping',
+            unique_together=set([('user', 'echo_of')]),
+        ),
+    ]
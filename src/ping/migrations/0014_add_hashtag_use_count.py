@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-17 02:35
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def count_uses(apps, schema_editor):
+    Hashtag = apps.get_model('ping', 'Hashtag')
+    PingHashtag = apps.get_model('ping', 'PingHashtag')
+    uses = (
+        PingHashtag.objects.filter(hashtag=OuterRef('pk'))
+        .order_by()
+        .values('hashtag')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    Hashtag.objects.filter(pk__in=PingHashtag.objects.values('hashtag')).update(
+        use_count=Subquery(uses[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ping', '0013_add_echoes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hashtag',
+            name='use_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_uses, migrations.RunPython.noop),
+    ]
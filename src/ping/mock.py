@@ -1,11 +1,21 @@
 """
 Utilities for mocking Pings
 """
+from collections import Counter, deque
 from itertools import islice
 from unittest import mock
 
-from common.mock import gen_text, gen_times
-from ping.models import Ping
+from common.mock import (
+    WORDLIST, explicit_timestamps, gen_text, gen_times, next_pk, truncate, zipf_cum_weights,
+)
+from common.utils import chunks
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now
+from ping.models import (
+    Hashtag, HashtagCount, Ping, PingHashtag, PingMention, day_bucket, hour_bucket, parse_content,
+)
 
 
 def create_ping_at(user, text, when):
@@ -19,3 +29,148 @@ def gen_pings_for(user, qty, starting_at=None):
     "Generate qty random pings for user"
     for timestamp in islice(gen_times(base=starting_at), qty):
         create_ping_at(user, gen_text(hashtags=True, users=True), timestamp)
+
+
+def bulk_create_pings(rng, users, qty, start, end, hashtags,
+                      chunk_size=10000, mention_rate=0.2, reply_rate=0.2, log=print):
+    """
+    Bulk-create `qty` random pings, with their mentions, hashtags, and hashtag counts
+
+    - `rng` is the `random.Random` instance to draw everything from
+    - `users` is a list of `(id, username)` pairs. Both the authors and the
+        mentioned users are drawn from it with Zipf distributions, so a few
+        users write, and are mentioned in, most pings
+    - `hashtags` is a list of hashtag names, also drawn with a Zipf distribution
+    - the pings are spread evenly between the datetimes `start` and `end`,
+        and are created in chronological order, `chunk_size` at a time
+    - `mention_rate` and `reply_rate` are the fractions of pings which mention
+        someone and which reply to a recent ping
+
+    Unlike `gen_pings_for`, this doesn't save pings one at a time, so signals
+    aren't sent; in particular, materialized timelines aren't updated.
+    """
+    for names in chunks(hashtags, 500):
+        Hashtag.objects.ensure_exist(names)
+    hashtag_weights = zipf_cum_weights(len(hashtags))
+
+    authors = [user_id for user_id, _ in users]
+    author_weights = zipf_cum_weights(len(authors))
+    mentionable = [username for _, username in users]
+    rng.shuffle(mentionable)
+    mention_weights = zipf_cum_weights(len(mentionable))
+    user_ids = {username.lower(): user_id for user_id, username in users}
+
+    # the hourly counts which `HashtagCount.objects.roll_up` won't just delete
+    counted_since = day_bucket(now()) - HashtagCount.DAILY_RETENTION
+    counts = Counter()
+    uses = Counter()
+    recent = deque(maxlen=1000)
+    # thread roots of the recent pings
+    roots = {}
+    replied_to = Counter()
+    first_id = next_id = next_pk(Ping)
+    span = (end - start) / max(1, -(-qty // chunk_size))
+
+    for chunk_idx, chunk_qty in enumerate(
+        min(chunk_size, qty - offset) for offset in range(0, qty, chunk_size)
+    ):
+        chunk_start = start + chunk_idx * span
+        times = sorted(chunk_start + rng.random() * span for _ in range(chunk_qty))
+        pings, mentions, links = [], [], []
+        for created in times:
+            words = rng.choices(WORDLIST, k=rng.randint(1, settings.PING_LENGTH // 6))
+            for idx in range(len(words)):
+                if rng.random() < 0.1:
+                    words[idx] = '#' + rng.choices(hashtags, cum_weights=hashtag_weights)[0]
+            if rng.random() < mention_rate:
+                mentioned = rng.choices(mentionable, cum_weights=mention_weights)[0]
+                words.insert(rng.randint(0, len(words)), '@' + mentioned)
+            text = truncate(' '.join(words))
+
+            replying_to = rng.choice(recent) if recent and rng.random() < reply_rate else None
+            thread_root = None
+            if replying_to is not None:
+                thread_root = roots[replying_to] or replying_to
+                replied_to[replying_to] += 1
+            ping = Ping(
+                id=next_id,
+                user_id=rng.choices(authors, cum_weights=author_weights)[0],
+                created=created,
+                edited=created,
+                text=text,
+                replying_to_id=replying_to,
+                thread_root_id=thread_root,
+            )
+            pings.append(ping)
+            if len(recent) == recent.maxlen:
+                del roots[recent[0]]
+            recent.append(next_id)
+            roots[next_id] = thread_root
+            next_id += 1
+
+            usernames, hashtag_names = parse_content(text)
+            for username in usernames:
+                if username in user_ids:
+                    mentions.append(PingMention(
+                        ping_id=ping.id, user_id=user_ids[username], created=created
+                    ))
+            for name in hashtag_names:
+                links.append(PingHashtag(ping_id=ping.id, hashtag_id=name, created=created))
+                uses[name] += 1
+                if created >= counted_since:
+                    counts[name, hour_bucket(created)] += 1
+
+        with transaction.atomic(), explicit_timestamps(Ping):
+            Ping.objects.bulk_create(pings)
+            PingMention.objects.bulk_create(mentions)
+            PingHashtag.objects.bulk_create(links)
+        log(f"created {next_id - first_id} pings, up to {times[-1]:%Y-%m-%d %H:%M}")
+
+    add_reply_counts(replied_to)
+    add_hashtag_counts(counts)
+    add_hashtag_uses(uses)
+
+
+def add_reply_counts(replied_to):
+    "Add a Counter of replies by the id of the ping they reply to to the pings' reply counts"
+    by_count = {}
+    for ping_id, count in replied_to.items():
+        by_count.setdefault(count, []).append(ping_id)
+    with transaction.atomic():
+        for count, ping_ids in by_count.items():
+            for ids in chunks(ping_ids, 500):
+                Ping.objects.filter(pk__in=ids).update(reply_count=F('reply_count') + count)
+
+
+def add_hashtag_uses(uses):
+    "Add a Counter of pings by the names of the hashtags they use to the hashtags' use counts"
+    by_count = {}
+    for name, count in uses.items():
+        by_count.setdefault(count, []).append(name)
+    with transaction.atomic():
+        for count, names in by_count.items():
+            for chunk in chunks(names, 500):
+                Hashtag.objects.filter(name__in=chunk).update(use_count=F('use_count') + count)
+
+
+def add_hashtag_counts(counts):
+    """
+    Add a Counter of `(hashtag name, hour bucket)` pairs to the hashtag counts.
+
+    This rolls them up like the `rollup_hashtag_counts` command would.
+    """
+    if counts:
+        oldest = min(bucket for _, bucket in counts)
+        existing = {
+            (hashtag, bucket): pk for pk, hashtag, bucket in
+            HashtagCount.objects.filter(bucket__gte=oldest).values_list('pk', 'hashtag', 'bucket')
+        }
+        with transaction.atomic():
+            for key in counts.keys() & existing.keys():
+                HashtagCount.objects.filter(pk=existing[key]).update(count=F('count') + counts[key])
+            HashtagCount.objects.bulk_create(
+                HashtagCount(hashtag_id=hashtag, bucket=bucket, count=count)
+                for (hashtag, bucket), count in counts.items()
+                if (hashtag, bucket) not in existing
+            )
+    HashtagCount.objects.roll_up()
@@ -1,12 +1,96 @@
+from datetime import timedelta
+from user.blocks import blocked_user_ids
 from user.models import User
 
+from common.utils import sync_rows
 from django.conf import settings
 from django.core.validators import MinLengthValidator
-from django.db import models
-from django.db.models import Subquery
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, Exists, F, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDay
+from django.dispatch import Signal
+from django.utils.timezone import now
+
+# sent by `Ping.update_content_relations` with the sets of hashtag names it
+# `added` to and `removed` from a ping, once their use counts are updated
+hashtags_used = Signal(providing_args=['added', 'removed'])
+
+
+def parse_content(text):
+    """
+    Extract the mentioned usernames and the hashtag names from some ping text.
+
+    Returns a pair of sets: `(usernames, hashtag_names)`. Usernames are
+    lower-cased, because usernames are case-insensitive. A hashtag ends at
+    the first `/`, so that its name fits in its URL.
+    """
+    usernames = set()
+    hashtag_names = set()
+    for word in text.split():
+        if len(word) < 2:
+            continue
+        if word.startswith('@'):
+            usernames.add(word[1:].lower())
+        elif word.startswith('#'):
+            name = word[1:].split('/', 1)[0]
+            if name:
+                hashtag_names.add(name)
+    return usernames, hashtag_names
+
+
+class HashtagManager(models.Manager):
+    def ensure_exist(self, names):
+        """
+        Create whichever of the named hashtags don't already exist.
+
+        This costs one query to find the existing hashtags and one bulk insert
+        for the rest, rather than a `get_or_create` per name.
+        """
+        existing = set(self.filter(name__in=names).values_list('name', flat=True))
+        missing = set(names) - existing
+        if not missing:
+            return
+        try:
+            with transaction.atomic():
+                self.bulk_create(self.model(name=name) for name in missing)
+        except IntegrityError:
+            # another request created some of them in the meantime
+            for name in missing:
+                self.get_or_create(name=name)
+
+    def count_uses(self, added, removed):
+        "Count the hashtags `added` to and `removed` from a ping"
+        if added:
+            self.filter(name__in=added).update(use_count=F('use_count') + 1)
+        if removed:
+            self.filter(name__in=removed, use_count__gt=0).update(use_count=F('use_count') - 1)
+
+    def reconcile_counts(self):
+        """
+        Recount every hashtag's use count from the PingHashtag table, in bulk.
+
+        Returns the number of hashtags whose counts had drifted.
+        """
+        counts = (
+            PingHashtag.objects.filter(hashtag=OuterRef('pk'))
+            .order_by()
+            .values('hashtag')
+            .annotate(count=Count('pk'))
+            .values('count')
+        )
+        actual = Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+        drifted = self.annotate(actual=actual).exclude(use_count=F('actual'))
+        return self.filter(pk__in=Subquery(drifted.values('pk'))).update(use_count=actual)
 
 
 class Hashtag(models.Model):
+    """
+    A hashtag, by its name as first used.
+
+    `use_count` is the number of pings using it, maintained by
+    `Ping.update_content_relations`. Deleting a ping doesn't decrement it;
+    the `reconcile_hashtag_counts` command fixes any drift.
+    """
     name = models.CharField(
         max_length=settings.PING_LENGTH,
         primary_key=True,
@@ -14,6 +98,9 @@ class Hashtag(models.Model):
             MinLengthValidator(1),
         ),
     )
+    use_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = HashtagManager()
 
     def __repr__(self):
         return f"<Hashtag: {self.name}>"
@@ -47,62 +134,537 @@ class Ping(models.Model):
         related_name='replies',
         db_index=True,  # so that querying `ping.replies` is efficient
     )
+    # the ping at the top of the reply chain this ping is in, or None if this
+    # ping isn't a reply; `Ping.in_thread` finds a whole thread with it. Kept
+    # up to date by `save` and the delete signal handlers in `ping.signals`.
+    thread_root = models.ForeignKey(
+        'self',
+        null=True,
+        default=None,
+        editable=False,
+        on_delete=models.DO_NOTHING,
+        related_name='+',
+        db_index=True,
+    )
+    # the number of direct replies, maintained like `thread_root`
+    reply_count = models.PositiveIntegerField(default=0, editable=False)
+    # maintained by `Like.objects.like` and `Like.objects.unlike`
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    # An echo is a ping with no text of its own which links to the original,
+    # so that it flows through timelines and their cursor pagination like
+    # any other ping, ordered by when it was echoed. See `Ping.echo`.
+    echo_of = models.ForeignKey(
+        'self',
+        null=True,
+        default=None,
+        editable=False,
+        on_delete=models.CASCADE,
+        related_name='echoes',
+    )
     mentions = models.ManyToManyField(
         User,
         blank=True,
         # null has no effect on ManyToManyFields
         related_name='mentioned_by',
+        through='PingMention',
     )
     hashtags = models.ManyToManyField(
         Hashtag,
         blank=True,
         related_name='in_pings',
+        through='PingHashtag',
     )
 
+    # `filter_unblocked` passes at most this many blocked user ids as query parameters
+    MAX_LITERAL_BLOCKS = 500
+
+    class Meta:
+        # nobody echoes the same ping twice; other pings have no `echo_of`,
+        # and NULLs don't conflict
+        unique_together = (
+            ('user', 'echo_of'),
+        )
+
     def __repr__(self):
         return "<Ping: {} @ {}>".format(self.user, self.created.isoformat())
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the text as saved, so that saving a ping whose text
+        # hasn't changed can skip updating its mentions and hashtags
+        instance._saved_text = dict(zip(field_names, values)).get('text')
+        return instance
+
     def save(self, *args, **kwargs):
         """
         Override the save method so that mentions and hashtags are always kept in sync
+
+        New replies also join their thread and count towards their parent's replies.
         """
+        created = self._state.adding
+        text_changed = created or self.text != getattr(self, '_saved_text', None)
+        if created and self.replying_to_id is not None:
+            parent = self.replying_to
+            self.thread_root_id = parent.thread_root_id or parent.pk
         super().save(*args, **kwargs)
-        self.update_content_relations()
-
-    def update_content_relations(self):
-        "Set the mentions and hashtags appropriately for this object"
-        mentions = set()
-        hashtags = set()
-        for word in self.text.split():
-            if word.startswith('@'):
-                try:
-                    user = User.objects.get(username=word[1:])
-                except User.DoesNotExist:
-                    continue
-                mentions.add(user)
-            elif word.startswith('#'):
-                hashtag, _ = Hashtag.objects.get_or_create(name=word[1:])
-                hashtags.add(hashtag)
-        self.mentions.set(mentions)
-        self.hashtags.set(hashtags)
+        if created and self.replying_to_id is not None:
+            Ping.objects.filter(pk=self.replying_to_id).update(reply_count=F('reply_count') + 1)
+        if text_changed:
+            self.update_content_relations(created=created)
+        self._saved_text = self.text
+
+    def update_content_relations(self, created=False):
+        """
+        Set the mentions and hashtags appropriately for this object
+
+        All mentioned users are looked up in a single query, all missing hashtags
+        are created in a single insert, and only the difference between the
+        existing and the desired relations is written. If `created` is set, the
+        ping is known to have no relations yet, so they aren't read back first.
+        """
+        usernames, hashtag_names = parse_content(self.text)
+        mentioned_ids = set()
+        if usernames:
+            mentioned_ids = set(
+                User.objects.filter_by_natural_keys(usernames).values_list('pk', flat=True)
+            )
+        if hashtag_names:
+            Hashtag.objects.ensure_exist(hashtag_names)
+        self._set_related('mentions', mentioned_ids, known_empty=created,
+                          link_fields={'created': self.created})
+        added, removed = self._set_related('hashtags', hashtag_names, known_empty=created,
+                                           link_fields={'created': self.created})
+        HashtagCount.objects.record(added, removed, self.created)
+        Hashtag.objects.count_uses(added, removed)
+        hashtags_used.send(sender=Hashtag, added=added, removed=removed)
+
+    def _set_related(self, field_name, target_ids, known_empty=False, link_fields=None):
+        """
+        Make the many-to-many relation `field_name` point at exactly `target_ids`
+
+        Like `self.<field_name>.set(...)`, but writes the through table directly,
+        and doesn't need to read it when the relation is `known_empty`.
+        `link_fields` are set on each new row of the through table.
+
+        Returns the sets of target ids which were added and removed.
+        """
+        field = self._meta.get_field(field_name)
+        through = field.remote_field.through
+        source = field.m2m_field_name()
+        target = field.m2m_reverse_field_name()
+        return sync_rows(
+            through.objects.filter(**{source: self}), target, target_ids,
+            lambda target_id: through(
+                **{source: self, f"{target}_id": target_id}, **(link_fields or {})
+            ),
+            known_empty=known_empty,
+        )
 
     @classmethod
-    def filter_unblocked(cls, qs, request):
+    def filter_unblocked(cls, qs, request, user_field='user'):
         """
         Filters a queryset of Pings so it respects Block relations for the logged-in user
+
+        To filter a queryset of some other model which links to Pings, set `user_field`
+        to the path to the ping's author, i.e. `'ping__user'`.
+
+        The users on the other side of a block are looked up in the block cache,
+        so for the majority of users, who aren't involved in any blocks, this
+        doesn't change the query at all.
         """
+        user_in = f"{user_field}__in"
         if request.user.is_authenticated:
-            # eliminate pings whose author has blocked this user
-            blocking_request_user = request.user.blocked_by.values('blocker')
-            qs = qs.exclude(user__in=Subquery(blocking_request_user))
-            # eliminate pings whose author this user has blocked
-            blocked_by_request_user = request.user.blocks.values('blocked')
-            qs = qs.exclude(user__in=Subquery(blocked_by_request_user))
+            blocked_ids = blocked_user_ids(request.user)
+            if len(blocked_ids) > cls.MAX_LITERAL_BLOCKS:
+                # too many to inline as query parameters; let the database find them
+                blocking_request_user = request.user.blocked_by.values('blocker')
+                blocked_by_request_user = request.user.blocks.values('blocked')
+                qs = qs.exclude(**{user_in: Subquery(blocking_request_user)})
+                qs = qs.exclude(**{user_in: Subquery(blocked_by_request_user)})
+            elif blocked_ids:
+                qs = qs.exclude(**{user_in: blocked_ids})
         return qs
 
+    @classmethod
+    def thread_ids(cls, ping_id, max_ancestors, max_depth, max_replies):
+        """
+        Find the pings in the thread around `ping_id` with a single recursive query
+
+        Returns a pair of lists:
+        - the ids of up to `max_ancestors` pings which `ping_id` replies to,
+            directly or indirectly, starting from the one furthest up the thread
+        - `(id, depth)` pairs of up to `max_replies` of the replies under
+            `ping_id`, down to `max_depth` levels, breadth-first and oldest first
+        """
+        qn = connection.ops.quote_name
+        table = qn(cls._meta.db_table)
+        replying_to = qn(cls._meta.get_field('replying_to').column)
+        created = qn(cls._meta.get_field('created').column)
+        sql = f"""
+            WITH RECURSIVE
+            ancestors (id, replying_to_id, depth) AS (
+                SELECT id, {replying_to}, 0 FROM {table} WHERE id = %s
+                UNION ALL
+                SELECT p.id, p.{replying_to}, a.depth + 1
+                FROM {table} p JOIN ancestors a ON p.id = a.replying_to_id
+                WHERE a.depth < %s
+            ),
+            descendants (id, created, depth) AS (
+                SELECT id, {created}, 1 FROM {table} WHERE {replying_to} = %s
+                UNION ALL
+                SELECT p.id, p.{created}, d.depth + 1
+                FROM {table} p JOIN descendants d ON p.{replying_to} = d.id
+                WHERE d.depth < %s
+            )
+            SELECT id, -depth, NULL FROM ancestors WHERE depth > 0
+            UNION ALL
+            SELECT id, depth, created FROM (
+                SELECT id, depth, created FROM descendants ORDER BY depth, created, id LIMIT %s
+            ) limited
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [ping_id, max_ancestors, ping_id, max_depth, max_replies])
+            rows = cursor.fetchall()
+        ancestors = sorted((depth, pk) for pk, depth, _ in rows if depth < 0)
+        descendants = sorted((depth, created, pk) for pk, depth, created in rows if depth > 0)
+        return [pk for _, pk in ancestors], [(pk, depth) for depth, _, pk in descendants]
+
+    @classmethod
+    def echo(cls, user, ping):
+        """
+        Make `user` echo `ping`, or the ping it echoes if it's an echo itself.
+
+        Returns `(echo, created)`, like `get_or_create`.
+        """
+        original_id = ping.echo_of_id or ping.pk
+        return cls.objects.get_or_create(user=user, echo_of_id=original_id, defaults={'text': ''})
+
+    @classmethod
+    def in_thread(cls, ping):
+        "All the pings in the same thread as `ping`, including its root"
+        root_id = ping.thread_root_id or ping.pk
+        return cls.objects.filter(Q(pk=root_id) | Q(thread_root=root_id))
+
+    @classmethod
+    def reroot_thread(cls, ping_id):
+        """
+        Make `ping_id` the root of the thread of replies under it
+
+        Used when the ping it was replying to is deleted. This is a single
+        recursive update, however deep the replies go.
+        """
+        qn = connection.ops.quote_name
+        table = qn(cls._meta.db_table)
+        replying_to = qn(cls._meta.get_field('replying_to').column)
+        thread_root = qn(cls._meta.get_field('thread_root').column)
+        sql = f"""
+            WITH RECURSIVE subthread (id) AS (
+                SELECT id FROM {table} WHERE {replying_to} = %s
+                UNION ALL
+                SELECT p.id FROM {table} p JOIN subthread s ON p.{replying_to} = s.id
+            )
+            UPDATE {table} SET {thread_root} = %s WHERE id IN (SELECT id FROM subthread)
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [ping_id, ping_id])
+        cls.objects.filter(pk=ping_id).update(thread_root=None)
+
     @classmethod
     def objects_unblocked(cls, request):
         """
         Returns a queryset respecting Block relations for the logged-in user.
         """
         return cls.filter_unblocked(cls.objects, request)
+
+
+class PingHashtag(models.Model):
+    """
+    Link between a Ping and one of its Hashtags.
+
+    This is the through table of `Ping.hashtags`. The ping's creation time
+    is copied onto each link, so that a hashtag's pings can be paged through
+    in order with a range scan over the `(hashtag, created)` index, rather
+    than by joining and sorting every ping which ever used the hashtag.
+    """
+    ping = models.ForeignKey(
+        Ping,
+        on_delete=models.CASCADE,
+        related_name='hashtag_links',
+    )
+    hashtag = models.ForeignKey(
+        Hashtag,
+        on_delete=models.CASCADE,
+        related_name='ping_links',
+    )
+    created = models.DateTimeField()
+
+    class Meta:
+        # this table was originally auto-created for `Ping.hashtags`
+        db_table = 'ping_ping_hashtags'
+        unique_together = (
+            ('ping', 'hashtag'),
+        )
+        index_together = (
+            ('hashtag', 'created'),
+        )
+
+    def __repr__(self):
+        return f"<PingHashtag: {self.ping_id} #{self.hashtag_id}>"
+
+
+class PingMention(models.Model):
+    """
+    Link between a Ping and one of the Users it mentions.
+
+    This is the through table of `Ping.mentions`. Like `PingHashtag`, it
+    carries the ping's creation time, so that a user's mentions can be paged
+    through with a range scan over the `(user, created)` index.
+    """
+    ping = models.ForeignKey(
+        Ping,
+        on_delete=models.CASCADE,
+        related_name='mention_links',
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='mention_links',
+    )
+    created = models.DateTimeField()
+
+    class Meta:
+        # this table was originally auto-created for `Ping.mentions`
+        db_table = 'ping_ping_mentions'
+        unique_together = (
+            ('ping', 'user'),
+        )
+        index_together = (
+            ('user', 'created'),
+        )
+
+    def __repr__(self):
+        return f"<PingMention: {self.ping_id} @{self.user_id}>"
+
+
+class LikeManager(models.Manager):
+    def like(self, user, ping):
+        """
+        Make `user` like `ping`, updating the ping's like count.
+
+        Returns `(like, created)`, like `get_or_create`.
+        """
+        with transaction.atomic():
+            like, created = self.get_or_create(user=user, ping=ping)
+            if created:
+                Ping.objects.filter(pk=ping.pk).update(like_count=F('like_count') + 1)
+        return like, created
+
+    def unlike(self, user, ping):
+        """
+        Make `user` stop liking `ping`, updating the ping's like count.
+
+        Returns whether `user` liked `ping`.
+        """
+        with transaction.atomic():
+            deleted, _ = self.filter(user=user, ping=ping).delete()
+            if deleted:
+                Ping.objects.filter(pk=ping.pk, like_count__gt=0).update(
+                    like_count=F('like_count') - 1
+                )
+        return bool(deleted)
+
+    def liked_by(self, user, ping_field='pk'):
+        """
+        An expression for whether `user` likes the ping at `ping_field` of each row
+
+        Annotating a page of pings with this checks all of them in the page's
+        own query, with a lookup in the `(user, ping)` index per row.
+        """
+        return Exists(self.filter(user=user, ping=OuterRef(ping_field)))
+
+    def reconcile_counts(self):
+        """
+        Recount every ping's like count from the Like table, in bulk.
+
+        Returns the number of pings whose counts had drifted.
+        """
+        counts = (
+            self.filter(ping=OuterRef('pk'))
+            .order_by()
+            .values('ping')
+            .annotate(count=Count('pk'))
+            .values('count')
+        )
+        actual = Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+        drifted = Ping.objects.annotate(actual=actual).exclude(like_count=F('actual'))
+        return Ping.objects.filter(pk__in=Subquery(drifted.values('pk'))).update(
+            like_count=actual
+        )
+
+
+class Like(models.Model):
+    """
+    A user liking a ping.
+
+    Each ping's likes are counted in `Ping.like_count`, so that the count
+    of a viral ping can be displayed without counting its likes. Deleting
+    a user doesn't decrement the counts of the pings they liked; the
+    `reconcile_like_counts` command fixes any drift.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='likes',
+    )
+    ping = models.ForeignKey(
+        Ping,
+        on_delete=models.CASCADE,
+        related_name='likes',
+    )
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = LikeManager()
+
+    class Meta:
+        unique_together = (
+            ('user', 'ping'),
+        )
+        # the liked pings view pages through a user's likes, newest first
+        index_together = (
+            ('user', 'created'),
+        )
+
+    def __repr__(self):
+        return f"<Like: {self.user_id} -> {self.ping_id}>"
+
+
+def hour_bucket(when):
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(when):
+    return when.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class HashtagCountManager(models.Manager):
+    def record(self, added, removed, when):
+        """
+        Count the hashtags `added` to and `removed` from a ping created at `when`.
+        """
+        bucket = hour_bucket(when)
+        if removed:
+            hourly = set(
+                self.filter(hashtag__in=removed, bucket=bucket).values_list('hashtag', flat=True)
+            )
+            # the others' hourly buckets were rolled up into their day already;
+            # the day's first hour shares its bucket, so it's always among `hourly`
+            for names, removed_from in ((hourly, bucket), (removed - hourly, day_bucket(when))):
+                if names:
+                    self.filter(
+                        hashtag__in=names,
+                        bucket=removed_from,
+                        count__gt=0,
+                    ).update(count=F('count') - 1)
+        if not added:
+            return
+        existing = set(
+            self.filter(hashtag__in=added, bucket=bucket).values_list('hashtag', flat=True)
+        )
+        if existing:
+            self.filter(hashtag__in=existing, bucket=bucket).update(count=F('count') + 1)
+        missing = added - existing
+        if not missing:
+            return
+        try:
+            with transaction.atomic():
+                self.bulk_create(
+                    self.model(hashtag_id=name, bucket=bucket, count=1) for name in missing
+                )
+        except IntegrityError:
+            # another request started counting some of them in the meantime
+            for name in missing:
+                counts = self.filter(hashtag_id=name, bucket=bucket)
+                if not counts.update(count=F('count') + 1):
+                    self.create(hashtag_id=name, bucket=bucket, count=1)
+
+    def trending(self, window, limit):
+        """
+        The `limit` most used hashtags over the trailing `window` timedelta.
+
+        Returns dicts with `hashtag` and `total` keys. This only reads the
+        buckets within the window, not the pings which were counted into them.
+        """
+        since = hour_bucket(now() - window)
+        if window > HashtagCount.HOURLY_RETENTION:
+            since = day_bucket(since)
+        return (
+            self.filter(bucket__gte=since)
+            .values('hashtag')
+            .annotate(total=Sum('count'))
+            .filter(total__gt=0)
+            .order_by('-total', 'hashtag')
+            [:limit]
+        )
+
+    def roll_up(self):
+        """
+        Merge expired hourly buckets into daily ones, and delete expired daily buckets.
+
+        Returns the number of buckets which were rolled up and which were deleted.
+        """
+        today = day_bucket(now())
+        with transaction.atomic():
+            expired = self.filter(bucket__lt=today - HashtagCount.DAILY_RETENTION)
+            deleted, _ = expired.delete()
+            hourly = self.filter(bucket__lt=today - HashtagCount.HOURLY_RETENTION)
+            days = list(
+                hourly
+                .annotate(day=TruncDay('bucket'))
+                .values('hashtag', 'day')
+                .annotate(total=Sum('count'))
+                .order_by()
+            )
+            merged, _ = hourly.delete()
+            self.bulk_create(
+                self.model(hashtag_id=day['hashtag'], bucket=day['day'], count=day['total'])
+                for day in days
+            )
+        return merged, deleted
+
+
+class HashtagCount(models.Model):
+    """
+    How often a Hashtag was used by pings created within some time bucket.
+
+    Counts are kept per hour, and `Ping.update_content_relations` increments
+    and decrements them as hashtags are added to and removed from pings.
+    Trending hashtags can then be read from the few buckets in a window
+    rather than by counting every ping in it. Hourly buckets older than
+    `HOURLY_RETENTION` are periodically rolled up into daily buckets by the
+    `rollup_hashtag_counts` command, which also deletes daily buckets older
+    than `DAILY_RETENTION`.
+
+    Deleting a ping does not decrement its buckets; deleted pings keep
+    counting towards trends until their bucket expires.
+    """
+    HOURLY_RETENTION = timedelta(days=1)
+    DAILY_RETENTION = timedelta(days=7)
+
+    hashtag = models.ForeignKey(
+        Hashtag,
+        on_delete=models.CASCADE,
+        related_name='counts',
+    )
+    bucket = models.DateTimeField(db_index=True)
+    count = models.PositiveIntegerField(default=0)
+
+    objects = HashtagCountManager()
+
+    class Meta:
+        unique_together = (
+            ('hashtag', 'bucket'),
+        )
+
+    def __repr__(self):
+        return f"<HashtagCount: #{self.hashtag_id} @ {self.bucket.isoformat()}: {self.count}>"
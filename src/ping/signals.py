@@ -0,0 +1,28 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+from ping.models import Ping
+
+
+@receiver(pre_delete, sender=Ping)
+def ping_deleting(sender, instance, **kwargs):
+    # by `post_delete`, `SET_NULL` has detached the replies, so note them now
+    instance._reply_ids = []
+    if instance.reply_count:
+        instance._reply_ids = list(instance.replies.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Ping)
+def ping_deleted(sender, instance, **kwargs):
+    """
+    Keep reply counts and thread roots consistent once a ping is gone
+
+    This runs after every ping in the same delete is gone, so the parent
+    and replies which were deleted along with it are simply not updated.
+    """
+    if instance.replying_to_id is not None:
+        Ping.objects.filter(pk=instance.replying_to_id, reply_count__gt=0).update(
+            reply_count=F('reply_count') - 1
+        )
+    for reply_id in getattr(instance, '_reply_ids', ()):
+        Ping.reroot_thread(reply_id)
@@ -1,12 +1,24 @@
 from datetime import timedelta
+from io import StringIO
+from time import sleep
 from unittest import mock
 
+from user.models import Follow, User
+
 from common.testing import TestToolsMixin
 from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.utils.timezone import now
-from ping.models import Ping
+from ping.management.commands.bench_ping_serializer import ReversingPingSerializer
+from ping.models import Hashtag, Like, Ping, PingHashtag
+from ping.views import FlatPingSerializer, PingSerializer
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
 
 
 class PingTests(TestToolsMixin, APITestCase):
@@ -183,3 +195,502 @@ class PingTests(TestToolsMixin, APITestCase):
 
             for ping in expect_replies:
                 self.assertIn(ping['url'], replies_urls)
+
+
+class ThreadTests(TestToolsMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.key = self.user['token']
+        #   root
+        #   ├── a
+        #   │   ├── a1
+        #   │   │   └── a1x
+        #   │   └── a2
+        #   └── b
+        self.root = self.create_ping(self.key, 'root')
+        self.a = self.create_reply(self.key, self.root, 'a')
+        self.b = self.create_reply(self.key, self.root, 'b')
+        self.a1 = self.create_reply(self.key, self.a, 'a1')
+        self.a2 = self.create_reply(self.key, self.a, 'a2')
+        self.a1x = self.create_reply(self.key, self.a1, 'a1x')
+
+    def thread(self, ping):
+        return self.client.get(ping['url'] + 'thread/')
+
+    def shape(self, node):
+        "The tree under `node` as nested `(text, [replies])` pairs"
+        return (node['text'], [self.shape(reply) for reply in node['replies']])
+
+    def test_thread_from_root(self):
+        data = self.thread(self.root).data
+        self.assertEqual(data['ancestors'], [])
+        self.assertEqual(
+            self.shape(data['ping']),
+            ('root', [('a', [('a1', [('a1x', [])]), ('a2', [])]), ('b', [])]),
+        )
+        self.assertFalse(data['more_ancestors'])
+        self.assertFalse(data['more_replies'])
+
+    def test_thread_from_middle(self):
+        data = self.thread(self.a1).data
+        self.assertEqual([ping['text'] for ping in data['ancestors']], ['root', 'a'])
+        self.assertNotIn('replies', data['ancestors'][0])
+        self.assertEqual(self.shape(data['ping']), ('a1', [('a1x', [])]))
+
+    def test_thread_pings_are_rendered_like_pings(self):
+        node = self.thread(self.a).data['ping']
+        node.pop('replies')
+        self.assertEqual(node, self.client.get(self.a['url']).data)
+
+    def test_thread_is_a_bounded_number_of_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.thread(self.root)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 2)
+
+    @override_settings(PING_THREAD_MAX_DEPTH=2, PING_THREAD_MAX_ANCESTORS=1)
+    def test_thread_depth_is_limited(self):
+        data = self.thread(self.root).data
+        self.assertEqual(
+            self.shape(data['ping']),
+            ('root', [('a', [('a1', []), ('a2', [])]), ('b', [])]),
+        )
+        self.assertTrue(data['more_replies'])
+
+        data = self.thread(self.a1x).data
+        self.assertEqual([ping['text'] for ping in data['ancestors']], ['a1'])
+        self.assertTrue(data['more_ancestors'])
+
+    @override_settings(PING_THREAD_MAX_REPLIES=3)
+    def test_thread_size_is_limited_breadth_first(self):
+        data = self.thread(self.root).data
+        self.assertEqual(
+            self.shape(data['ping']),
+            ('root', [('a', [('a1', [])]), ('b', [])]),
+        )
+        self.assertTrue(data['more_replies'])
+
+    def test_unknown_ping_is_not_found(self):
+        self.assertEqual(self.client.get('/pings/12345/thread/').status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/pings/nope/thread/').status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def get(self, ping):
+        return Ping.objects.get(text=ping['text'])
+
+    def texts(self, pings):
+        return {ping.text for ping in pings}
+
+    def test_reply_counts_are_maintained(self):
+        for ping, count in ((self.root, 2), (self.a, 2), (self.a1, 1), (self.a1x, 0)):
+            self.assertEqual(self.client.get(ping['url']).data['reply_count'], count)
+
+    def test_whole_thread_can_be_filtered(self):
+        self.assertIsNone(self.get(self.root).thread_root_id)
+        self.assertEqual(self.get(self.a1x).thread_root_id, self.get(self.root).pk)
+        self.assertEqual(
+            self.texts(Ping.in_thread(self.get(self.a1))),
+            {'root', 'a', 'b', 'a1', 'a2', 'a1x'},
+        )
+
+    def test_deleting_a_reply_updates_the_thread(self):
+        with self.client_as(self.key) as auth_client:
+            auth_client.delete(self.a['url'])
+        self.assertEqual(self.get(self.root).reply_count, 1)
+        self.assertEqual(self.texts(Ping.in_thread(self.get(self.root))), {'root', 'b'})
+        # the replies to the deleted ping start threads of their own
+        self.assertIsNone(self.get(self.a1).thread_root_id)
+        self.assertEqual(self.texts(Ping.in_thread(self.get(self.a1))), {'a1', 'a1x'})
+        self.assertEqual(self.texts(Ping.in_thread(self.get(self.a2))), {'a2'})
+
+    def test_deleting_an_author_updates_the_threads(self):
+        other = self.create_user('other')
+        self.create_reply(other['token'], self.a1, 'x')
+        self.create_reply(other['token'], self.a1x, 'y')
+        User.objects.get(username=self.user['username']).delete()
+        self.assertEqual(
+            [(ping.text, ping.reply_count, ping.thread_root_id) for ping in Ping.objects.all()],
+            [('x', 0, None), ('y', 0, None)],
+        )
+
+
+class ConditionalGetTests(TestToolsMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.key = self.create_user()['token']
+        self.ping = self.create_ping(self.key, 'version one')
+
+    def get(self, **headers):
+        return self.client.get(self.ping['url'], **headers)
+
+    def test_unchanged_ping_is_not_modified(self):
+        etag = self.get()['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_representations_vary_by_viewer(self):
+        with self.client_as(self.key) as auth_client:
+            response = auth_client.get(self.ping['url'])
+            self.assertIn('Authorization', response['Vary'])
+            response = auth_client.get(self.ping['url'], HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertIn('Authorization', response['Vary'])
+
+    def test_edits_and_replies_change_the_etag(self):
+        etags = {self.get()['ETag']}
+        self.create_reply(self.key, self.ping)
+        etags.add(self.get()['ETag'])
+        with mock.patch('django.utils.timezone.now') as mock_now:
+            mock_now.return_value = now() + timedelta(minutes=1)
+            with self.client_as(self.key) as auth_client:
+                auth_client.patch(self.ping['url'], {'text': 'version two'}, format='json')
+        response = self.get(HTTP_IF_NONE_MATCH=', '.join(etags))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['text'], 'version two')
+        self.assertNotIn(response['ETag'], etags)
+
+    def test_deleting_the_ping_replied_to_changes_the_etag(self):
+        reply = self.create_reply(self.key, self.ping)
+        with self.client_as(self.key) as auth_client:
+            echo = auth_client.post(reply['url'] + 'echo/').data
+            etags = [auth_client.get(ping['url'])['ETag'] for ping in (reply, echo)]
+            auth_client.delete(self.ping['url'])
+            for ping, etag in zip((reply, echo), etags):
+                response = auth_client.get(ping['url'], HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['echoed']['replying_to'])
+
+    def test_formats_have_different_etags(self):
+        api_etag = self.client.get(self.ping['url'] + '?format=api')['ETag']
+        self.assertNotEqual(self.get()['ETag'], api_etag)
+
+    def test_missing_ping_is_not_found(self):
+        response = self.client.get('/pings/12345/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class LikeTests(TestToolsMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user('author')
+        self.fan = self.create_user('fan')
+        self.ping = self.create_ping(self.author['token'], 'like me')
+
+    def like(self, user, ping=None, action='like'):
+        with self.client_as(user['token']) as auth_client:
+            return auth_client.post((ping or self.ping)['url'] + action + '/')
+
+    def get(self, url, user=None):
+        if user is None:
+            return self.client.get(url)
+        with self.client_as(user['token']) as auth_client:
+            return auth_client.get(url)
+
+    def test_like_and_unlike(self):
+        response = self.like(self.fan)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['like_count'], response.data['liked']), (1, True))
+        self.assertEqual(self.like(self.fan).status_code, status.HTTP_200_OK)
+        self.like(self.author)
+        self.assertEqual(self.get(self.ping['url']).data['like_count'], 2)
+
+        self.assertEqual(self.like(self.fan, action='unlike').status_code,
+                         status.HTTP_204_NO_CONTENT)
+        self.like(self.fan, action='unlike')
+        self.assertEqual(self.get(self.ping['url']).data['like_count'], 1)
+
+    def test_anonymous_cannot_like(self):
+        response = self.client.post(self.ping['url'] + 'like/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_liked_is_per_viewer(self):
+        self.like(self.fan)
+        self.assertTrue(self.get(self.ping['url'], self.fan).data['liked'])
+        self.assertFalse(self.get(self.ping['url'], self.author).data['liked'])
+        self.assertFalse(self.get(self.ping['url']).data['liked'])
+
+    def test_liking_changes_the_etag(self):
+        etag = self.get(self.ping['url'], self.fan)['ETag']
+        self.like(self.fan)
+        with self.client_as(self.fan['token']) as auth_client:
+            response = auth_client.get(self.ping['url'], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_liked_flags_come_from_the_page_query(self):
+        pings = [self.create_ping(self.author['token'], str(idx)) for idx in range(10)]
+        for ping in pings[::3]:
+            self.like(self.fan, ping)
+        self.follow(self.fan, self.author)
+        self.get('/timeline/', self.fan)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get('/timeline/', self.fan)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(
+            [ping['text'] for ping in response.data['results'] if ping['liked']],
+            ['9', '6', '3', '0'],
+        )
+
+    def test_liked_pings_feed(self):
+        first = self.create_ping(self.author['token'], 'first')
+        self.like(self.fan, first)
+        sleep(0.01)
+        self.like(self.fan)
+        response = self.get(self.fan['url'] + 'likes/')
+        self.assertEqual([ping['text'] for ping in response.data['results']], ['like me', 'first'])
+
+        # the feed respects blocks
+        self.block(self.author, self.fan)
+        response = self.get(self.fan['url'] + 'likes/', self.fan)
+        self.assertEqual(response.data['results'], [])
+
+    def test_reconcile_like_counts(self):
+        self.like(self.fan)
+        Ping.objects.update(like_count=5)
+        out = StringIO()
+        call_command('reconcile_like_counts', stdout=out)
+        self.assertEqual(out.getvalue().strip(), "fixed the like counts of 1 pings")
+        self.assertEqual(Ping.objects.get().like_count, 1)
+
+
+class EchoTests(TestToolsMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user('author')
+        self.fan = self.create_user('fan')
+        self.ping = self.create_ping(self.author['token'], 'echo me')
+
+    def post(self, user, url, data=None):
+        with self.client_as(user['token']) as auth_client:
+            return auth_client.post(url, data, format='json')
+
+    def test_echo_and_unecho(self):
+        response = self.post(self.fan, self.ping['url'] + 'echo/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        echo = response.data
+        self.assertEqual(echo['user'], self.fan['url'])
+        self.assertEqual(echo['echo_of'], self.ping['url'])
+        self.assertEqual(echo['echoed']['text'], 'echo me')
+
+        # echoing again, or echoing the echo, is the same echo
+        for url in (self.ping['url'], echo['url']):
+            response = self.post(self.fan, url + 'echo/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['url'], echo['url'])
+
+        response = self.post(self.fan, self.ping['url'] + 'unecho/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Ping.objects.count(), 1)
+
+    def test_echoes_cannot_be_edited(self):
+        echo = self.post(self.fan, self.ping['url'] + 'echo/').data
+        with self.client_as(self.fan['token']) as auth_client:
+            response = auth_client.patch(echo['url'], {'text': 'my words'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cannot_echo_across_a_block(self):
+        self.block(self.author, self.fan)
+        response = self.post(self.fan, self.ping['url'] + 'echo/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', response.data)
+
+    def test_interactions_with_an_echo_go_to_the_original(self):
+        echo = self.post(self.fan, self.ping['url'] + 'echo/').data
+        self.assertEqual(self.post(self.fan, echo['url'] + 'like/').data['url'], self.ping['url'])
+        reply = self.post(self.fan, echo['url'] + 'reply/', {'text': 'indeed'}).data
+        self.assertEqual(reply['replying_to'], self.ping['url'])
+
+        echo = self.client.get(echo['url']).data
+        self.assertEqual(
+            (echo['echoed']['like_count'], echo['echoed']['reply_count']),
+            (1, 1),
+        )
+
+    def test_deleting_the_original_deletes_its_echoes(self):
+        self.post(self.fan, self.ping['url'] + 'echo/')
+        with self.client_as(self.author['token']) as auth_client:
+            auth_client.delete(self.ping['url'])
+        self.assertFalse(Ping.objects.exists())
+
+
+class ContentRelationTests(TestCase):
+    """
+    Mentions and hashtags are extracted correctly and with a bounded number of queries.
+
+    The query budgets here are the benchmark for `Ping.update_content_relations`:
+    if one of them starts failing, find out which new query snuck in.
+    """
+    # insert the ping, look up users, look up hashtags, insert the missing
+    # hashtags in a savepoint, insert mention links, insert hashtag links,
+    # look up this hour's hashtag counts, insert the missing ones in a savepoint,
+    # update the hashtags' use counts, insert the search index postings
+    CREATE_BUDGET = 14
+    # update the ping
+    UNCHANGED_EDIT_BUDGET = 1
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.mentioned = [
+            User.objects.create_user(username=f'user{idx}') for idx in range(10)
+        ]
+        self.text = ' '.join(
+            [f'@User{idx}' for idx in range(10)] + [f'#tag{idx}' for idx in range(10)]
+        )
+
+    def count_queries(self, func):
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        return len(queries)
+
+    def test_create_query_budget(self):
+        ping = Ping(user=self.author, text=self.text)
+        self.assertLessEqual(self.count_queries(ping.save), self.CREATE_BUDGET)
+        self.assertEqual(set(ping.mentions.all()), set(self.mentioned))
+        self.assertEqual(
+            {hashtag.name for hashtag in ping.hashtags.all()},
+            {f'tag{idx}' for idx in range(10)},
+        )
+
+    def test_unchanged_edit_query_budget(self):
+        Ping.objects.create(user=self.author, text=self.text)
+        ping = Ping.objects.get()
+        self.assertLessEqual(self.count_queries(ping.save), self.UNCHANGED_EDIT_BUDGET)
+
+    def test_edit_updates_relations(self):
+        ping = Ping.objects.create(user=self.author, text='@user0 @user1 #foo #bar')
+        ping.text = '@user1 @user2 #bar #baz'
+        ping.save()
+
+        self.assertEqual(
+            {user.username for user in ping.mentions.all()},
+            {'user1', 'user2'},
+        )
+        self.assertEqual(
+            {hashtag.name for hashtag in ping.hashtags.all()},
+            {'bar', 'baz'},
+        )
+
+    def test_hashtags_are_shared(self):
+        Ping.objects.create(user=self.author, text='#foo')
+        Ping.objects.create(user=self.author, text='#foo #bar')
+        self.assertEqual(Hashtag.objects.count(), 2)
+        self.assertEqual(Hashtag.objects.get(name='foo').in_pings.count(), 2)
+
+    def test_unknown_mentions_are_ignored(self):
+        ping = Ping.objects.create(user=self.author, text='@nobody @ # hello')
+        self.assertFalse(ping.mentions.exists())
+        self.assertFalse(Hashtag.objects.exists())
+
+
+class FastHyperlinkTests(TestToolsMixin, APITestCase):
+    "The precompiled hyperlink fields produce exactly what DRF's `reverse()` would"
+
+    def setUp(self):
+        super().setUp()
+        self.users = [
+            User.objects.create_user(username=username)
+            for username in ('plain', 'at@sign', 'plus+minus', 'under_score')
+        ]
+        self.pings = []
+        for user in self.users:
+            ping = Ping.objects.create(user=user, text='hello')
+            self.pings.append(ping)
+            self.pings.append(Ping.objects.create(user=user, text='reply', replying_to=ping))
+
+    def assert_same_output(self, path, **context):
+        request = Request(APIRequestFactory().get(path, **context))
+        context = {'request': request}
+        expected = ReversingPingSerializer(self.pings, many=True, context=context).data
+        actual = PingSerializer(self.pings, many=True, context=context).data
+        self.assertEqual(actual, expected)
+
+    def test_same_urls(self):
+        self.assert_same_output('/timeline/')
+
+    def test_same_urls_with_format_override(self):
+        self.assert_same_output('/timeline/', data={'format': 'json'})
+
+    @override_settings(ALLOWED_HOSTS=['example.com'])
+    def test_same_urls_on_other_host(self):
+        self.assert_same_output('/timeline/', HTTP_HOST='example.com:8080', secure=True)
+
+    def test_user_urls_resolve(self):
+        for ping in self.pings:
+            response = self.client.get(f'/pings/{ping.pk}/')
+            response = self.client.get(response.data['user'])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['username'], ping.user.username)
+
+
+class FlatPingSerializerTests(TestToolsMixin, APITestCase):
+    "The list views' flat serializer renders exactly what PingSerializer would"
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='author')
+        self.other = User.objects.create_user(username='at@other')
+        Follow.objects.follow(self.user, self.other)
+        original = Ping.objects.create(user=self.user, text='hello #tag @at@other')
+        reply = Ping.objects.create(user=self.other, text='hi #tag', replying_to=original)
+        Like.objects.like(self.user, original)
+        with mock.patch('django.utils.timezone.now') as mock_now:
+            mock_now.return_value = reply.created + timedelta(seconds=90)
+            reply.text = 'hi again #tag'
+            reply.save()
+
+    def render(self, serializer_class, rows, context=(), **kwargs):
+        request = Request(APIRequestFactory().get('/timeline/'))
+        context = {'request': request, **dict(context)}
+        data = serializer_class(rows, many=True, context=context, **kwargs).data
+        return JSONRenderer().render(data)
+
+    def assert_same_output(self, pings, context=()):
+        pings = pings.order_by('-created')
+        self.assertEqual(
+            self.render(FlatPingSerializer, FlatPingSerializer.values(pings), context),
+            self.render(PingSerializer, pings, context),
+        )
+
+    def test_same_output(self):
+        self.assert_same_output(Ping.objects.all())
+
+    def test_same_output_with_echoes(self):
+        Ping.echo(self.other, Ping.objects.get(text__startswith='hello'))
+        self.assert_same_output(Ping.objects.all())
+
+    def test_same_output_with_format(self):
+        self.assert_same_output(Ping.objects.all(), {'format': 'json'})
+
+    def test_same_output_through_relation(self):
+        links = PingHashtag.objects.order_by('-created')
+        self.assertEqual(
+            self.render(
+                FlatPingSerializer, FlatPingSerializer.values(links, prefix='ping__'), prefix='ping__'
+            ),
+            self.render(PingSerializer, [link.ping for link in links]),
+        )
+
+    def test_list_views_render_like_ping_serializer(self):
+        pings = Ping.objects.order_by('-created')
+        self.client.force_authenticate(self.user)
+        for path, expected in (
+            (f'/users/{self.user.username}/timeline/', pings.filter(user=self.user)),
+            ('/timeline/', pings),
+            ('/hashtags/tag/', pings),
+            (f'/pings/{pings.last().pk}/replies/', pings.filter(replying_to__isnull=False)),
+            (f'/users/{self.user.username}/likes/', pings.filter(likes__user=self.user)),
+        ):
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, path)
+            request = response.wsgi_request
+            self.assertEqual(
+                JSONRenderer().render(response.data['results']),
+                JSONRenderer().render(
+                    PingSerializer(expected, many=True, context={'request': request}).data
+                ),
+                path,
+            )
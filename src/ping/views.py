@@ -1,38 +1,245 @@
+from types import SimpleNamespace
+from user.blocks import blocked_user_ids
+
+from common.conditional import conditional_response, make_etag
+from common.fields import FastHyperlinkedIdentityField, FastHyperlinkedRelatedField
 from common.pagination import Pagination128
 from common.permissions import IsOwnerOrReadOnly
-from ping.models import Ping
+from django.conf import settings
+from ping.models import Like, Ping
 from rest_framework import mixins, serializers, status, viewsets
 from rest_framework.decorators import detail_route
+from rest_framework.exceptions import NotFound
+from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.relations import PKOnlyObject
 from rest_framework.response import Response
 
 
 class PingSerializer(serializers.HyperlinkedModelSerializer):
+    serializer_url_field = FastHyperlinkedIdentityField
+    serializer_related_field = FastHyperlinkedRelatedField
+
     edited = serializers.SerializerMethodField()
+    liked = serializers.SerializerMethodField()
+    echoed = serializers.SerializerMethodField()
 
     class Meta:
         model = Ping
         fields = (
             'url',
             'replying_to',
+            'echo_of',
             'user',
             'created',
             'edited',
             'text',
+            'reply_count',
+            'like_count',
+            'liked',
+            'echoed',
         )
 
         read_only_fields = (
             'user',
             'replying_to',
+            'echo_of',
         )
 
         extra_kwargs = {'user': {'lookup_field': 'username'}}
 
+    def validate(self, data):
+        if self.instance is not None and self.instance.echo_of_id is not None:
+            raise serializers.ValidationError("Echoes can't be edited")
+        return data
+
     def get_edited(self, obj):
-        edited_after = (obj.edited - obj.created).seconds
-        if edited_after < 15:
+        return edited_after(obj.created, obj.edited)
+
+    def get_liked(self, obj):
+        "Whether the requesting user likes this ping; annotate `liked` to avoid a query"
+        liked = getattr(obj, 'liked', None)
+        if liked is None:
+            request = self.context.get('request')
+            user = getattr(request, 'user', None)
+            liked = bool(
+                user and user.is_authenticated and
+                Like.objects.filter(user=user, ping=obj).exists()
+            )
+        return liked
+
+    def get_echoed(self, obj):
+        "The ping this one echoes, if any"
+        if obj.echo_of_id is None:
             return None
-        return edited_after
+        return PingSerializer(obj.echo_of, context=self.context).data
+
+
+def edited_after(created, edited):
+    "Seconds between creating and editing a ping, or None if it was edited right away"
+    seconds = (edited - created).seconds
+    if seconds < 15:
+        return None
+    return seconds
+
+
+class FlatPingListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        "Fetch the pings echoed by any of the rows in a single query"
+        rows = list(data)
+        self.child.fetch_originals(rows)
+        return super().to_representation(rows)
+
+
+class FlatPingSerializer(serializers.BaseSerializer):
+    """
+    Read-only equivalent of PingSerializer for rows from `FlatPingSerializer.values()`.
+
+    List views spend most of their time instantiating Ping and User models
+    and walking PingSerializer's field tree for every row. This builds
+    exactly the same representation from plain `.values()` dicts instead,
+    borrowing PingSerializer's fields only where their output depends on
+    the request or settings: the hyperlinks and the creation time.
+
+    Pass `prefix` when the rows were fetched through a relation, i.e.
+    `prefix='ping__'` for a queryset of PingHashtag, and pass the requesting
+    user to `values()` as the `viewer`, so that whether they like each ping
+    is fetched along with it. The pings echoed by a list of rows are
+    fetched together, with one more query.
+    """
+    FIELDS = (
+        'id',
+        'created',
+        'edited',
+        'text',
+        'user',
+        'user__username',
+        'replying_to',
+        'echo_of',
+        'reply_count',
+        'like_count',
+    )
+
+    class Meta:
+        list_serializer_class = FlatPingListSerializer
+
+    @classmethod
+    def values(cls, queryset, prefix='', viewer=None):
+        "Fetch the columns this serializer needs from `queryset`"
+        fields = [prefix + field for field in cls.FIELDS]
+        if prefix:
+            # cursor pagination orders by, and reads the position from, `created`
+            fields.append('created')
+        if viewer is not None and viewer.is_authenticated:
+            queryset = queryset.annotate(liked=Like.objects.liked_by(viewer, prefix + 'id'))
+            fields.append('liked')
+        return queryset.values(*fields)
+
+    def __init__(self, *args, prefix='', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prefix = prefix
+        self._fields = None
+        self._originals = None
+
+    @property
+    def ping_fields(self):
+        "PingSerializer's fields, bound to this serializer's context"
+        if self._fields is None:
+            self._fields = PingSerializer(context=self.context).fields
+        return self._fields
+
+    def fetch_originals(self, rows):
+        "Fetch the rows of the pings echoed by `rows`"
+        echo_of = self.prefix + 'echo_of'
+        original_ids = {row[echo_of] for row in rows if row[echo_of] is not None}
+        self._originals = {}
+        if original_ids:
+            request = self.context.get('request')
+            self._originals = {
+                row['id']: row for row in FlatPingSerializer.values(
+                    Ping.objects.filter(pk__in=original_ids),
+                    viewer=getattr(request, 'user', None),
+                )
+            }
+
+    def to_representation(self, row):
+        if self._originals is None:
+            self.fetch_originals([row])
+        return self.represent(row, self.prefix)
+
+    def represent(self, row, prefix):
+        fields = self.ping_fields
+        created = row[prefix + 'created']
+        replying_to = row[prefix + 'replying_to']
+        echo_of = row[prefix + 'echo_of']
+        return {
+            'url': fields['url'].to_representation(PKOnlyObject(row[prefix + 'id'])),
+            'replying_to': (
+                None if replying_to is None
+                else fields['replying_to'].to_representation(PKOnlyObject(replying_to))
+            ),
+            'echo_of': (
+                None if echo_of is None
+                else fields['echo_of'].to_representation(PKOnlyObject(echo_of))
+            ),
+            'user': fields['user'].to_representation(
+                SimpleNamespace(pk=row[prefix + 'user'], username=row[prefix + 'user__username'])
+            ),
+            'created': fields['created'].to_representation(created),
+            'edited': edited_after(created, row[prefix + 'edited']),
+            'text': row[prefix + 'text'],
+            'reply_count': row[prefix + 'reply_count'],
+            'like_count': row[prefix + 'like_count'],
+            'liked': row.get('liked', False),
+            'echoed': self.represent_original(echo_of),
+        }
+
+    def represent_original(self, original_id):
+        original = self._originals.get(original_id)
+        if original is None:
+            return None
+        return self.represent(original, '')
+
+
+def ping_versions(pings, viewer):
+    """
+    `.values()` of the columns of `pings` which change when their representation does
+
+    Conditional views read these to compute ETags without fetching and
+    serializing the pings, including the pings they echo, themselves.
+    """
+    fields = [
+        'id', 'created', 'edited', 'replying_to', 'reply_count', 'like_count',
+        # deleting the ping replied to clears `replying_to`, and nothing else
+        'echo_of__edited', 'echo_of__replying_to', 'echo_of__reply_count', 'echo_of__like_count',
+    ]
+    if viewer.is_authenticated:
+        pings = pings.annotate(
+            liked=Like.objects.liked_by(viewer),
+            echo_liked=Like.objects.liked_by(viewer, 'echo_of'),
+        )
+        fields += ['liked', 'echo_liked']
+    return pings.values(*fields)
+
+
+def without_repeated_echoes(rows, prefix=''):
+    """
+    Drop the echoes of pings which are already among `rows`
+
+    `rows` are from `FlatPingSerializer.values()`, with the same `prefix`,
+    newest first. Of several echoes of the same ping, only the newest is kept.
+    """
+    ping_id, echo_of = prefix + 'id', prefix + 'echo_of'
+    seen = {row[ping_id] for row in rows if row[echo_of] is None}
+    kept = []
+    for row in rows:
+        original_id = row[echo_of]
+        if original_id is not None:
+            if original_id in seen:
+                continue
+            seen.add(original_id)
+        kept.append(row)
+    return kept
 
 
 class AscendingPagination128(Pagination128):
@@ -50,10 +257,36 @@ class PingViewSet(mixins.CreateModelMixin,
     Note that we do not specify the ListModelMixin;
     we want users to use a timeline view to view pings.
     """
-    queryset = Ping.objects.all()
+    # the author's username is part of a ping's representation, and so is
+    # the ping it echoes, if any
+    queryset = Ping.objects.select_related('user', 'echo_of__user')
     serializer_class = PingSerializer
     permission_classes = (IsOwnerOrReadOnly,)
 
+    def get_queryset(self):
+        "Annotate whether the requesting user likes each ping, for PingSerializer"
+        queryset = super().get_queryset()
+        if self.request.user.is_authenticated:
+            queryset = queryset.annotate(liked=Like.objects.liked_by(self.request.user))
+        return queryset
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Retrieve a ping, or respond `304 Not Modified` if the client's copy is current.
+
+        The version is read with a narrow query on the ping's row, before
+        fetching and serializing the ping and its author.
+        """
+        version = get_object_or_404(
+            ping_versions(Ping.objects.all(), request.user),
+            pk=self.kwargs['pk'],
+        )
+        return conditional_response(
+            request,
+            make_etag(request, 'ping', *version.values()),
+            lambda: super(PingViewSet, self).retrieve(request, *args, **kwargs),
+        )
+
     def perform_create(self, serializer):
         """
         Override perform_create to insert the appropriate user
@@ -75,10 +308,67 @@ class PingViewSet(mixins.CreateModelMixin,
         serializer.is_valid(raise_exception=True)
         serializer.save(
             user=self.request.user,
-            replying_to=self.get_object(),
+            replying_to=self.get_original(),
         )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def get_original(self):
+        "The ping to interact with: the ping echoed, if this is an echo"
+        ping = self.get_object()
+        return ping.echo_of if ping.echo_of_id is not None else ping
+
+    @detail_route(methods=['post'], permission_classes=(IsAuthenticated,))
+    def echo(self, request, pk):
+        """
+        View allowing the authenticated user to echo this ping to their followers.
+
+        An echo is a ping of the user's own, which appears in timelines as of
+        when it was echoed, and which links to the ping it echoes.
+        """
+        original = self.get_original()
+        if original.user_id in blocked_user_ids(request.user):
+            return Response(
+                {'error': 'Cannot echo a ping across a block'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        echo, created = Ping.echo(request.user, original)
+        echo.echo_of = original
+        return Response(
+            PingSerializer(echo, context={'request': request}).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+    @detail_route(methods=['post'], permission_classes=(IsAuthenticated,))
+    def unecho(self, request, pk):
+        """
+        View allowing the authenticated user to remove their echo of this ping.
+        """
+        Ping.objects.filter(user=request.user, echo_of=self.get_original()).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @detail_route(methods=['post'], permission_classes=(IsAuthenticated,))
+    def like(self, request, pk):
+        """
+        View allowing the authenticated user to like this ping.
+        """
+        ping = self.get_original()
+        _, created = Like.objects.like(request.user, ping)
+        if created:
+            ping.like_count += 1
+        ping.liked = True
+        return Response(
+            PingSerializer(ping, context={'request': request}).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+    @detail_route(methods=['post'], permission_classes=(IsAuthenticated,))
+    def unlike(self, request, pk):
+        """
+        View allowing the authenticated user to stop liking this ping.
+        """
+        Like.objects.unlike(request.user, self.get_original())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @property
     def replies_paginator(self):
         "Paginator for use with the replies view"
@@ -92,11 +382,71 @@ class PingViewSet(mixins.CreateModelMixin,
         View providing a paginated list of replies to a given ping
         """
         replied_to = self.get_object()
-        replies_qs = replied_to.replies.select_related('user', 'replying_to')
+        replies_qs = FlatPingSerializer.values(replied_to.replies.all(), viewer=request.user)
         page = self.replies_paginator.paginate_queryset(replies_qs, request)
-        serializer = PingSerializer(
+        serializer = FlatPingSerializer(
             page,
             many=True,
             context={'request': request},
         )
         return self.replies_paginator.get_paginated_response(serializer.data)
+
+    @detail_route()
+    def thread(self, request, pk):
+        """
+        View providing the whole conversation around a given ping.
+
+        `ancestors` lists the pings this one replies to, starting from the
+        root of the thread. `ping` is this ping, and each ping in the tree
+        under it lists its `replies`, oldest first.
+
+        At most `settings.PING_THREAD_MAX_ANCESTORS` ancestors are listed,
+        and replies are included breadth-first, down to
+        `settings.PING_THREAD_MAX_DEPTH` levels and up to
+        `settings.PING_THREAD_MAX_REPLIES` pings. `more_ancestors` and
+        `more_replies` say whether anything was left out.
+        """
+        try:
+            ping_id = int(pk)
+        except ValueError:
+            raise NotFound()
+        ancestor_ids, descendant_ids = Ping.thread_ids(
+            ping_id,
+            max_ancestors=settings.PING_THREAD_MAX_ANCESTORS + 1,
+            max_depth=settings.PING_THREAD_MAX_DEPTH + 1,
+            max_replies=settings.PING_THREAD_MAX_REPLIES + 1,
+        )
+        more_ancestors = len(ancestor_ids) > settings.PING_THREAD_MAX_ANCESTORS
+        ancestor_ids = ancestor_ids[-settings.PING_THREAD_MAX_ANCESTORS:]
+        more_replies = (
+            len(descendant_ids) > settings.PING_THREAD_MAX_REPLIES or
+            any(depth > settings.PING_THREAD_MAX_DEPTH for _, depth in descendant_ids)
+        )
+        descendant_ids = [
+            descendant_id for descendant_id, depth
+            in descendant_ids[:settings.PING_THREAD_MAX_REPLIES]
+            if depth <= settings.PING_THREAD_MAX_DEPTH
+        ]
+
+        rows = list(FlatPingSerializer.values(
+            Ping.objects.filter(pk__in=[ping_id] + ancestor_ids + descendant_ids),
+            viewer=request.user,
+        ).order_by('created'))
+        data = FlatPingSerializer(rows, many=True, context={'request': request}).data
+        nodes = {row['id']: node for row, node in zip(rows, data)}
+        if ping_id not in nodes:
+            raise NotFound()
+
+        descendants = set(descendant_ids)
+        for row in rows:
+            if row['id'] == ping_id or row['id'] in descendants:
+                nodes[row['id']]['replies'] = []
+        for row in rows:
+            if row['id'] in descendants:
+                nodes[row['replying_to']]['replies'].append(nodes[row['id']])
+        return Response({
+            'ancestors': [nodes[ancestor_id] for ancestor_id in ancestor_ids],
+            'more_ancestors': more_ancestors,
+            'ping': nodes[ping_id],
+            'more_replies': more_replies,
+        })
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class SearchConfig(AppConfig):
+    name = 'search'
+
+    def ready(self):
+        # connect the signal handlers which keep the index in sync
+        from search import signals  # noqa: F401
@@ -0,0 +1,116 @@
+"""
+The search index: posting tables from each word to the pings and users containing it.
+
+Text is split into terms by `terms`: runs of at least two letters or
+digits, lower-cased and cut to `MAX_TERM_LENGTH`. Hashtags and mentions
+are indexed as their plain words, so a search for `django` also finds
+`#django`, `@django`, and `@django_fan`.
+
+`search.signals` keeps the postings of a ping in sync as it's created and
+edited, and those of a user as their username or blurb change; deletes
+cascade. Only the difference between the old and the new terms is written.
+Rows inserted without `save`, i.e. by `bulk_create`, aren't indexed until
+`rebuild` is run.
+
+A search finds its candidates through the postings' `term` index, and
+ranks them by how many of the query's distinct terms each one contains.
+"""
+import re
+from user.models import User
+
+from common.utils import chunks, sync_rows
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from ping.models import Ping
+from search.models import MAX_TERM_LENGTH, PingTerm, UserTerm
+
+TERM = re.compile(r'[^\W_]{2,}')
+
+
+def terms(*texts):
+    "The set of terms in `texts`"
+    return {
+        term[:MAX_TERM_LENGTH]
+        for text in texts
+        for term in TERM.findall(text.lower())
+    }
+
+
+def query_terms(query):
+    "The terms to search for, at most `settings.SEARCH_MAX_TERMS` of them"
+    return sorted(terms(query))[:settings.SEARCH_MAX_TERMS]
+
+
+def _sync(model, field, owner, desired, known_empty=False):
+    """
+    Make the postings of `owner` in `model` be exactly the `desired` terms
+
+    If `known_empty` is set, `owner` is known to have no postings yet, so
+    they aren't read back first.
+    """
+    sync_rows(
+        model.objects.filter(**{field: owner}), 'term', desired,
+        lambda term: model(term=term, **{field: owner}),
+        known_empty=known_empty,
+    )
+
+
+def index_ping(ping, created=False):
+    "Update the postings of `ping` to match its text"
+    _sync(PingTerm, 'ping', ping, terms(ping.text), known_empty=created)
+
+
+def index_user(user, created=False):
+    "Update the postings of `user` to match their username and blurb"
+    _sync(UserTerm, 'user', user, terms(user.username, user.blurb), known_empty=created)
+
+
+def _ranked(queryset, model, field, query):
+    """
+    The rows of `queryset` with postings in `model` for any term of `query`
+
+    Each is annotated with the number of distinct terms it `matches`.
+    `queryset` may be a `.values()` queryset, whose rows then include `matches`.
+    """
+    postings = model.objects.filter(term__in=query_terms(query))
+    matches = (
+        postings.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return queryset.filter(pk__in=Subquery(postings.values(field))).annotate(
+        matches=Subquery(matches, output_field=IntegerField()),
+    )
+
+
+def search_pings(pings, query):
+    "The pings of `pings` which match `query`"
+    return _ranked(pings, PingTerm, 'ping', query)
+
+
+def search_users(users, query):
+    "The users of `users` which match `query`"
+    return _ranked(users, UserTerm, 'user', query)
+
+
+def rebuild(chunk_size=10000, log=print):
+    "Rebuild the whole index from the Ping and User tables"
+    for model, source, field, columns in (
+        (PingTerm, Ping, 'ping', ('text',)),
+        (UserTerm, User, 'user', ('username', 'blurb')),
+    ):
+        model.objects.all().delete()
+        rows = source.objects.order_by('pk').values_list('pk', *columns)
+        count = 0
+        for chunk in chunks(rows.iterator(), chunk_size):
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    model(term=term, **{f'{field}_id': pk})
+                    for pk, *texts in chunk
+                    for term in terms(*texts)
+                )
+            count += len(chunk)
+        log(f"indexed {count} {source._meta.verbose_name_plural}")
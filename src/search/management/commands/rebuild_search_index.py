@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from search import index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the search index from scratch. Run this once after migrating a database "
+        "which already has pings, or after inserting pings or users without saving them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, chunk_size, **options):
+        index.rebuild(chunk_size=chunk_size, log=self.stdout.write)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-17 02:32
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import re
+
+# as in `search.index`, which may have moved on by the time this runs
+TERM = re.compile(r'[^\W_]{2,}')
+
+
+def index_existing(apps, schema_editor):
+    for model_name, source_name, field, columns in (
+        ('PingTerm', 'ping.Ping', 'ping_id', ('text',)),
+        ('UserTerm', settings.AUTH_USER_MODEL, 'user_id', ('username', 'blurb')),
+    ):
+        model = apps.get_model('search', model_name)
+        rows = apps.get_model(source_name).objects.values_list('pk', *columns)
+        postings = []
+        for pk, *texts in rows.iterator():
+            postings.extend(
+                model(term=term, **{field: pk})
+                for term in {term[:40] for text in texts for term in TERM.findall(text.lower())}
+            )
+            if len(postings) >= 10000:
+                model.objects.bulk_create(postings)
+                postings = []
+        model.objects.bulk_create(postings)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('ping', '0013_add_echoes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PingTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=40)),
+                ('ping', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ping.Ping')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=40)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='userterm',
+            unique_together=set([('term', 'user')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pingterm',
+            unique_together=set([('term', 'ping')]),
+        ),
+        migrations.RunPython(index_existing, migrations.RunPython.noop),
+    ]
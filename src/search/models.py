@@ -0,0 +1,49 @@
+from user.models import User
+
+from django.db import models
+from ping.models import Ping
+
+# longer words are indexed and searched for by their first this many characters
+MAX_TERM_LENGTH = 40
+
+
+class PingTerm(models.Model):
+    """
+    A posting in the search index: `ping`'s text contains the word `term`.
+
+    Each ping has one row per distinct word, kept in sync by `search.index`;
+    deleting a ping deletes its postings with it.
+    """
+    term = models.CharField(max_length=MAX_TERM_LENGTH)
+    ping = models.ForeignKey(
+        Ping,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+
+    class Meta:
+        # also the index which searches look postings up with
+        unique_together = (
+            ('term', 'ping'),
+        )
+
+    def __repr__(self):
+        return f"<PingTerm: {self.term} <- {self.ping_id}>"
+
+
+class UserTerm(models.Model):
+    "A posting in the search index: `user`'s username or blurb contains the word `term`."
+    term = models.CharField(max_length=MAX_TERM_LENGTH)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+
+    class Meta:
+        unique_together = (
+            ('term', 'user'),
+        )
+
+    def __repr__(self):
+        return f"<UserTerm: {self.term} <- {self.user_id}>"
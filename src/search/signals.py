@@ -0,0 +1,21 @@
+from user.models import User
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from ping.models import Ping
+from search import index
+
+
+@receiver(post_save, sender=Ping)
+def ping_saved(sender, instance, created, raw=False, **kwargs):
+    # `Ping.save` only updates `_saved_text` once this has run
+    if not raw and (created or instance.text != getattr(instance, '_saved_text', None)):
+        index.index_ping(instance, created=created)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # i.e. logging in only saves `last_login`
+    if raw or (update_fields is not None and not {'username', 'blurb'} & set(update_fields)):
+        return
+    index.index_user(instance, created=created)
@@ -0,0 +1,144 @@
+import json
+from base64 import urlsafe_b64encode
+from io import StringIO
+from unittest import mock
+from user.models import User
+
+from common.testing import TestToolsMixin
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+from search.models import PingTerm, UserTerm
+from search.views import PingSearchPagination
+
+
+class SearchTests(TestToolsMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('searcher')
+        self.author = self.create_user('author')
+
+    def search(self, query, path='/search/', **params):
+        with self.client_as(self.user['token']) as auth_client:
+            return auth_client.get(path, {'q': query, **params})
+
+    def texts(self, response):
+        return [ping['text'] for ping in response.data['results']]
+
+    def test_pings_are_ranked_by_matching_terms(self):
+        self.create_ping(self.author['token'], 'the quick brown fox')
+        self.create_ping(self.author['token'], 'a quick #fox, jumping')
+        self.create_ping(self.author['token'], 'quick thinking')
+        self.create_ping(self.author['token'], 'something else entirely')
+
+        response = self.search('Quick FOX')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # ties are broken by recency
+        self.assertEqual(
+            self.texts(response),
+            ['a quick #fox, jumping', 'the quick brown fox', 'quick thinking'],
+        )
+
+    def test_index_follows_edits_and_deletes(self):
+        ping = self.create_ping(self.author['token'], 'original words')
+        with self.client_as(self.author['token']) as auth_client:
+            auth_client.patch(ping['url'], {'text': 'edited words'}, format='json')
+        self.assertEqual(self.texts(self.search('original')), [])
+        self.assertEqual(self.texts(self.search('edited')), ['edited words'])
+
+        with self.client_as(self.author['token']) as auth_client:
+            auth_client.delete(ping['url'])
+        self.assertEqual(self.texts(self.search('words')), [])
+        self.assertFalse(PingTerm.objects.exists())
+
+    def test_search_respects_blocks(self):
+        self.create_ping(self.author['token'], 'hidden text')
+        self.block(self.author, self.user)
+        self.assertEqual(self.texts(self.search('hidden')), [])
+        self.assertEqual(self.search('author', '/search/users/').data['results'], [])
+
+    def test_results_are_cursor_paginated(self):
+        for idx in range(5):
+            self.create_ping(self.author['token'], f'page {idx}')
+        self.create_ping(self.author['token'], 'another page')
+        self.create_ping(self.author['token'], 'page 0 again')
+        with mock.patch.object(PingSearchPagination, 'page_size', 2):
+            texts = []
+            response = self.search('page again')
+            while True:
+                texts.extend(self.texts(response))
+                if response.data['next'] is None:
+                    break
+                with self.client_as(self.user['token']) as auth_client:
+                    response = auth_client.get(response.data['next'])
+        # the best match, then the rest from newest to oldest
+        self.assertEqual(
+            texts,
+            ['page 0 again', 'another page', 'page 4', 'page 3', 'page 2', 'page 1', 'page 0'],
+        )
+
+    def test_search_is_a_single_query(self):
+        for idx in range(5):
+            self.create_ping(self.author['token'], f'counting {idx}')
+        self.search('counting')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.search('counting')
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(len(queries), 1)
+
+    def test_query_needs_a_word(self):
+        for query in ('', 'a ! ?'):
+            response = self.search(query)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('error', response.data)
+        with self.client_as(self.user['token']) as auth_client:
+            response = auth_client.get('/search/', {'q': 'word', 'cursor': 'nonsense'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_malformed_cursors_are_not_found(self):
+        for path, position in (
+            ('/search/', ['a', 'b', 'c']),
+            ('/search/', [1, 'notadate', 3]),
+            ('/search/', [1, None, 3]),
+            ('/search/users/', [1, 'many', [3]]),
+        ):
+            cursor = urlsafe_b64encode(json.dumps(position).encode()).decode()
+            response = self.search('author words', path, cursor=cursor)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_users_are_searched_by_username_and_blurb(self):
+        with self.client_as(self.author['token']) as auth_client:
+            auth_client.patch(self.author['url'], {'blurb': 'I write about Django'}, format='json')
+        self.create_user('django_fan')
+
+        response = self.search('write', '/search/users/')
+        self.assertEqual(
+            [user['username'] for user in response.data['results']],
+            ['author'],
+        )
+        response = self.search('django fan', '/search/users/')
+        self.assertEqual(
+            [user['username'] for user in response.data['results']],
+            ['django_fan', 'author'],
+        )
+
+    def test_rebuild_search_index(self):
+        self.create_ping(self.author['token'], 'rebuild me')
+        PingTerm.objects.all().delete()
+        UserTerm.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertEqual(out.getvalue().split('\n')[:2], ['indexed 1 pings', 'indexed 2 users'])
+        self.assertEqual(self.texts(self.search('rebuild')), ['rebuild me'])
+        self.assertEqual(
+            set(UserTerm.objects.values_list('term', flat=True)),
+            {'searcher', 'author'},
+        )
+
+    def test_logging_in_does_not_reindex(self):
+        user = User.objects.get(username='author')
+        with CaptureQueriesContext(connection) as queries:
+            user.save(update_fields=['last_login'])
+        self.assertFalse(any('search_userterm' in query['sql'] for query in queries))
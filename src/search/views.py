@@ -0,0 +1,76 @@
+from user.models import User
+from user.views import UserSerializer
+
+from common.pagination import KeysetPagination
+from ping.models import Ping
+from ping.views import FlatPingSerializer
+from rest_framework import status, viewsets
+from rest_framework.decorators import list_route
+from rest_framework.response import Response
+from search import index
+
+
+class PingSearchPagination(KeysetPagination):
+    # best match first, then newest first
+    ordering = ('matches', 'created', 'id')
+
+
+class UserSearchPagination(KeysetPagination):
+    # best match first, then most followed first
+    ordering = ('matches', 'followed_count', 'id')
+
+
+class SearchViewSet(viewsets.GenericViewSet):
+    """
+    Full-text search of pings and users, through the index in `search.index`.
+
+    `?q=` is split into words the same way as the indexed text. Results
+    contain at least one of them, and are ranked by how many they contain.
+    Pings by, and users on the other side of, a block with the logged-in
+    user are left out.
+    """
+    serializer_class = FlatPingSerializer
+    pagination_class = PingSearchPagination
+
+    def get_query(self):
+        "`?q=`, or None if it has nothing to search for"
+        query = self.request.query_params.get('q', '')
+        return query if index.query_terms(query) else None
+
+    def invalid_query(self):
+        return Response(
+            {'error': "q must contain a word of at least two letters or digits"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    def list(self, request, *args, **kwargs):
+        """
+        View searching the text of pings.
+        """
+        query = self.get_query()
+        if query is None:
+            return self.invalid_query()
+        pings = FlatPingSerializer.values(Ping.objects_unblocked(request), viewer=request.user)
+        page = self.paginate_queryset(index.search_pings(pings, query))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @property
+    def users_paginator(self):
+        "Paginator for use with the users view"
+        if not hasattr(self, '_users_paginator'):
+            self._users_paginator = UserSearchPagination()
+        return self._users_paginator
+
+    @list_route()
+    def users(self, request):
+        """
+        View searching the usernames and blurbs of users.
+        """
+        query = self.get_query()
+        if query is None:
+            return self.invalid_query()
+        users = Ping.filter_unblocked(User.objects.all(), request, user_field='pk')
+        page = self.users_paginator.paginate_queryset(index.search_users(users, query), request)
+        serializer = UserSerializer(page, many=True, context={'request': request})
+        return self.users_paginator.get_paginated_response(serializer.data)
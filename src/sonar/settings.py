@@ -31,13 +31,85 @@ ALLOWED_HOSTS = []
 AUTH_USER_MODEL = 'user.User'
 PING_LENGTH = 140
 
+# limits on how much of a conversation `/pings/<id>/thread/` returns
+PING_THREAD_MAX_ANCESTORS = 100
+PING_THREAD_MAX_DEPTH = 16
+PING_THREAD_MAX_REPLIES = 500
+
+# Timeline settings
+# When TIMELINE_FANOUT is enabled, new pings are pushed into the timelines of
+# their author's followers at write time, and /timeline/ reads from that store
+# instead of assembling every page from Follow and Block at read time.
+# Run `manage.py rebuild_timelines` after enabling it on an existing database.
+TIMELINE_FANOUT = False
+TIMELINE_STORE = 'timeline.store.DatabaseTimelineStore'
+# how many of a user's pings are copied into a timeline when they're followed,
+# and how many pings each timeline keeps once `manage.py trim_timelines`, which
+# should be run periodically, has trimmed it
+TIMELINE_BACKFILL_LENGTH = 800
+# Pings by users with at least this many followers are not pushed to their
+# followers; they're pulled and merged in at read time instead. This bounds
+# the write amplification of a single ping. `None` always pushes.
+TIMELINE_CELEBRITY_THRESHOLD = 10000
+# Celebrities' pings are pushed again once they drop below this many followers.
+# Their recent pings are then copied into their followers' timelines by
+# `manage.py update_celebrities`, which should be run periodically.
+TIMELINE_CELEBRITY_RELEASE = 9000
+# how many seconds clients polling /timeline/ and /mentions/ with `since` are
+# told to wait between polls
+TIMELINE_POLL_INTERVAL = 10
+# the longest a request to /timeline/wait/ is held open, in seconds
+TIMELINE_WAIT_TIMEOUT = 30
+# the backend which delivers new ping notifications to /timeline/wait/; the
+# local backend only works within a single process
+PUBSUB_BACKEND = 'common.pubsub.LocalPubSub'
+
+# Search settings
+# searches only look for this many of the distinct words in their query, which
+# bounds the number of posting lists each one reads
+SEARCH_MAX_TERMS = 8
+
+# Hashtag completion settings
+# the most suggestions /hashtags/complete/ makes for a prefix
+HASHTAG_COMPLETION_SIZE = 10
+# how many seconds each process uses its in-memory completion index before
+# reloading it, to pick up the hashtags used through other processes
+HASHTAG_COMPLETION_REFRESH = 300
+
+# how many users' block relations are cached in each process, and for how many
+# seconds; see CACHES
+BLOCK_CACHE_SIZE = 10000
+BLOCK_CACHE_TTL = 60
+# how many users' followed usernames are cached in each process, for
+# /users/complete/, and for how many seconds; see CACHES
+FOLLOW_CACHE_SIZE = 10000
+FOLLOW_CACHE_TTL = 60
+# the most suggestions /users/complete/ makes for a prefix
+USER_COMPLETION_SIZE = 10
+
+# Token authentication caching
+# how many tokens are cached in each process, and for how many seconds
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = 60
+# the name of an entry in CACHES shared between processes, i.e. memcached,
+# to use as a second-level token cache; `None` only caches in-process
+TOKEN_CACHE_ALIAS = None
+
+# Request metrics
+# add a `Server-Timing` header with the time and database time of each request
+METRICS_SERVER_TIMING = True
+# log requests which run the same query at least this many times, i.e. N+1 queries
+METRICS_DUPLICATE_QUERY_THRESHOLD = 5
+# log a summary of the aggregated metrics at most this often, in seconds; `None` never does
+METRICS_LOG_INTERVAL = 300
+
 # DRF settings
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'common.authentication.CachingTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
 }
@@ -48,6 +120,10 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'user',
     'ping',
+    'timeline',
+    'search',
+    'hashtags',
+    'benchmark',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -56,6 +132,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'common.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -97,6 +174,21 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/1.11/ref/settings/#caches
+
+# The default cache holds the versions which invalidate the in-process block
+# and follow caches when those change, so it must be shared between processes,
+# i.e. memcached, when more than one serves the API. The local memory cache
+# only invalidates the process which made the change, and the others only see
+# it once their entries expire. `manage.py check --deploy` warns about this.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
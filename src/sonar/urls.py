@@ -15,12 +15,14 @@ Including another URLconf
 """
 from user.views import UserViewSet
 
+from common.views import MetricsView
 from django.conf.urls import url
 from hashtags.views import HashtagViewSet
 from mentions.views import MentionsViewSet
 from ping.views import PingViewSet
 from rest_framework import routers
 from rest_framework.authtoken.views import obtain_auth_token
+from search.views import SearchViewSet
 from timeline.views import TimelineViewSet
 
 router = routers.DefaultRouter()
@@ -29,8 +31,10 @@ router.register(r'pings', PingViewSet)
 router.register(r'timeline', TimelineViewSet, 'timeline')
 router.register(r'mentions', MentionsViewSet, 'mentions')
 router.register(r'hashtags', HashtagViewSet, 'hashtag')
+router.register(r'search', SearchViewSet, 'search')
 
 urlpatterns = router.urls
 urlpatterns += [
-    url(r'^get-token/', obtain_auth_token)
+    url(r'^get-token/', obtain_auth_token),
+    url(r'^metrics/$', MetricsView.as_view(), name='metrics'),
 ]
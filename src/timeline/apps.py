@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class TimelineConfig(AppConfig):
+    name = 'timeline'
+
+    def ready(self):
+        # connect the fan-out signal handlers
+        from timeline import signals  # noqa: F401
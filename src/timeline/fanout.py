@@ -0,0 +1,206 @@
+"""
+Fan-out-on-write policy for home timelines.
+
+When `settings.TIMELINE_FANOUT` is enabled, each new ping is pushed into the
+timeline store entry of its author and of each of the author's followers,
+so that reading `/timeline/` is a lookup in the store rather than a join
+over `Follow` and `Block`. The functions in this module decide which
+timelines are affected by a given change; `timeline.signals` calls them
+as pings, follows, and blocks are created and deleted.
+
+Blocks are applied at write time: a ping is never pushed into a timeline
+whose owner has a block relation with its author, creating a block purges
+both users' pings from each other's timelines, and removing the last block
+between two users restores whichever follows still exist.
+
+Pushing a ping costs one write per follower, which is unreasonable for users
+with very many followers. Users with at least
+`settings.TIMELINE_CELEBRITY_THRESHOLD` followers are therefore treated as
+celebrities: their pings are only pushed into their own timeline, and are
+pulled from the Ping table at read time and merged into the pushed stream
+of each of their followers. They stay celebrities until they drop below
+`settings.TIMELINE_CELEBRITY_RELEASE` followers, and it's left to the
+`update_celebrities` command to push their recent pings to their remaining
+followers then, rather than to the unfollow which released them; see
+`timeline.models.Celebrity`. Because both streams are expressed as a single
+Ping queryset, the merge is ordered by `created` and keeps the usual cursor
+pagination semantics. Timelines which don't need the merge are paged through
+the store's own entries instead. A threshold of `None` pushes everything.
+"""
+from user.models import Block, Follow, User
+
+from django.conf import settings
+from django.db.models import Q, Subquery
+from ping.models import Ping
+from timeline.models import Celebrity
+from timeline.store import get_store
+
+
+def enabled():
+    return settings.TIMELINE_FANOUT
+
+
+def is_celebrity(user_id):
+    "True if new pings by `user_id` should be pulled at read time rather than pushed"
+    return Celebrity.objects.filter(user_id=user_id, released=False).exists()
+
+
+def followed_celebrities(user):
+    "Ids of the celebrities, released or not, followed by `user`"
+    followed = Follow.objects.filter(follower=user).values('followed')
+    return list(
+        Celebrity.objects
+        .filter(user__in=Subquery(followed))
+        .values_list('user', flat=True)
+    )
+
+
+def has_followers(user_id, count):
+    "True if `user_id` has at least `count` followers, without counting any further"
+    # count the follows directly: the follow signals are sent before the
+    # denormalized count is updated
+    return Follow.objects.filter(followed_id=user_id)[:count].count() == count
+
+
+def is_blocked(user_a_id, user_b_id):
+    "True if there is a block in either direction between the two users"
+    return Block.objects.filter(
+        Q(blocker_id=user_a_id, blocked_id=user_b_id) |
+        Q(blocker_id=user_b_id, blocked_id=user_a_id)
+    ).exists()
+
+
+def recipients(author):
+    "Ids of the users whose timelines should receive a new ping by `author`"
+    blocked = Block.objects.filter(blocker=author).values('blocked')
+    blocking = Block.objects.filter(blocked=author).values('blocker')
+    followers = (
+        Follow.objects
+        .filter(followed=author)
+        .exclude(follower__in=Subquery(blocked))
+        .exclude(follower__in=Subquery(blocking))
+        .values_list('follower', flat=True)
+    )
+    return [author.id] + list(followers)
+
+
+def distribute(ping):
+    "Push a newly created ping into all the timelines it belongs in"
+    if is_celebrity(ping.user_id):
+        owner_ids = [ping.user_id]
+    else:
+        owner_ids = recipients(ping.user)
+    get_store().push(ping, owner_ids)
+
+
+def follow_created(follow):
+    followed_id = follow.followed_id
+    pulled = is_celebrity(followed_id)
+    threshold = settings.TIMELINE_CELEBRITY_THRESHOLD
+    if not pulled and threshold is not None and has_followers(followed_id, threshold):
+        # a released celebrity is simply pulled again, whether or not
+        # their pings were pushed in the meantime
+        Celebrity.objects.update_or_create(user_id=followed_id, defaults={'released': False})
+        pulled = True
+    if not (pulled or is_blocked(follow.follower_id, followed_id)):
+        get_store().backfill(follow.follower_id, followed_id)
+
+
+def follow_deleted(follow):
+    get_store().purge(follow.follower_id, follow.followed_id)
+    release = settings.TIMELINE_CELEBRITY_RELEASE
+    if is_celebrity(follow.followed_id) and not has_followers(follow.followed_id, release):
+        # Their new pings are pushed from now on, but their followers'
+        # timelines are left to `update_celebrities`, and keep pulling their
+        # older pings until then.
+        Celebrity.objects.filter(user_id=follow.followed_id).update(released=True)
+
+
+def block_created(block):
+    store = get_store()
+    store.purge(block.blocker_id, block.blocked_id)
+    store.purge(block.blocked_id, block.blocker_id)
+
+
+def block_deleted(block):
+    if is_blocked(block.blocker_id, block.blocked_id):
+        # the reverse block is still in effect
+        return
+    store = get_store()
+    for follower_id, followed_id in Follow.objects.filter(
+        Q(follower_id=block.blocker_id, followed_id=block.blocked_id) |
+        Q(follower_id=block.blocked_id, followed_id=block.blocker_id)
+    ).values_list('follower', 'followed'):
+        store.backfill(follower_id, followed_id)
+
+
+def update_celebrities(log=print):
+    """
+    Bring the celebrities up to date with everyone's follower counts
+
+    Users with at least the threshold of followers become celebrities, and
+    the recent pings of each released celebrity are pushed to their
+    followers, after which they're no longer pulled. Users who gained or
+    lost followers without going through the follow signals, i.e. through
+    `bulk_create`, are picked up by their denormalized follower counts.
+    """
+    threshold = settings.TIMELINE_CELEBRITY_THRESHOLD
+    release = settings.TIMELINE_CELEBRITY_RELEASE
+    celebrities = Celebrity.objects.all()
+    if threshold is None:
+        celebrities.update(released=True)
+    else:
+        celebrities.filter(released=False, user__followed_count__lt=release).update(released=True)
+        celebrities.filter(released=True, user__followed_count__gte=threshold).update(released=False)
+        Celebrity.objects.bulk_create(
+            Celebrity(user_id=user_id) for user_id in
+            User.objects
+            .filter(followed_count__gte=threshold)
+            .exclude(pk__in=Subquery(celebrities.values('user')))
+            .values_list('pk', flat=True)
+        )
+
+    store = get_store()
+    released = 0
+    for celebrity in celebrities.filter(released=True).select_related('user'):
+        for owner_id in recipients(celebrity.user):
+            store.backfill(owner_id, celebrity.user_id)
+        # unless a follow has made them a celebrity again in the meantime
+        released += celebrities.filter(pk=celebrity.pk, released=True).delete()[0]
+    log(f"{celebrities.count()} celebrities, released {released}")
+
+
+def rebuild(user):
+    "Rebuild the timeline of `user` from scratch"
+    store = get_store()
+    store.clear(user.id)
+    store.backfill(user.id, user.id)
+    blocked = Block.objects.filter(blocker=user).values('blocked')
+    blocking = Block.objects.filter(blocked=user).values('blocker')
+    celebrities = set(followed_celebrities(user))
+    for followed_id in (
+        Follow.objects
+        .filter(follower=user)
+        .exclude(followed__in=Subquery(blocked))
+        .exclude(followed__in=Subquery(blocking))
+        .values_list('followed', flat=True)
+    ):
+        if followed_id not in celebrities:
+            store.backfill(user.id, followed_id)
+
+
+def timeline_queryset(request):
+    """
+    Return a queryset of the home timeline of `request.user`, and the path to its pings
+
+    The queryset is ordered by its own `created` field; the path is `''`
+    when its rows are the pings themselves.
+    """
+    store = get_store()
+    celebrities = followed_celebrities(request.user)
+    if not celebrities:
+        return store.get_entries(request.user), store.entry_prefix
+    pulled = Ping.objects.filter(user__in=celebrities)
+    # blocks are applied at write time for pushed pings, but pulled
+    # pings have to be filtered the usual way
+    return store.get_queryset(request.user) | Ping.filter_unblocked(pulled, request), ''
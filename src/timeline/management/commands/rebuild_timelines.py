@@ -0,0 +1,29 @@
+from user.models import User
+
+from django.core.management.base import BaseCommand
+from timeline import fanout
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the materialized home timelines used when TIMELINE_FANOUT is enabled. "
+        "Run this once after enabling fan-out on a database which already has pings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames',
+            nargs='*',
+            help="Only rebuild the timelines of these users",
+        )
+
+    def handle(self, *args, usernames=(), **options):
+        users = User.objects.all()
+        if usernames:
+            users = User.objects.filter_by_natural_keys(usernames)
+        fanout.update_celebrities(log=self.stdout.write)
+        count = 0
+        for user in users.iterator():
+            fanout.rebuild(user)
+            count += 1
+        self.stdout.write(f"rebuilt {count} timelines")
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from timeline.store import get_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Cut the materialized home timelines down to their newest TIMELINE_BACKFILL_LENGTH "
+        "pings. Run this periodically when TIMELINE_FANOUT is enabled."
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"trimmed {get_store().trim()} timelines")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from timeline import fanout
+
+
+class Command(BaseCommand):
+    help = (
+        "Make users with TIMELINE_CELEBRITY_THRESHOLD followers celebrities, and push the "
+        "recent pings of released celebrities to their followers. Run this periodically "
+        "when TIMELINE_FANOUT is enabled."
+    )
+
+    def handle(self, *args, **options):
+        fanout.update_celebrities(log=self.stdout.write)
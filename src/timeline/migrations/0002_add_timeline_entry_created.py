@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-17 03:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_created(apps, schema_editor):
+    Ping = apps.get_model('ping', 'Ping')
+    TimelineEntry = apps.get_model('timeline', 'TimelineEntry')
+    TimelineEntry.objects.update(
+        created=Subquery(Ping.objects.filter(pk=OuterRef('ping')).values('created')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0001_create_timeline_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timelineentry',
+            name='created',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(copy_created, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='timelineentry',
+            name='created',
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterIndexTogether(
+            name='timelineentry',
+            index_together=set([('owner', 'author'), ('owner', 'created')]),
+        ),
+    ]
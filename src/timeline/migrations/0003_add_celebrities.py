@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-17 02:54
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def add_celebrities(apps, schema_editor):
+    # users who were pulled by their follower count until now keep being pulled
+    threshold = settings.TIMELINE_CELEBRITY_THRESHOLD
+    if threshold is None:
+        return
+    Celebrity = apps.get_model('timeline', 'Celebrity')
+    User = apps.get_model('user', 'User')
+    Celebrity.objects.bulk_create(
+        Celebrity(user_id=user_id) for user_id in
+        User.objects.filter(followed_count__gte=threshold).values_list('pk', flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0007_add_username_key'),
+        ('timeline', '0002_add_timeline_entry_created'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Celebrity',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('released', models.BooleanField(default=False)),
+            ],
+            options={
+                'verbose_name_plural': 'celebrities',
+            },
+        ),
+        migrations.RunPython(add_celebrities, migrations.RunPython.noop),
+    ]
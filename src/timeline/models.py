@@ -0,0 +1,74 @@
+from user.models import User
+
+from django.db import models
+from ping.models import Ping
+
+
+class TimelineEntry(models.Model):
+    """
+    A single Ping materialized into a single User's home timeline.
+
+    These rows are only written when `settings.TIMELINE_FANOUT` is enabled
+    and the `DatabaseTimelineStore` is in use. The author is denormalized
+    onto the entry so that unfollows and blocks can purge an author's pings
+    from a timeline without joining back to the Ping table, and the ping's
+    creation time so that each page of a timeline is a range scan over the
+    `(owner, created)` index.
+    """
+    owner = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    ping = models.ForeignKey(
+        Ping,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    created = models.DateTimeField()
+
+    class Meta:
+        unique_together = (
+            ('owner', 'ping'),
+        )
+        index_together = (
+            ('owner', 'author'),
+            ('owner', 'created'),
+        )
+
+    def __repr__(self):
+        return f"<TimelineEntry: {self.owner_id} <- {self.ping_id}>"
+
+
+class Celebrity(models.Model):
+    """
+    A user whose pings are pulled into their followers' timelines at read time.
+
+    Users become celebrities once they have
+    `settings.TIMELINE_CELEBRITY_THRESHOLD` followers, and are `released`
+    once they drop below `settings.TIMELINE_CELEBRITY_RELEASE`. The gap
+    between the two keeps a user whose follower count hovers around either
+    from flipping between pushing and pulling on every follow.
+
+    A released celebrity's new pings are pushed again, but their older ones
+    are still pulled until the `update_celebrities` command has pushed them
+    to their followers, and deleted the row.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+    )
+    released = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name_plural = 'celebrities'
+
+    def __repr__(self):
+        return f"<Celebrity: {self.user_id}{' (released)' if self.released else ''}>"
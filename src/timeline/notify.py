@@ -0,0 +1,50 @@
+"""
+Push notifications of new pings to clients waiting on `/timeline/wait/`.
+
+Each new ping is published once to its author's channel, and once to the
+mentions channel of each user it mentions, unless there's a block between
+the two. A waiting client subscribes to the channels of everyone it follows
+and isn't blocked from, to its own, and to its mentions channel. Publishing
+a ping therefore doesn't depend on how many followers its author has.
+"""
+from user.blocks import blocked_user_ids
+from user.models import Follow, User
+
+from common.pubsub import get_pubsub
+from ping.models import parse_content
+
+
+def author_channel(user_id):
+    return f'pings:{user_id}'
+
+
+def mentions_channel(user_id):
+    return f'mentions:{user_id}'
+
+
+def ping_created(ping):
+    "Publish a newly created ping to everyone who should hear about it"
+    pubsub = get_pubsub()
+    message = {'ping': ping.pk}
+    pubsub.publish(author_channel(ping.user_id), message)
+
+    # the mentions are looked up from the text, because when this runs
+    # outside of a transaction, the ping's mention links don't exist yet
+    usernames, _ = parse_content(ping.text)
+    if usernames:
+        blocked = blocked_user_ids(ping.user)
+        mentioned = User.objects.filter_by_natural_keys(usernames).values_list('pk', flat=True)
+        for user_id in mentioned:
+            if user_id not in blocked:
+                pubsub.publish(mentions_channel(user_id), message)
+
+
+def subscribe(user):
+    "Subscribe to notifications of the pings in the timeline and mentions of `user`"
+    blocked = blocked_user_ids(user)
+    followed = Follow.objects.filter(follower=user).values_list('followed', flat=True)
+    channels = [author_channel(user.pk), mentions_channel(user.pk)]
+    channels.extend(
+        author_channel(user_id) for user_id in followed if user_id not in blocked
+    )
+    return get_pubsub().subscribe(channels)
@@ -0,0 +1,51 @@
+"""
+Signal handlers which keep materialized timelines in sync, and which notify
+waiting clients of new pings.
+
+Every handler but the notification is a no-op unless
+`settings.TIMELINE_FANOUT` is enabled.
+"""
+from user.models import Block, Follow
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from ping.models import Ping
+from timeline import fanout, notify
+
+
+@receiver(post_save, sender=Ping)
+def ping_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and fanout.enabled():
+        fanout.distribute(instance)
+
+
+@receiver(post_save, sender=Ping)
+def ping_notify(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        # don't wake anyone up to look for a ping they can't see yet
+        transaction.on_commit(lambda: notify.ping_created(instance))
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and fanout.enabled():
+        fanout.follow_created(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    if fanout.enabled():
+        fanout.follow_deleted(instance)
+
+
+@receiver(post_save, sender=Block)
+def block_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and fanout.enabled():
+        fanout.block_created(instance)
+
+
+@receiver(post_delete, sender=Block)
+def block_deleted(sender, instance, **kwargs):
+    if fanout.enabled():
+        fanout.block_deleted(instance)
@@ -0,0 +1,243 @@
+"""
+Storage backends for materialized home timelines.
+
+A timeline store holds, for each user, the ids of the pings which belong in
+their home timeline. It knows nothing about who follows whom; the policy of
+which pings go to which timelines lives in `timeline.fanout`. Stores only
+have to support a handful of primitive operations:
+
+- `push`: add a single ping to many timelines
+- `backfill`: add many of an author's pings to a single timeline
+- `purge`: remove all of an author's pings from a single timeline
+- `get_queryset`: a Ping queryset for a single timeline, which the existing
+    cursor pagination can page through as usual
+- `get_entries`: a queryset of a single timeline's rows, which may link to
+    their pings rather than be pings, ordered by a `created` field of their own
+- `trim`: cut every timeline down to its newest pings
+
+Timelines are kept to the newest `settings.TIMELINE_BACKFILL_LENGTH` pings.
+Stores may let them grow past that as pings are pushed, until `trim` is
+run by the `trim_timelines` command. The store in use is selected by
+`settings.TIMELINE_STORE`.
+"""
+from bisect import insort
+from collections import defaultdict
+from threading import Lock
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Subquery
+from django.utils.module_loading import import_string
+from ping.models import Ping
+from timeline.models import TimelineEntry
+
+
+class BaseTimelineStore:
+    # the path from the rows of `get_entries` to their pings
+    entry_prefix = ''
+
+    def push(self, ping, owner_ids):
+        "Add `ping` to the timelines of each user in `owner_ids`"
+        raise NotImplementedError
+
+    def backfill(self, owner_id, author_id):
+        "Add the most recent pings of `author_id` to the timeline of `owner_id`"
+        raise NotImplementedError
+
+    def purge(self, owner_id, author_id):
+        "Remove all pings of `author_id` from the timeline of `owner_id`"
+        raise NotImplementedError
+
+    def clear(self, owner_id=None):
+        "Empty the timeline of `owner_id`, or every timeline if it is `None`"
+        raise NotImplementedError
+
+    def trim(self):
+        """
+        Cut every timeline down to its newest `settings.TIMELINE_BACKFILL_LENGTH` pings
+
+        Returns the number of timelines which were trimmed.
+        """
+        raise NotImplementedError
+
+    def get_queryset(self, owner):
+        "Return a queryset of the pings in the timeline of `owner`"
+        raise NotImplementedError
+
+    def get_entries(self, owner):
+        """
+        Return a queryset of the rows in the timeline of `owner`
+
+        Their pings are at `entry_prefix`, and they have a `created` field
+        to be paged through by. By default, these are the pings of `get_queryset`.
+        """
+        return self.get_queryset(owner)
+
+    @staticmethod
+    def backfill_pings(author_id):
+        "The (id, created) pairs which a backfill of `author_id` should insert"
+        return (
+            Ping.objects
+            .filter(user_id=author_id)
+            .order_by('-created')
+            .values_list('id', 'created')
+            [:settings.TIMELINE_BACKFILL_LENGTH]
+        )
+
+
+class DatabaseTimelineStore(BaseTimelineStore):
+    """
+    Timeline store backed by the `TimelineEntry` table.
+
+    Pages are read from the entries, by their copy of their ping's `created`,
+    and joined to the pings from there.
+
+    Pushing a ping is a single insert, and doesn't trim the timelines it
+    goes into, which would take a statement per follower; backfills, which
+    only go into a single timeline, do trim it.
+    """
+    entry_prefix = 'ping__'
+
+    def _trim(self, owner_id):
+        "Delete all but the newest `settings.TIMELINE_BACKFILL_LENGTH` entries of `owner_id`"
+        length = settings.TIMELINE_BACKFILL_LENGTH
+        entries = TimelineEntry.objects.filter(owner_id=owner_id)
+        # NULL, so nothing is deleted, for timelines which aren't full yet
+        oldest_kept = entries.order_by('-created').values('created')[length - 1:length]
+        entries.filter(created__lt=Subquery(oldest_kept)).delete()
+
+    def push(self, ping, owner_ids):
+        # several inserts, for many owners, within the limits on query parameters
+        with transaction.atomic():
+            TimelineEntry.objects.bulk_create(
+                TimelineEntry(
+                    owner_id=owner_id,
+                    ping=ping,
+                    author_id=ping.user_id,
+                    created=ping.created,
+                )
+                for owner_id in owner_ids
+            )
+
+    def backfill(self, owner_id, author_id):
+        present = set(
+            TimelineEntry.objects
+            .filter(owner_id=owner_id, author_id=author_id)
+            .values_list('ping', flat=True)
+        )
+        with transaction.atomic():
+            TimelineEntry.objects.bulk_create(
+                TimelineEntry(
+                    owner_id=owner_id,
+                    ping_id=ping_id,
+                    author_id=author_id,
+                    created=created,
+                )
+                for ping_id, created in self.backfill_pings(author_id)
+                if ping_id not in present
+            )
+            self._trim(owner_id)
+
+    def purge(self, owner_id, author_id):
+        TimelineEntry.objects.filter(owner_id=owner_id, author_id=author_id).delete()
+
+    def clear(self, owner_id=None):
+        entries = TimelineEntry.objects.all()
+        if owner_id is not None:
+            entries = entries.filter(owner_id=owner_id)
+        entries.delete()
+
+    def trim(self):
+        full = (
+            TimelineEntry.objects
+            .values('owner')
+            .annotate(length=Count('pk'))
+            .filter(length__gt=settings.TIMELINE_BACKFILL_LENGTH)
+            .values_list('owner', flat=True)
+        )
+        owner_ids = list(full)
+        for owner_id in owner_ids:
+            self._trim(owner_id)
+        return len(owner_ids)
+
+    def get_queryset(self, owner):
+        return Ping.objects.filter(pk__in=Subquery(self.get_entries(owner).values('ping')))
+
+    def get_entries(self, owner):
+        return TimelineEntry.objects.filter(owner=owner)
+
+
+class LocalTimelineStore(BaseTimelineStore):
+    """
+    Process-local, in-memory timeline store.
+
+    This behaves like a Redis sorted set per user: each timeline is kept
+    sorted by creation time and is trimmed to the newest
+    `settings.TIMELINE_BACKFILL_LENGTH` pings. It does not survive restarts
+    and is not shared between processes, so it's a stand-in for tests and
+    development rather than something to deploy.
+
+    Deleted pings are not removed eagerly; they simply drop out of the
+    queryset at read time.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        # owner_id -> sorted list of (created, ping_id, author_id)
+        self._timelines = defaultdict(list)
+
+    def _insert(self, owner_id, entries):
+        timeline = self._timelines[owner_id]
+        present = {ping_id for _, ping_id, _ in timeline}
+        for entry in entries:
+            if entry[1] not in present:
+                insort(timeline, entry)
+        del timeline[:-settings.TIMELINE_BACKFILL_LENGTH]
+
+    def push(self, ping, owner_ids):
+        entry = (ping.created, ping.id, ping.user_id)
+        with self._lock:
+            for owner_id in owner_ids:
+                self._insert(owner_id, [entry])
+
+    def backfill(self, owner_id, author_id):
+        entries = [
+            (created, ping_id, author_id)
+            for ping_id, created in self.backfill_pings(author_id)
+        ]
+        with self._lock:
+            self._insert(owner_id, entries)
+
+    def purge(self, owner_id, author_id):
+        with self._lock:
+            self._timelines[owner_id] = [
+                entry for entry in self._timelines[owner_id]
+                if entry[2] != author_id
+            ]
+
+    def trim(self):
+        # timelines are trimmed as pings are inserted
+        return 0
+
+    def clear(self, owner_id=None):
+        with self._lock:
+            if owner_id is None:
+                self._timelines.clear()
+            else:
+                self._timelines.pop(owner_id, None)
+
+    def get_queryset(self, owner):
+        with self._lock:
+            ping_ids = [ping_id for _, ping_id, _ in self._timelines.get(owner.id, ())]
+        return Ping.objects.filter(pk__in=ping_ids)
+
+
+_stores = {}
+
+
+def get_store():
+    "Return the process-wide instance of the configured timeline store"
+    path = settings.TIMELINE_STORE
+    if path not in _stores:
+        _stores[path] = import_string(path)()
+    return _stores[path]
@@ -1,8 +1,20 @@
-from time import sleep
+from io import StringIO
+from threading import Timer
+from time import monotonic, sleep
+from user.models import User
 
+from common.pubsub import get_pubsub
 from common.testing import TestToolsMixin
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from ping.models import Ping
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APITransactionTestCase
+from timeline import notify
+from timeline.models import Celebrity, TimelineEntry
+from timeline.store import get_store
 from timeline.views import TimelineViewSet
 
 # strictly speaking, it's possible to use other page sizes
@@ -147,3 +159,415 @@ class TimelineTests(TestToolsMixin, APITestCase):
         self.assertEqual(len(tl_resp.data['results']), 4)
         for ping in tl_resp.data['results']:
             self.assertNotEqual(ping['user'], user3['url'])
+
+    def echo(self, user, ping):
+        with self.client_as(user['token']) as auth_client:
+            return auth_client.post(ping['url'] + 'echo/').data
+
+    def timeline(self, user):
+        with self.client_as(user['token']) as auth_client:
+            return auth_client.get('/timeline/').data['results']
+
+    def test_echoes_appear_in_followers_timelines(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        user3 = self.create_user('user3')
+        self.follow(user1, user2)
+        ping = self.create_ping(user3['token'], 'worth repeating')
+        sleep(0.01)
+        own = self.create_ping(user1['token'], 'my own')
+        sleep(0.01)
+        echo = self.echo(user2, ping)
+
+        results = self.timeline(user1)
+        self.assertEqual([result['url'] for result in results], [echo['url'], own['url']])
+        self.assertEqual(results[0]['user'], user2['url'])
+        self.assertEqual(results[0]['echo_of'], ping['url'])
+        self.assertEqual(results[0]['echoed']['text'], 'worth repeating')
+        self.assertIsNone(results[1]['echoed'])
+
+    def test_echoes_of_pings_on_the_page_are_dropped(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        user3 = self.create_user('user3')
+        self.follow(user1, user2)
+        self.follow(user1, user3)
+        ping = self.create_ping(user3['token'], 'seen already')
+        sleep(0.01)
+        self.echo(user2, ping)
+        sleep(0.01)
+        other = self.create_ping(user1['token'], 'echoed twice')
+        sleep(0.01)
+        self.echo(user2, other)
+        sleep(0.01)
+        self.echo(user3, other)
+
+        # the original wins over its echoes, and the newest echo over older ones
+        self.assertEqual(
+            [result['url'] for result in self.timeline(user1)],
+            [other['url'], ping['url']],
+        )
+
+    def test_echoed_pings_are_fetched_together(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        user3 = self.create_user('user3')
+        self.follow(user1, user2)
+        pings = [self.create_ping(user3['token'], str(idx)) for idx in range(5)]
+        self.echo(user2, pings[0])
+        self.timeline(user1)
+        with CaptureQueriesContext(connection) as queries:
+            self.timeline(user1)
+        one_echo = len(queries)
+
+        for ping in pings[1:]:
+            self.echo(user2, ping)
+        with CaptureQueriesContext(connection) as queries:
+            results = self.timeline(user1)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(len(queries), one_echo)
+
+    def test_echoes_respect_blocks_with_the_original_author(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        user3 = self.create_user('user3')
+        self.follow(user1, user2)
+        ping = self.create_ping(user3['token'], 'blocked')
+        self.echo(user2, ping)
+        self.create_ping(user2['token'], 'not blocked')
+        self.block(user1, user3)
+
+        self.assertEqual([result['text'] for result in self.timeline(user1)], ['not blocked'])
+
+    def poll(self, user, since):
+        with self.client_as(user['token']) as auth_client:
+            return auth_client.get('/timeline/', {'since': since})
+
+    def test_since_lists_only_newer_pings(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        self.follow(user1, user2)
+        head = self.create_ping(user1['token'], 'seen already')
+        head_id = head['url'].rstrip('/').rsplit('/', 1)[-1]
+
+        response = self.poll(user1, head_id)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(response['X-Poll-Interval'], '10')
+
+        sleep(0.01)
+        self.create_ping(user2['token'], 'new 1')
+        sleep(0.01)
+        self.create_ping(user1['token'], 'new 2')
+        response = self.poll(user1, head_id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([ping['text'] for ping in response.data['results']], ['new 2', 'new 1'])
+        self.assertFalse(response.data['gap'])
+
+        response = self.poll(user1, response.data['since'])
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_since_reports_gaps(self):
+        user = self.create_user()
+        head = self.create_ping(user['token'])
+        for _ in range(PAGE_SIZE + 1):
+            self.create_ping(user['token'])
+
+        response = self.poll(user, head['url'].rstrip('/').rsplit('/', 1)[-1])
+        self.assertEqual(len(response.data['results']), PAGE_SIZE)
+        self.assertTrue(response.data['gap'])
+
+    def test_since_must_be_a_ping_id_or_cursor(self):
+        user = self.create_user()
+        for since in ('yesterday', '\u00b2'):
+            response = self.poll(user, since)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_since_must_not_be_a_deleted_ping(self):
+        user = self.create_user()
+        ping = self.create_ping(user['token'])
+        with self.client_as(user['token']) as auth_client:
+            auth_client.delete(ping['url'])
+        response = self.poll(user, ping['url'].rstrip('/').rsplit('/', 1)[-1])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('existing ping', response.data['error'])
+
+
+@override_settings(TIMELINE_FANOUT=True)
+class FanoutTimelineTests(TimelineTests):
+    "Run the timeline tests against the materialized timeline store"
+
+    def timeline_urls(self, user):
+        with self.client_as(user['token']) as auth_client:
+            return [ping['url'] for ping in auth_client.get('/timeline/').data['results']]
+
+    def test_new_pings_are_pushed_to_followers(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        self.follow(user1, user2)
+
+        self.create_ping(user2['token'])
+        self.assertEqual(TimelineEntry.objects.filter(owner__username='user1').count(), 1)
+        self.assertEqual(TimelineEntry.objects.filter(owner__username='user2').count(), 1)
+
+    def test_follow_backfills_timeline(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        ping = self.create_ping(user2['token'])
+
+        self.assertEqual(self.timeline_urls(user1), [])
+        self.follow(user1, user2)
+        self.assertEqual(self.timeline_urls(user1), [ping['url']])
+
+    def test_unfollow_purges_timeline(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        self.follow(user1, user2)
+        own_ping = self.create_ping(user1['token'])
+        self.create_ping(user2['token'])
+
+        self.unfollow(user1, user2)
+        self.assertEqual(self.timeline_urls(user1), [own_ping['url']])
+
+    def test_block_purges_both_timelines(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        self.follow(user1, user2)
+        self.follow(user2, user1)
+        ping1 = self.create_ping(user1['token'])
+        ping2 = self.create_ping(user2['token'])
+
+        self.block(user2, user1)
+        self.assertEqual(self.timeline_urls(user1), [ping1['url']])
+        self.assertEqual(self.timeline_urls(user2), [ping2['url']])
+
+        # new pings are not pushed across the block either
+        self.create_ping(user1['token'])
+        self.assertEqual(self.timeline_urls(user2), [ping2['url']])
+
+    def test_unblock_restores_followed_pings(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        self.follow(user1, user2)
+        ping = self.create_ping(user2['token'])
+
+        self.block(user1, user2)
+        self.assertEqual(self.timeline_urls(user1), [])
+        self.unblock(user1, user2)
+        self.assertEqual(self.timeline_urls(user1), [ping['url']])
+
+    def test_timelines_are_trimmed(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        pings = [self.create_ping(user2['token']) for _ in range(3)]
+        with override_settings(TIMELINE_BACKFILL_LENGTH=2):
+            self.follow(user1, user2)
+            self.assertEqual(self.timeline_urls(user1), [p['url'] for p in pings[:0:-1]])
+            ping = self.create_ping(user2['token'])
+            call_command('trim_timelines', stdout=StringIO())
+            self.assertEqual(self.timeline_urls(user1), [ping['url'], pings[-1]['url']])
+
+    def test_push_queries_do_not_grow_with_followers(self):
+        User.objects.bulk_create(
+            User(username=f'follower{idx}', username_key=f'follower{idx}') for idx in range(50)
+        )
+        author = self.create_user('author')
+        self.create_ping(author['token'])
+        ping = Ping.objects.get()
+        follower_ids = list(User.objects.exclude(pk=ping.user_id).values_list('pk', flat=True))
+        query_counts = []
+        for owner_ids in (follower_ids[:2], follower_ids[2:]):
+            with CaptureQueriesContext(connection) as queries:
+                get_store().push(ping, owner_ids)
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_rebuild_timelines(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        self.follow(user1, user2)
+        pings = [self.create_ping(user['token']) for user in (user1, user2)]
+
+        get_store().clear()
+        self.assertEqual(self.timeline_urls(user1), [])
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.timeline_urls(user1), [p['url'] for p in reversed(pings)])
+
+
+@override_settings(TIMELINE_STORE='timeline.store.LocalTimelineStore')
+class LocalStoreTimelineTests(FanoutTimelineTests):
+    "Run the fan-out tests against the in-memory timeline store"
+
+    def setUp(self):
+        super().setUp()
+        get_store().clear()
+
+    def test_new_pings_are_pushed_to_followers(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        self.follow(user1, user2)
+
+        ping = self.create_ping(user2['token'])
+        self.assertEqual(self.timeline_urls(user1), [ping['url']])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+
+@override_settings(
+    TIMELINE_FANOUT=True,
+    TIMELINE_CELEBRITY_THRESHOLD=2,
+    TIMELINE_CELEBRITY_RELEASE=2,
+)
+class HybridTimelineTests(TestToolsMixin, APITestCase):
+    "Pings by users with many followers are pulled rather than pushed"
+
+    def setUp(self):
+        super().setUp()
+        self.celebrity = self.create_user('celebrity')
+        self.fan1 = self.create_user('fan1')
+        self.fan2 = self.create_user('fan2')
+        self.follow(self.fan1, self.celebrity)
+        self.follow(self.fan2, self.celebrity)
+
+    def timeline_urls(self, user):
+        with self.client_as(user['token']) as auth_client:
+            return [ping['url'] for ping in auth_client.get('/timeline/').data['results']]
+
+    def test_celebrity_pings_are_not_pushed(self):
+        self.create_ping(self.celebrity['token'])
+        self.assertFalse(TimelineEntry.objects.filter(owner__username='fan1').exists())
+        self.assertEqual(TimelineEntry.objects.filter(owner__username='celebrity').count(), 1)
+
+    def test_pulled_pings_are_merged_in_order(self):
+        created_pings = []
+        for _ in range(2):
+            for user in (self.fan1, self.celebrity):
+                created_pings.append(self.create_ping(user['token']))
+                sleep(0.01)
+
+        self.assertEqual(
+            self.timeline_urls(self.fan1),
+            [p['url'] for p in reversed(created_pings)],
+        )
+
+    def test_merged_timeline_is_paginated(self):
+        for _ in range(PAGE_SIZE // 2 + 1):
+            for user in (self.fan1, self.celebrity):
+                self.create_ping(user['token'])
+
+        seen = []
+        url = '/timeline/'
+        with self.client_as(self.fan1['token']) as auth_client:
+            while url:
+                data = auth_client.get(url).data
+                seen.extend(ping['url'] for ping in data['results'])
+                url = data['next']
+        self.assertEqual(len(seen), PAGE_SIZE + 2)
+        self.assertEqual(len(set(seen)), len(seen))
+
+    def test_pulled_pings_respect_blocks(self):
+        self.create_ping(self.celebrity['token'])
+        self.block(self.celebrity, self.fan1)
+        self.assertEqual(self.timeline_urls(self.fan1), [])
+        self.assertEqual(len(self.timeline_urls(self.fan2)), 1)
+
+    def test_losing_celebrity_status_pushes_recent_pings(self):
+        old_ping = self.create_ping(self.celebrity['token'])
+        self.unfollow(self.fan2, self.celebrity)
+
+        # new pings are pushed straight away, and old ones are still pulled
+        new_ping = self.create_ping(self.celebrity['token'])
+        fan1_entries = TimelineEntry.objects.filter(owner__username='fan1')
+        self.assertEqual(fan1_entries.count(), 1)
+        self.assertEqual(self.timeline_urls(self.fan1), [new_ping['url'], old_ping['url']])
+
+        call_command('update_celebrities', stdout=StringIO())
+        self.assertEqual(fan1_entries.count(), 2)
+        self.assertFalse(Celebrity.objects.exists())
+        self.assertEqual(self.timeline_urls(self.fan1), [new_ping['url'], old_ping['url']])
+        self.assertEqual(self.timeline_urls(self.fan2), [])
+
+    @override_settings(TIMELINE_CELEBRITY_RELEASE=1)
+    def test_celebrity_status_is_kept_down_to_the_release_threshold(self):
+        self.unfollow(self.fan2, self.celebrity)
+        ping = self.create_ping(self.celebrity['token'])
+        self.assertFalse(TimelineEntry.objects.filter(owner__username='fan1').exists())
+        self.assertEqual(self.timeline_urls(self.fan1), [ping['url']])
+
+    def test_update_celebrities_uses_follower_counts(self):
+        Celebrity.objects.all().delete()
+        User.objects.filter(username='fan1').update(followed_count=2)
+        call_command('update_celebrities', stdout=StringIO())
+        self.assertEqual(
+            set(Celebrity.objects.values_list('user__username', flat=True)),
+            {'celebrity', 'fan1'},
+        )
+
+
+class WaitTests(TestToolsMixin, APITransactionTestCase):
+    "Notifications are only published once pings are committed, so these tests commit"
+
+    def setUp(self):
+        super().setUp()
+        self.reader = self.create_user('reader')
+        self.followed = self.create_user('followed')
+        self.stranger = self.create_user('stranger')
+        self.follow(self.reader, self.followed)
+
+    def user(self, user_data):
+        return User.objects.get(username=user_data['username'])
+
+    def wait(self, **params):
+        with self.client_as(self.reader['token']) as auth_client:
+            return auth_client.get('/timeline/wait/', params)
+
+    def publish_soon(self, channel):
+        timer = Timer(0.05, get_pubsub().publish, [channel, {'ping': 0}])
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+    def test_nothing_new_times_out(self):
+        response = self.wait(timeout=0.05)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_new_pings_wake_waiting_clients(self):
+        self.publish_soon(notify.author_channel(self.user(self.followed).pk))
+        started = monotonic()
+        response = self.wait(timeout=10)
+        self.assertLess(monotonic() - started, 5)
+        self.assertEqual(response.data, {'timeline': True, 'mentions': False})
+
+    def test_mentions_wake_waiting_clients(self):
+        self.publish_soon(notify.mentions_channel(self.user(self.reader).pk))
+        response = self.wait(timeout=10)
+        self.assertEqual(response.data, {'timeline': False, 'mentions': True})
+
+    def test_missed_pings_are_reported_straight_away(self):
+        head = self.create_ping(self.reader['token'])
+        sleep(0.01)
+        self.create_ping(self.stranger['token'], 'hi @reader')
+        response = self.wait(since=head['url'].rstrip('/').rsplit('/', 1)[-1], timeout=10)
+        self.assertEqual(response.data, {'timeline': False, 'mentions': True})
+
+    def test_since_must_be_an_existing_ping(self):
+        response = self.wait(since='12345', timeout=10)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def received(self, subscription):
+        return sorted(channel for channel, _ in subscription.get(0))
+
+    def test_pings_are_published_to_followers_and_mentioned_users(self):
+        reader_id = self.user(self.reader).pk
+        followed_id = self.user(self.followed).pk
+        with notify.subscribe(self.user(self.reader)) as subscription:
+            self.create_ping(self.followed['token'])
+            self.create_ping(self.stranger['token'])
+            self.assertEqual(self.received(subscription), [notify.author_channel(followed_id)])
+            self.create_ping(self.stranger['token'], 'hi @reader')
+            self.assertEqual(self.received(subscription), [notify.mentions_channel(reader_id)])
+
+    def test_pings_across_blocks_are_not_published(self):
+        self.block(self.reader, self.followed)
+        self.block(self.stranger, self.reader)
+        with notify.subscribe(self.user(self.reader)) as subscription:
+            self.create_ping(self.followed['token'])
+            self.create_ping(self.stranger['token'], 'hi @reader')
+            self.assertEqual(self.received(subscription), [])
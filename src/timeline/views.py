@@ -1,21 +1,109 @@
 from user.models import Follow
 
 from common.pagination import Pagination128
+from common.polling import SincePollingMixin, decode_since
+from django.conf import settings
 from django.db.models import Q, Subquery
-from ping.models import Ping
-from ping.views import PingSerializer
-from rest_framework import mixins, viewsets
+from ping.models import Ping, PingMention
+from ping.views import FlatPingSerializer, without_repeated_echoes
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import list_route
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from timeline import fanout, notify
 
 
-class TimelineViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
-    serializer_class = PingSerializer
+class TimelineViewSet(SincePollingMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    serializer_class = FlatPingSerializer
     pagination_class = Pagination128
     permission_classes = (IsAuthenticated,)
+    # the path from the rows of the queryset to their pings
+    prefix = ''
 
     def get_queryset(self):
-        follows = Follow.objects.filter(follower=self.request.user)
-        return Ping.objects_unblocked(self.request).filter(
-            Q(user=self.request.user) |
-            Q(user__in=Subquery(follows.values('followed')))
-        ).select_related('user', 'replying_to')
+        if fanout.enabled():
+            # the store has already applied follows and blocks at write time
+            pings, self.prefix = fanout.timeline_queryset(self.request)
+        else:
+            follows = Follow.objects.filter(follower=self.request.user)
+            pings = Ping.objects_unblocked(self.request).filter(
+                Q(user=self.request.user) |
+                Q(user__in=Subquery(follows.values('followed')))
+            )
+        # echoes are pings by the echoer; the author of the original counts too
+        pings = Ping.filter_unblocked(
+            pings, self.request, user_field=f'{self.prefix}echo_of__user'
+        )
+        return FlatPingSerializer.values(pings, prefix=self.prefix, viewer=self.request.user)
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, prefix=self.prefix, **kwargs)
+
+    def paginate_queryset(self, queryset):
+        return self.filter_page(super().paginate_queryset(queryset))
+
+    def filter_page(self, rows):
+        """
+        Drop echoes of pings which are already on the page
+
+        Pages are filtered after being cut, so that the cursors, which are
+        ordered by when each ping or echo was created, stay stable.
+        """
+        return without_repeated_echoes(rows, self.prefix)
+
+    @list_route()
+    def wait(self, request):
+        """
+        Long-poll for new pings in the logged-in user's timeline or mentions.
+
+        The request is held open until a ping is created by someone the user
+        follows, or by the user, or until a ping mentions the user, and then
+        answered with which of `timeline` and `mentions` have something new.
+        Clients then fetch those with `?since=`, and wait again. If nothing
+        happens within `?timeout=` seconds, at most
+        `settings.TIMELINE_WAIT_TIMEOUT`, the response is `204 No Content`.
+
+        With `?since=<ping id or cursor>`, pings created since then which the
+        client may have missed are reported straight away.
+
+        Each waiting client holds on to a worker thread, so this should be
+        served by a server with many cheap threads, i.e. gevent workers.
+        """
+        try:
+            timeout = float(request.query_params.get('timeout', settings.TIMELINE_WAIT_TIMEOUT))
+        except ValueError:
+            timeout = None
+        if timeout is None or not timeout >= 0:
+            return Response({'error': "timeout must be a number of seconds"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        timeout = min(timeout, settings.TIMELINE_WAIT_TIMEOUT)
+
+        # subscribe before checking, so that nothing can slip in between
+        with notify.subscribe(request.user) as subscription:
+            since = request.query_params.get('since')
+            if since is not None:
+                after = decode_since(since)
+                if after is None:
+                    return Response({'error': self.invalid_since_message},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                mentions = Ping.filter_unblocked(
+                    PingMention.objects.filter(user=request.user),
+                    request,
+                    user_field='ping__user',
+                )
+                missed = {
+                    'timeline': self.get_queryset().filter(created__gt=after).exists(),
+                    'mentions': mentions.filter(created__gt=after).exists(),
+                }
+                if any(missed.values()):
+                    return Response(missed)
+            messages = subscription.get(timeout)
+
+        if not messages:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        channels = {channel for channel, _ in messages}
+        mentions_channel = notify.mentions_channel(request.user.pk)
+        return Response({
+            'timeline': bool(channels - {mentions_channel}),
+            'mentions': mentions_channel in channels,
+        })
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class UserConfig(AppConfig):
     name = 'user'
+
+    def ready(self):
+        # connect the cache invalidation signal handlers, and register the checks
+        from user import checks, signals  # noqa: F401
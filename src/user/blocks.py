@@ -0,0 +1,58 @@
+"""
+Cache of the users each user has a block relation with.
+
+Most users have never blocked anyone and have never been blocked, so the
+block filtering in `Ping.filter_unblocked` usually has nothing to do.
+Rather than adding two `NOT IN (SELECT ...)` subqueries over `Block` to
+every timeline, mentions, and hashtag query, the set of user ids on the
+other side of a block from a given user is loaded once and kept in a
+process-local LRU cache.
+
+Each user's entry is tagged with a version which is kept in Django's cache
+framework, and which is replaced whenever a block involving that user is
+created or deleted. If a shared cache backend is configured, that
+invalidates the entries in every process. Entries also expire after
+`settings.BLOCK_CACHE_TTL` seconds, which bounds how long a process can miss
+a block made through another when the default cache isn't shared, or when
+the block was made without sending signals.
+"""
+from user.models import Block
+
+from common.cache import VersionedCache
+from django.conf import settings
+from django.db.models import Q
+
+_blocked_ids = VersionedCache(
+    'user:blocks', settings.BLOCK_CACHE_SIZE, ttl=settings.BLOCK_CACHE_TTL,
+)
+
+
+def invalidate(*user_ids):
+    "Discard the cached block relations of each of `user_ids`, in every process"
+    _blocked_ids.invalidate(*user_ids)
+
+
+def blocked_user_ids(user):
+    """
+    The ids of every user who has blocked `user` or has been blocked by `user`.
+
+    Returns a frozenset, which for most users is empty.
+    """
+    cached = _blocked_ids.get(user.pk)
+    if cached is not None:
+        return cached
+
+    version = _blocked_ids.version(user.pk)
+    ids = set()
+    for blocker_id, blocked_id in Block.objects.filter(
+        Q(blocker=user) | Q(blocked=user)
+    ).values_list('blocker', 'blocked'):
+        ids.add(blocked_id if blocker_id == user.pk else blocker_id)
+    ids = frozenset(ids)
+    _blocked_ids.set(user.pk, ids, user.pk, version)
+    return ids
+
+
+def clear():
+    "Forget everything in this process's cache"
+    _blocked_ids.clear()
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# backends which only cache within a single process, if at all
+UNSHARED_CACHE_BACKENDS = (
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    "In-process caches are only invalidated everywhere through a shared default cache"
+    if settings.CACHES['default']['BACKEND'] not in UNSHARED_CACHE_BACKENDS:
+        return []
+    return [Warning(
+        "The default cache isn't shared between processes, so blocks and follows made "
+        "through one process are only seen by the others once their cached entries expire.",
+        hint="Configure a shared backend, i.e. memcached, as the default cache.",
+        id='user.W001',
+    )]
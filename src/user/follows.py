@@ -0,0 +1,69 @@
+"""
+Cache of the usernames each user follows.
+
+Username completion ranks the users someone follows first, so it needs to
+know which of them start with a prefix. Rather than joining `Follow` into
+every completion query, each user's followed usernames are loaded once,
+sorted, and kept in a process-local LRU cache, where a prefix is a binary
+search away.
+
+Entries are versioned like those of `user.blocks`: the version is kept in
+Django's cache framework, and replaced whenever the user follows or
+unfollows someone, and entries expire after `settings.FOLLOW_CACHE_TTL`
+seconds in case the default cache isn't shared between processes.
+Usernames can't be changed, so they never go stale.
+"""
+from bisect import bisect_left
+from user.models import Follow
+
+from common.cache import VersionedCache
+from django.conf import settings
+
+_followed = VersionedCache(
+    'user:follows', settings.FOLLOW_CACHE_SIZE, ttl=settings.FOLLOW_CACHE_TTL,
+)
+
+
+def invalidate(*user_ids):
+    "Discard the cached follows of each of `user_ids`, in every process"
+    _followed.invalidate(*user_ids)
+
+
+def followed_usernames(user):
+    """
+    The `(username_key, id)` pairs of every user `user` follows.
+
+    Returns a tuple, sorted by `username_key`.
+    """
+    cached = _followed.get(user.pk)
+    if cached is not None:
+        return cached
+
+    version = _followed.version(user.pk)
+    followed = tuple(sorted(
+        Follow.objects.filter(follower=user).values_list('followed__username_key', 'followed')
+    ))
+    _followed.set(user.pk, followed, user.pk, version)
+    return followed
+
+
+def followed_with_prefix(user, prefix, limit, exclude=frozenset()):
+    """
+    The ids of the first `limit` users `user` follows whose `username_key` starts with `prefix`
+
+    Users whose ids are in `exclude` are skipped.
+    """
+    followed = followed_usernames(user)
+    ids = []
+    for idx in range(bisect_left(followed, (prefix,)), len(followed)):
+        key, user_id = followed[idx]
+        if not key.startswith(prefix) or len(ids) == limit:
+            break
+        if user_id not in exclude:
+            ids.append(user_id)
+    return ids
+
+
+def clear():
+    "Forget everything in this process's cache"
+    _followed.clear()
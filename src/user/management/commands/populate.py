@@ -0,0 +1,55 @@
+from time import perf_counter
+from user.mock import bulk_populate
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with random users, follows, blocks, pings, mentions, and hashtags "
+        "for load testing, on top of whatever the database already holds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--pings', type=int, default=100000)
+        parser.add_argument('--follows-per-user', type=int, default=16)
+        parser.add_argument('--blocks-per-user', type=int, default=2)
+        parser.add_argument('--hashtags', type=int, default=2000,
+                            help="How many distinct hashtags to use")
+        parser.add_argument('--days', type=int, default=30,
+                            help="Spread the pings over this many days before now")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--flush', action='store_true',
+                            help="Flush the whole database first, replacing its data")
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help="Don't ask for confirmation before flushing")
+
+    def handle(self, *args, flush, interactive, **options):
+        if flush and interactive:
+            confirm = input(
+                "This will delete ALL the data in the database "
+                f"{connection.settings_dict['NAME']!r}, and replace it with random data.\n"
+                "Type 'yes' to continue, or 'no' to cancel: "
+            )
+            if confirm != 'yes':
+                raise CommandError("Populating cancelled.")
+        started = perf_counter()
+        bulk_populate(
+            users=options['users'],
+            pings=options['pings'],
+            follows_per_user=options['follows_per_user'],
+            blocks_per_user=options['blocks_per_user'],
+            days=options['days'],
+            hashtags=options['hashtags'],
+            seed=options['seed'],
+            chunk_size=options['chunk_size'],
+            clear_first=flush,
+            log=self.stdout.write,
+        )
+        self.stdout.write(f"done in {perf_counter() - started:.1f}s")
+        if settings.TIMELINE_FANOUT:
+            self.stdout.write("timelines were not updated; run `manage.py rebuild_timelines`")
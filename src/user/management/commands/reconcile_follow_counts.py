@@ -0,0 +1,11 @@
+from user.models import Follow
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Recount every user's denormalized follow counts from the Follow table."
+
+    def handle(self, *args, **options):
+        fixed = Follow.objects.reconcile_counts()
+        self.stdout.write(f"fixed the follow counts of {fixed} users")
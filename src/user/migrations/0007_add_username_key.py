@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-17 02:01
+from __future__ import unicode_literals
+
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 1000
+
+
+def fill_username_keys(apps, schema_editor):
+    User = apps.get_model('user', 'User')
+    last_pk = 0
+    while True:
+        # commit each batch separately, so large tables aren't locked for the whole backfill
+        with transaction.atomic():
+            batch = list(
+                User.objects
+                .filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', 'username')[:BATCH_SIZE]
+            )
+            for pk, username in batch:
+                # lower-case in python, like `User.save`, rather than with the
+                # database's LOWER(), which may not handle non-ascii names
+                User.objects.filter(pk=pk).update(username_key=username.lower())
+        if len(batch) < BATCH_SIZE:
+            break
+        last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('user', '0006_add_follow_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='username_key',
+            field=models.CharField(editable=False, max_length=150, null=True),
+        ),
+        migrations.RunPython(fill_username_keys, migrations.RunPython.noop),
+        # fails if two existing usernames only differ in case; rename one of them first
+        migrations.AlterField(
+            model_name='user',
+            name='username_key',
+            field=models.CharField(editable=False, max_length=150, unique=True),
+        ),
+    ]
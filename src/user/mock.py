@@ -1,13 +1,22 @@
+from collections import Counter
 from datetime import timedelta
 from itertools import islice
-from random import choice, randint, sample
+from random import Random, choice, randint, sample
 from unittest import mock
 from user.models import Block, Follow, User
 
-from common.mock import WORDLIST, gen_text, gen_times
-from django.db import IntegrityError
-from ping.mock import gen_pings_for
+from common.mock import (
+    WORDLIST, explicit_timestamps, gen_text, gen_times, next_pk, reset_sequences, truncate,
+    zipf_cum_weights,
+)
+from common.utils import chunks
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.utils.timezone import now
+from ping.mock import bulk_create_pings, gen_pings_for
 from ping.models import Ping
+from search import index
 
 
 def create_user_at(when):
@@ -63,7 +72,7 @@ def generate_follows(target_qty, clear_first=True):
     all_users = list(User.objects.all())
     while Follow.objects.count() < target_qty:
         origin, recipient = sample(all_users, 2)
-        Follow.objects.get_or_create(follower=origin, followed=recipient)
+        Follow.objects.follow(origin, recipient)
 
 
 def generate_blocks(target_qty, clear_first=True):
@@ -85,3 +94,115 @@ def populate(qty, clear_first=True, follows_per_user=16, blocks_per_user=2):
     generate_follows(qty * follows_per_user, clear_first)
     print("generating blocks...")
     generate_blocks(qty * blocks_per_user, clear_first)
+
+
+# words which can start a username without looking odd in a mention
+USERNAME_WORDS = [word for word in WORDLIST if word.isalpha()]
+
+
+def bulk_populate(users=10000, pings=100000, follows_per_user=16, blocks_per_user=2,
+                  days=30, hashtags=2000, seed=0, chunk_size=10000, clear_first=False, log=print):
+    """
+    Bulk-create a realistic dataset for load testing
+
+    Unlike `populate`, this builds every row in memory and inserts them with
+    `bulk_create`, `chunk_size` rows at a time, so a database of a million
+    pings takes minutes rather than hours. Everything is drawn from
+    `random.Random(seed)`, so the same arguments produce the same dataset.
+
+    - users join during the year before the `days` over which pings are spread
+    - each user follows `follows_per_user` others on average, drawn with a
+        Zipf distribution, so a few users have most of the followers
+    - `blocks_per_user * users` blocks are drawn uniformly
+    - see `bulk_create_pings` for the pings, mentions, and hashtags
+
+    Denormalized columns, like the follow counts and `username_key`, are
+    computed here, and the search index is rebuilt at the end, since
+    `bulk_create` doesn't call `save`. With `clear_first`, the whole database
+    is flushed first.
+    """
+    rng = Random(seed)
+    if clear_first:
+        log("clearing existing data...")
+        # much faster than deleting the users and cascading, which loads every row
+        call_command('flush', interactive=False, verbosity=0)
+    end = now()
+    start = end - timedelta(days=days)
+
+    first_id = next_pk(User)
+    password = make_password(None)
+    user_objs = []
+    for user_id in range(first_id, first_id + users):
+        # the id suffix keeps usernames unique
+        username = f"{rng.choice(USERNAME_WORDS).lower()}{user_id}"
+        user_objs.append(User(
+            id=user_id,
+            username=username,
+            username_key=username.lower(),
+            password=password,
+            first_name=rng.choice(WORDLIST) if rng.random() < 0.5 else '',
+            last_name=rng.choice(WORDLIST) if rng.random() < 0.5 else '',
+            blurb=truncate(' '.join(rng.choices(WORDLIST, k=rng.randint(1, 20))))
+            if rng.random() < 0.5 else '',
+            date_joined=start - timedelta(days=365) * rng.random(),
+        ))
+    user_ids = [user.id for user in user_objs]
+
+    popular = user_ids[:]
+    rng.shuffle(popular)
+    popular_weights = zipf_cum_weights(len(popular))
+    follows = []
+    for follower in user_ids:
+        qty = min(users - 1, round(rng.expovariate(1 / follows_per_user)))
+        followed = set(rng.choices(popular, cum_weights=popular_weights, k=qty))
+        followed.discard(follower)
+        follows.extend((follower, target) for target in followed)
+    following_count = Counter(follower for follower, _ in follows)
+    followed_count = Counter(followed for _, followed in follows)
+    for user in user_objs:
+        user.following_count = following_count[user.id]
+        user.followed_count = followed_count[user.id]
+
+    blocks = set()
+    block_qty = min(blocks_per_user * users, users * (users - 1))
+    while len(blocks) < block_qty:
+        blocker, blocked = rng.choice(user_ids), rng.choice(user_ids)
+        if blocker != blocked:
+            blocks.add((blocker, blocked))
+
+    def created():
+        return start + (end - start) * rng.random()
+
+    with explicit_timestamps(Follow, Block):
+        for chunk in chunks(user_objs, chunk_size):
+            User.objects.bulk_create(chunk)
+        log(f"created {len(user_objs)} users")
+        for chunk in chunks(follows, chunk_size):
+            with transaction.atomic():
+                Follow.objects.bulk_create(
+                    Follow(follower_id=follower, followed_id=followed, created=created())
+                    for follower, followed in chunk
+                )
+        log(f"created {len(follows)} follows")
+        for chunk in chunks(sorted(blocks), chunk_size):
+            with transaction.atomic():
+                Block.objects.bulk_create(
+                    Block(blocker_id=blocker, blocked_id=blocked, created=created())
+                    for blocker, blocked in chunk
+                )
+        log(f"created {len(blocks)} blocks")
+
+    authors = [(user.id, user.username) for user in user_objs]
+    rng.shuffle(authors)
+    bulk_create_pings(
+        rng,
+        authors,
+        pings,
+        start,
+        end,
+        hashtags=rng.sample(WORDLIST, min(hashtags, len(WORDLIST))),
+        chunk_size=chunk_size,
+        log=log,
+    )
+    reset_sequences(User, Ping)
+    index.rebuild(chunk_size=chunk_size, log=log)
@@ -1,12 +1,29 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser, UserManager
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def username_key(username):
+    "The normalized form of `username` under which it's unique"
+    return username.lower()
 
 
 class CaseInsensitiveUserManager(UserManager):
+    """
+    Look users up by username, ignoring case.
+
+    Every lookup goes through the unique `username_key` column rather than
+    `username__iexact`, which most backends can't answer from an index.
+    """
+
     def get_by_natural_key(self, username):
-        case_insensitive_username_field = f"{self.model.USERNAME_FIELD}__iexact"
-        return self.get(**{case_insensitive_username_field: username})
+        return self.get(username_key=username_key(username))
+
+    def filter_by_natural_keys(self, usernames):
+        "Select every user whose username is in `usernames`, ignoring case."
+        return self.filter(username_key__in={username_key(username) for username in usernames})
 
 
 class User(AbstractUser):
@@ -22,7 +39,14 @@ class User(AbstractUser):
     is compensated for by the reduction in overall system complexity.
 
     Also, we want usernames to be case-insensitive; per a Django wart,
-    by default they're case-sensitive.
+    by default they're case-sensitive. `username_key` holds the lower-cased
+    username under a unique index; it's kept in sync by `save`, so updating
+    `username` with `QuerySet.update` must set it too.
+
+    The follow counts are denormalized from the Follow table, so that they
+    can be displayed without counting. They're maintained by
+    `Follow.objects.follow` and `Follow.objects.unfollow`; any drift can be
+    fixed with the `reconcile_follow_counts` command.
     """
     objects = CaseInsensitiveUserManager()
 
@@ -32,6 +56,72 @@ class User(AbstractUser):
         null=False,
         default="",
     )
+    username_key = models.CharField(max_length=150, unique=True, editable=False)
+    following_count = models.PositiveIntegerField(default=0)
+    followed_count = models.PositiveIntegerField(default=0)
+
+    def save(self, *args, **kwargs):
+        self.username_key = username_key(self.username)
+        super().save(*args, **kwargs)
+
+
+class FollowManager(models.Manager):
+    def follow(self, follower, followed):
+        """
+        Make `follower` follow `followed`, updating both users' follow counts.
+
+        Returns `(follow, created)`, like `get_or_create`.
+        """
+        with transaction.atomic():
+            follow, created = self.get_or_create(follower=follower, followed=followed)
+            if created:
+                self._adjust_counts(follower, followed, 1)
+        return follow, created
+
+    def unfollow(self, follower, followed):
+        """
+        Make `follower` stop following `followed`, updating both users' follow counts.
+
+        Returns whether `follower` was following `followed`.
+        """
+        with transaction.atomic():
+            deleted, _ = self.filter(follower=follower, followed=followed).delete()
+            if deleted:
+                self._adjust_counts(follower, followed, -1)
+        return bool(deleted)
+
+    def reconcile_counts(self):
+        """
+        Recount every user's follow counts from the Follow table, in bulk.
+
+        Returns the number of users whose counts had drifted.
+        """
+        def count_of(field):
+            counts = (
+                self.filter(**{field: OuterRef('pk')})
+                .order_by()
+                .values(field)
+                .annotate(count=Count('pk'))
+                .values('count')
+            )
+            return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+        drifted = User.objects.annotate(
+            actual_following=count_of('follower'),
+            actual_followed=count_of('followed'),
+        ).exclude(
+            following_count=F('actual_following'),
+            followed_count=F('actual_followed'),
+        )
+        return User.objects.filter(pk__in=Subquery(drifted.values('pk'))).update(
+            following_count=count_of('follower'),
+            followed_count=count_of('followed'),
+        )
+
+    @staticmethod
+    def _adjust_counts(follower, followed, delta):
+        User.objects.filter(pk=follower.pk).update(following_count=F('following_count') + delta)
+        User.objects.filter(pk=followed.pk).update(followed_count=F('followed_count') + delta)
 
 
 class Follow(models.Model):
@@ -56,6 +146,8 @@ class Follow(models.Model):
     )
     created = models.DateTimeField(auto_now_add=True, db_index=True)
 
+    objects = FollowManager()
+
     class Meta:
         unique_together = (
             ('follower', 'followed'),
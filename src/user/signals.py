@@ -0,0 +1,34 @@
+from user import blocks, follows
+from user.models import Block, Follow, User
+
+from common import authentication
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+
+@receiver(post_save, sender=Block)
+@receiver(post_delete, sender=Block)
+def block_changed(sender, instance, **kwargs):
+    blocks.invalidate(instance.blocker_id, instance.blocked_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    follows.invalidate(instance.follower_id)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_changed(sender, instance, **kwargs):
+    authentication.invalidate(instance.key)
+    authentication.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    # i.e. deactivation has to take effect immediately
+    if not created:
+        authentication.invalidate(*Token.objects.filter(user=instance).values_list('key', flat=True))
+        authentication.invalidate_user(instance.pk)
@@ -1,8 +1,23 @@
-from user.models import Follow, User
-
+from datetime import timedelta
+from io import StringIO
+from time import monotonic
+from unittest import mock
+from user import blocks, checks
+from user.mock import bulk_populate
+from user.models import Block, Follow, User
+
+from common import authentication
 from common.testing import TestToolsMixin
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Max, Min
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from ping.models import Ping, parse_content
 from rest_framework import status
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase
 
 
@@ -170,6 +185,52 @@ class UserTests(TestToolsMixin, APITestCase):
         self.assertEqual(stats['following'], 0)
         self.assertEqual(stats['followed'], 1)
 
+    def test_follow_stats_is_a_single_query(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        self.follow(user1, user2)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(user2['url'] + 'follow-stats/')
+        self.assertEqual(len(queries), 1)
+
+    def test_follow_counts_in_user_data(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        self.follow(user1, user2)
+        self.follow(user1, user2)
+
+        data = self.client.get(user1['url']).data
+        self.assertEqual(data['following_count'], 1)
+        self.assertEqual(data['followed_count'], 0)
+        data = self.client.get(user2['url']).data
+        self.assertEqual(data['following_count'], 0)
+        self.assertEqual(data['followed_count'], 1)
+
+    def test_follow_counts_are_read_only(self):
+        user = self.create_user()
+        with self.client_as(user['token']) as auth_client:
+            auth_client.patch(user['url'], {'followed_count': 1000}, format='json')
+        self.assertEqual(User.objects.get().followed_count, 0)
+
+    def test_reconcile_follow_counts(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        self.follow(user1, user2)
+        # bypass the follow manager so that the counts drift
+        Follow.objects.create(
+            follower=User.objects.get(username='user2'),
+            followed=User.objects.get(username='user1'),
+        )
+        User.objects.filter(username='user1').update(following_count=7)
+
+        self.assertEqual(Follow.objects.reconcile_counts(), 2)
+        call_command('reconcile_follow_counts', stdout=StringIO())
+        for user in User.objects.all():
+            self.assertEqual(user.following_count, 1)
+            self.assertEqual(user.followed_count, 1)
+        self.assertEqual(Follow.objects.reconcile_counts(), 0)
+
     def test_user_cannot_follow_self(self):
         user = self.create_user('user')
         follow_resp = self.follow(user, user)
@@ -258,3 +319,344 @@ class UserTests(TestToolsMixin, APITestCase):
         ):
             follower_urls = self.followed_by_urls(followed)
             self.assertEqual({f['url'] for f in followers}, follower_urls)
+
+
+class UsernameKeyTests(TestToolsMixin, APITestCase):
+    "Usernames are looked up case-insensitively, through the indexed `username_key`"
+
+    def setUp(self):
+        super().setUp()
+        # usernames are lower-cased on signup, but not by `create_user`
+        self.user = User.objects.create_user(username='MixedCase', password='password')
+
+    def assert_uses_key(self, func):
+        with CaptureQueriesContext(connection) as queries:
+            result = func()
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertIn('username_key', sql)
+        self.assertNotIn('LIKE', sql)
+        return result
+
+    def test_key_is_maintained(self):
+        self.assertEqual(self.user.username_key, 'mixedcase')
+        self.user.username = 'Renamed'
+        self.user.save()
+        self.assertEqual(User.objects.get(pk=self.user.pk).username_key, 'renamed')
+
+    def test_get_by_natural_key(self):
+        user = self.assert_uses_key(lambda: User.objects.get_by_natural_key('mIXEDcASE'))
+        self.assertEqual(user, self.user)
+
+    def test_login_ignores_case(self):
+        response = self.client.post(
+            '/get-token/', {'username': 'mixedcase', 'password': 'password'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_signup_conflict_ignores_case(self):
+        response = self.assert_uses_key(lambda: self.create_user('MIXEDCASE', data_only=False))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_detail_lookup_ignores_case(self):
+        response = self.assert_uses_key(lambda: self.client.get('/users/mixedcase/'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['username'], 'MixedCase')
+        self.assertEqual(self.client.get('/users/nobody/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_mentions_ignore_case(self):
+        ping = self.assert_uses_key(
+            lambda: Ping.objects.create(user=self.user, text='talking to @MIXEDCASE')
+        )
+        self.assertEqual(list(ping.mentions.all()), [self.user])
+
+
+class UserCompletionTests(TestToolsMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('composer')
+        for username in ('Alice', 'alfred', 'albert', 'alan', 'bob', 'al'):
+            setattr(self, username.lower(), self.create_user(username))
+        self.follow(self.user, self.albert)
+        self.follow(self.user, self.bob)
+
+    def complete(self, prefix, **params):
+        with self.client_as(self.user['token']) as auth_client:
+            return auth_client.get('/users/complete/', {'prefix': prefix, **params})
+
+    def usernames(self, prefix, **params):
+        response = self.complete(prefix, **params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(user['username'], user['following']) for user in response.data['results']]
+
+    def test_followed_users_come_first(self):
+        self.assertEqual(self.usernames('AL'), [
+            ('albert', True),
+            ('al', False),
+            ('alan', False),
+            ('alfred', False),
+            ('alice', False),
+        ])
+        self.assertEqual(self.usernames('@ali'), [('alice', False)])
+        self.assertEqual(self.usernames('alb'), [('albert', True)])
+        self.assertEqual(self.usernames('b'), [('bob', True)])
+        self.assertEqual(self.usernames('zed'), [])
+
+    def test_limit(self):
+        self.assertEqual(self.usernames('al', limit=2), [('albert', True), ('al', False)])
+
+    def test_blocked_users_and_self_are_left_out(self):
+        self.block(self.albert, self.user)
+        self.block(self.user, self.alan)
+        self.assertEqual(
+            [username for username, _ in self.usernames('al')],
+            ['al', 'alfred', 'alice'],
+        )
+        self.assertEqual(self.usernames('comp'), [])
+
+    def test_follows_are_cached_and_invalidated(self):
+        self.usernames('al')
+        with CaptureQueriesContext(connection) as queries:
+            self.usernames('al')
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('LIKE', queries[0]['sql'])
+
+        self.follow(self.user, self.alfred)
+        self.assertEqual(
+            [username for username, following in self.usernames('al') if following],
+            ['albert', 'alfred'],
+        )
+        self.unfollow(self.user, self.albert)
+        self.assertEqual(
+            [username for username, following in self.usernames('al') if following],
+            ['alfred'],
+        )
+
+    def test_cached_follows_expire(self):
+        self.usernames('al')
+        # as if made through another process, without a shared cache to invalidate
+        Follow.objects.bulk_create([Follow(
+            follower=User.objects.get(username='composer'),
+            followed=User.objects.get(username='alan'),
+        )])
+        self.assertEqual(self.usernames('alan'), [('alan', False)])
+        expired = monotonic() + settings.FOLLOW_CACHE_TTL + 1
+        with mock.patch('common.cache.monotonic', return_value=expired):
+            self.assertEqual(self.usernames('alan'), [('alan', True)])
+
+    def test_prefix_is_required(self):
+        for prefix in ('', '@'):
+            self.assertEqual(self.complete(prefix).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BlockCacheTests(TestToolsMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = self.create_user('user1')
+        self.user2 = self.create_user('user2')
+        self.user3 = self.create_user('user3')
+
+    def blocked_usernames(self, username):
+        return {
+            user.username for user in
+            User.objects.filter(pk__in=blocks.blocked_user_ids(User.objects.get(username=username)))
+        }
+
+    def test_blocks_are_bidirectional(self):
+        self.block(self.user1, self.user2)
+        self.block(self.user3, self.user1)
+        self.assertEqual(self.blocked_usernames('user1'), {'user2', 'user3'})
+        self.assertEqual(self.blocked_usernames('user2'), {'user1'})
+        self.assertEqual(self.blocked_usernames('user3'), {'user1'})
+
+    def test_blocks_are_cached(self):
+        self.block(self.user1, self.user2)
+        user = User.objects.get(username='user1')
+        blocks.blocked_user_ids(user)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(blocks.blocked_user_ids(user)), 1)
+        self.assertEqual(len(queries), 0)
+
+    def test_cache_is_invalidated_by_blocks(self):
+        self.assertEqual(self.blocked_usernames('user2'), set())
+        self.block(self.user1, self.user2)
+        self.assertEqual(self.blocked_usernames('user2'), {'user1'})
+        self.unblock(self.user1, self.user2)
+        self.assertEqual(self.blocked_usernames('user2'), set())
+
+    def test_cache_is_invalidated_by_orm_changes(self):
+        self.assertEqual(self.blocked_usernames('user2'), set())
+        Block.objects.create(
+            blocker=User.objects.get(username='user1'),
+            blocked=User.objects.get(username='user2'),
+        )
+        self.assertEqual(self.blocked_usernames('user2'), {'user1'})
+        Block.objects.all().delete()
+        self.assertEqual(self.blocked_usernames('user2'), set())
+
+    def test_cached_blocks_expire(self):
+        user = User.objects.get(username='user1')
+        blocks.blocked_user_ids(user)
+        # as if made through another process, without a shared cache to invalidate
+        Block.objects.bulk_create([Block(blocker=user, blocked=User.objects.get(username='user2'))])
+        self.assertEqual(blocks.blocked_user_ids(user), frozenset())
+        expired = monotonic() + settings.BLOCK_CACHE_TTL + 1
+        with mock.patch('common.cache.monotonic', return_value=expired):
+            self.assertEqual(len(blocks.blocked_user_ids(user)), 1)
+
+    def test_deploy_check_warns_of_unshared_cache(self):
+        self.assertEqual([warning.id for warning in checks.check_shared_cache(None)], ['user.W001'])
+        memcached = {'default': {'BACKEND': 'django.core.cache.backends.memcached.PyLibMCCache'}}
+        with override_settings(CACHES=memcached):
+            self.assertEqual(checks.check_shared_cache(None), [])
+
+    def test_unblocked_users_skip_block_filtering(self):
+        with self.client_as(self.user1['token']) as auth_client:
+            auth_client.get('/mentions/')
+            with CaptureQueriesContext(connection) as queries:
+                auth_client.get('/mentions/')
+        self.assertFalse(any('user_block' in query['sql'] for query in queries))
+
+
+class TokenCacheTests(TestToolsMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+
+    def get_following(self):
+        with self.client_as(self.user['token']) as auth_client:
+            return auth_client.get('/users/following/')
+
+    def test_token_lookups_are_cached(self):
+        self.get_following()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_following()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('authtoken_token' in query['sql'] for query in queries))
+        self.assertEqual(authentication.stats()['local_hits'], 1)
+        self.assertEqual(authentication.stats()['local_misses'], 1)
+
+    def test_deleted_token_is_rejected(self):
+        self.get_following()
+        Token.objects.all().delete()
+        self.assertEqual(self.get_following().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_rejected(self):
+        self.get_following()
+        user = User.objects.get()
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.get_following().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivation_through_another_process_is_seen(self):
+        self.get_following()
+        user = User.objects.get()
+        user.is_active = False
+        # another process can't drop this process's cached tokens by key
+        with mock.patch.object(authentication, 'invalidate'):
+            user.save()
+        self.assertEqual(self.get_following().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_user_is_rejected(self):
+        self.get_following()
+        User.objects.all().delete()
+        self.assertEqual(self.get_following().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_invalid_tokens_are_not_cached(self):
+        with self.client_as('not-a-token') as auth_client:
+            auth_client.get('/users/following/')
+        self.assertEqual(authentication.stats()['local_size'], 0)
+
+
+class ConditionalGetTests(TestToolsMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.key = self.user['token']
+
+    def assertNotModified(self, url, max_queries):
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertLessEqual(len(queries), max_queries)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('Authorization', response['Vary'])
+        return etag
+
+    def assertModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_user_is_not_modified_until_edited(self):
+        etag = self.assertNotModified(self.user['url'], max_queries=1)
+        with self.client_as(self.key) as auth_client:
+            auth_client.patch(self.user['url'], {'blurb': 'hello'}, format='json')
+        self.assertEqual(self.assertModified(self.user['url'], etag).data['blurb'], 'hello')
+
+    def test_user_is_modified_by_follows(self):
+        etag = self.client.get(self.user['url'])['ETag']
+        self.follow(self.create_user('other'), self.user)
+        self.assertModified(self.user['url'], etag)
+
+    def test_timeline_is_not_modified_until_pinged(self):
+        url = self.user['url'] + 'timeline/'
+        self.create_ping(self.key, 'first')
+        etag = self.assertNotModified(url, max_queries=2)
+        self.create_ping(self.key, 'second')
+        response = self.assertModified(url, etag)
+        self.assertEqual([ping['text'] for ping in response.data['results']], ['second', 'first'])
+
+    def test_timeline_is_modified_by_replies(self):
+        url = self.user['url'] + 'timeline/'
+        ping = self.create_ping(self.key)
+        etag = self.client.get(url)['ETag']
+        self.create_reply(self.create_user('other')['token'], ping)
+        self.assertModified(url, etag)
+
+
+class BulkPopulateTests(TestCase):
+    def populate(self, **kwargs):
+        bulk_populate(
+            users=50, pings=300, follows_per_user=5, blocks_per_user=1, hashtags=20,
+            days=10, chunk_size=100, clear_first=False, log=lambda message: None, **kwargs
+        )
+
+    def test_populated_data_is_consistent(self):
+        self.populate()
+        self.assertEqual(User.objects.count(), 50)
+        self.assertEqual(Ping.objects.count(), 300)
+        self.assertTrue(Follow.objects.exists())
+        self.assertEqual(Block.objects.count(), 50)
+        # denormalized columns were computed correctly
+        self.assertEqual(Follow.objects.reconcile_counts(), 0)
+        for user in User.objects.all():
+            self.assertEqual(user.username_key, user.username.lower())
+        # timestamps were kept, rather than set to the time of insertion
+        span = Ping.objects.aggregate(first=Min('created'), last=Max('created'))
+        self.assertGreater(span['last'] - span['first'], timedelta(days=9))
+        # and mentions and hashtags are linked as if the pings had been saved
+        for ping in Ping.objects.all()[:50]:
+            usernames, hashtag_names = parse_content(ping.text)
+            self.assertEqual({user.username for user in ping.mentions.all()}, usernames)
+            self.assertEqual({hashtag.name for hashtag in ping.hashtags.all()}, hashtag_names)
+
+    def test_same_seed_same_data(self):
+        self.populate(seed=1)
+        first = list(Ping.objects.order_by('pk').values_list('user__username', 'text'))
+        call_command('flush', interactive=False, verbosity=0)
+        self.populate(seed=1)
+        self.assertEqual(
+            list(Ping.objects.order_by('pk').values_list('user__username', 'text')),
+            first,
+        )
+
+    def test_command_only_flushes_when_asked(self):
+        User.objects.create_user('existing')
+        sizes = {'users': 10, 'pings': 20, 'hashtags': 5, 'days': 2}
+        call_command('populate', stdout=StringIO(), **sizes)
+        self.assertEqual(User.objects.count(), 11)
+        with mock.patch('builtins.input', return_value='no'):
+            with self.assertRaises(CommandError):
+                call_command('populate', flush=True, stdout=StringIO(), **sizes)
+        self.assertTrue(User.objects.filter(username='existing').exists())
@@ -1,19 +1,27 @@
-from user.models import Block, Follow, User
+from user import follows
+from user.blocks import blocked_user_ids
+from user.models import Block, Follow, User, username_key
 
+from common.conditional import conditional_response, make_etag
+from common.fields import FastHyperlinkedIdentityField
 from common.pagination import Pagination128
 from common.permissions import IsOwnerOrReadOnly
+from django.conf import settings
 from django.contrib.auth.password_validation import validate_password
-from ping.models import Ping
-from ping.views import PingSerializer
+from django.db.models import Q
+from ping.models import Like, Ping
+from ping.views import FlatPingSerializer, ping_versions
 from rest_framework import mixins, serializers, status, viewsets
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import detail_route, list_route
+from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
-    url = serializers.HyperlinkedIdentityField(
+    url = FastHyperlinkedIdentityField(
         view_name='user-detail',
         lookup_field='username',
     )
@@ -27,10 +35,14 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
             'last_name',
             'email',
             'blurb',
+            'following_count',
+            'followed_count',
         )
 
         read_only_fields = (
             'username',
+            'following_count',
+            'followed_count',
         )
 
 
@@ -47,6 +59,8 @@ class CreateUserSerializer(UserSerializer):
 
         read_only_fields = (
             'token',
+            'following_count',
+            'followed_count',
         )
 
     def validate_password(self, pw):
@@ -54,7 +68,7 @@ class CreateUserSerializer(UserSerializer):
         return pw
 
     def validate_username(self, username):
-        if User.objects.filter(username__iexact=username).exists():
+        if User.objects.filter(username_key=username_key(username)).exists():
             raise serializers.ValidationError("This username already exists")
         return username.lower()
 
@@ -132,6 +146,28 @@ class UserViewSet(mixins.CreateModelMixin,
             return CreateUserSerializer
         return UserSerializer
 
+    def get_object(self):
+        "Look the user up by username, ignoring case"
+        queryset = self.filter_queryset(self.get_queryset())
+        user = get_object_or_404(queryset, username_key=username_key(self.kwargs[self.lookup_field]))
+        self.check_object_permissions(self.request, user)
+        return user
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Retrieve a user, or respond `304 Not Modified` if the client's copy is current.
+
+        The version is the user's serialized fields, so a match only skips
+        serializing and rendering them.
+        """
+        user = self.get_object()
+        fields = [field for field in UserSerializer.Meta.fields if field != 'url']
+        return conditional_response(
+            request,
+            make_etag(request, 'user', user.pk, *(getattr(user, field) for field in fields)),
+            lambda: Response(self.get_serializer(user).data),
+        )
+
     def perform_create(self, serializer):
         """
         Override perform_create to use the create_user function.
@@ -147,6 +183,13 @@ class UserViewSet(mixins.CreateModelMixin,
             self._timeline_paginator = Pagination128()
         return self._timeline_paginator
 
+    @property
+    def likes_paginator(self):
+        "Paginator for use with the likes view"
+        if not hasattr(self, '_likes_paginator'):
+            self._likes_paginator = Pagination128()
+        return self._likes_paginator
+
     @property
     def following_paginator(self):
         "Paginator for use with the following view"
@@ -179,14 +222,54 @@ class UserViewSet(mixins.CreateModelMixin,
         # It appears to work, but at this would be an excellent candidate for
         # proper stress-testing at some point.
         user = self.get_object()
-        pings_qs = Ping.objects.filter(user=user).select_related('user', 'replying_to')
-        page = self.timeline_paginator.paginate_queryset(pings_qs, request)
-        serializer = PingSerializer(
+        pings = Ping.objects.filter(user=user)
+
+        # the version of the page is the version of each ping on it, which is
+        # read with a narrow query before fetching and serializing the page
+        versions = Pagination128()
+        version = versions.paginate_queryset(ping_versions(pings, request.user), request)
+        etag = make_etag(
+            request, 'timeline', user.pk, versions.has_next,
+            *(tuple(ping.values()) for ping in version),
+        )
+
+        def get_response():
+            page = self.timeline_paginator.paginate_queryset(
+                FlatPingSerializer.values(pings, viewer=request.user), request,
+            )
+            serializer = FlatPingSerializer(
+                page,
+                many=True,
+                context={'request': request},
+            )
+            return self.timeline_paginator.get_paginated_response(serializer.data)
+
+        return conditional_response(request, etag, get_response)
+
+    @detail_route()
+    def likes(self, request, username):
+        """
+        View providing a paginated list of the pings a user likes, most recently liked first.
+
+        This pages through the user's likes rather than the pings, so every
+        page is a range scan over the `(user, created)` index of likes.
+        """
+        user = self.get_object()
+        likes = Ping.filter_unblocked(
+            Like.objects.filter(user=user),
+            request,
+            user_field='ping__user',
+        )
+        page = self.likes_paginator.paginate_queryset(
+            FlatPingSerializer.values(likes, prefix='ping__', viewer=request.user), request,
+        )
+        serializer = FlatPingSerializer(
             page,
             many=True,
+            prefix='ping__',
             context={'request': request},
         )
-        return self.timeline_paginator.get_paginated_response(serializer.data)
+        return self.likes_paginator.get_paginated_response(serializer.data)
 
     @detail_route(methods=['post'], permission_classes=[IsAuthenticated])
     def follow(self, request, username):
@@ -197,7 +280,7 @@ class UserViewSet(mixins.CreateModelMixin,
         followed = self.get_object()
 
         if follower != followed:
-            follow, created = Follow.objects.get_or_create(follower=follower, followed=followed)
+            follow, created = Follow.objects.follow(follower, followed)
             if created:
                 r_status = status.HTTP_201_CREATED
             else:
@@ -221,7 +304,7 @@ class UserViewSet(mixins.CreateModelMixin,
         followed = self.get_object()
 
         if follower != followed:
-            Follow.objects.filter(follower=follower, followed=followed).delete()
+            Follow.objects.unfollow(follower, followed)
             return Response(
                 status=status.HTTP_204_NO_CONTENT
             )
@@ -237,9 +320,7 @@ class UserViewSet(mixins.CreateModelMixin,
         View which returns some follow statistics about the given user.
         """
         user = self.get_object()
-        following = Follow.objects.filter(follower=user).count()
-        followed = Follow.objects.filter(followed=user).count()
-        return Response({'following': following, 'followed': followed})
+        return Response({'following': user.following_count, 'followed': user.followed_count})
 
     @list_route(permission_classes=[IsAuthenticated])
     def following(self, request):
@@ -255,6 +336,65 @@ class UserViewSet(mixins.CreateModelMixin,
         )
         return self.following_paginator.get_paginated_response(serializer.data)
 
+    @list_route(permission_classes=[IsAuthenticated])
+    def complete(self, request):
+        """
+        View suggesting users whose usernames start with `?prefix=`, for mentions.
+
+        The users the authenticated user follows come first, then everyone
+        else; each group is in username order. Users on the other side of a
+        block are left out. The followed users are found in `user.follows`,
+        and the rest with a range scan of the `username_key` index which stops
+        after `limit` rows, so once the caches are warm, this takes a single
+        short query however many users there are.
+
+        Query parameters:
+        - `prefix`: the start of the username, ignoring case; may start with the `@`
+        - `limit`: how many users to suggest; by default, and at most, 10
+        """
+        prefix = request.query_params.get('prefix', '')
+        if prefix.startswith('@'):
+            prefix = prefix[1:]
+        if not prefix:
+            return Response(
+                {'error': 'prefix must not be empty'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = int(request.query_params.get('limit', settings.USER_COMPLETION_SIZE))
+        except ValueError:
+            limit = settings.USER_COMPLETION_SIZE
+        limit = max(1, min(limit, settings.USER_COMPLETION_SIZE))
+
+        key = username_key(prefix)
+        excluded = blocked_user_ids(request.user) | {request.user.pk}
+        followed = follows.followed_with_prefix(request.user, key, limit, exclude=excluded)
+        wanted = Q(pk__in=followed)
+        if len(followed) < limit:
+            # every key with the prefix sorts between the prefix and its successor
+            successor = key[:-1] + chr(ord(key[-1]) + 1)
+            others = Ping.filter_unblocked(
+                User.objects.filter(username_key__gte=key, username_key__lt=successor),
+                request,
+                user_field='pk',
+            ).exclude(pk__in=[request.user.pk, *followed])
+            wanted |= Q(pk__in=others.order_by('username_key').values('pk')[:limit - len(followed)])
+        users = sorted(
+            User.objects.filter(wanted).values_list('pk', 'username_key', 'username'),
+            key=lambda user: (user[0] not in followed, user[1]),
+        )
+        return Response({
+            'prefix': prefix,
+            'results': [
+                {
+                    'url': reverse('user-detail', kwargs={'username': username}, request=request),
+                    'username': username,
+                    'following': pk in followed,
+                }
+                for pk, _, username in users
+            ],
+        })
+
     @list_route(permission_classes=[IsAuthenticated], url_path='followed-by')
     def followed_by(self, request):
         """